@@ -0,0 +1,49 @@
+"""
+Cost of the metrics recorded around every model call (snippets.metrics):
+ask_model against calling the client directly, with the JSON log lines
+off and on, and the time to render /metrics/ afterwards.
+
+The model is the offline fake Gemini client answering at once, so the
+numbers are the instrumentation itself; a real call takes seconds.
+"""
+import logging
+
+from common import setup_django, summarize, timed
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from snippets.ai_review import ask_model, build_prompt, generation_config, get_client  # noqa: E402
+from snippets.metrics import logger, registry  # noqa: E402
+
+CALLS = 20000
+PROMPT = build_prompt('def add(a, b):\n    return a + b\n' * 20)
+CONTEXT = {'user': 1, 'snippet': 2, 'job': 3}
+
+
+def main():
+    with override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=0):
+        client = get_client()
+
+        def bare():
+            client.models.generate_content(model=settings.GEMINI_MODEL, contents=[PROMPT], config=generation_config())
+
+        def instrumented():
+            ask_model(client, PROMPT, context=CONTEXT)
+
+        print(f'{CALLS} calls to the fake client')
+        baseline = timed(bare, repeat=CALLS)
+        print(f'{"bare client":>16}: {summarize(baseline)}')
+        logger.setLevel(logging.WARNING)
+        print(f'{"metrics":>16}: {summarize(timed(instrumented, repeat=CALLS))}')
+        logger.setLevel(logging.INFO)
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+        print(f'{"metrics + log":>16}: {summarize(timed(instrumented, repeat=CALLS))}')
+        print(f'{"render /metrics":>16}: {summarize(timed(registry.render, repeat=1000))}, {len(registry.render())} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Stored size, write latency and read latency of snippets with the code and
+highlighted columns stored raw versus compressed, for small, medium and large
+real source files.
+"""
+import inspect
+
+from common import setup_django, summarize, test_database, timed
+
+setup_django()
+
+import django.db.models.query  # noqa: E402
+import rest_framework.serializers  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from snippets import fields  # noqa: E402
+from snippets.models import Rendering, Snippet, SnippetContent  # noqa: E402
+
+SAMPLES = [
+    ('small', inspect.getsource(django.db.models.query.Prefetch)),
+    ('medium', inspect.getsource(rest_framework.serializers)),
+    ('large', inspect.getsource(django.db.models.query) * 4),
+]
+CODECS = ['none', 'zlib'] + (['zstd'] if fields.zstd is not None else [])
+REPEAT = 50
+
+
+def stored_bytes(snippet):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT LENGTH(code) FROM snippets_snippetcontent WHERE id = %s', [snippet.content_id])
+        code = cursor.fetchone()[0]
+        cursor.execute('SELECT LENGTH(html) FROM snippets_rendering WHERE id = %s', [snippet.rendering_id])
+        return code + cursor.fetchone()[0]
+
+
+def write(snippet):
+    SnippetContent.objects.filter(pk=snippet.content_id).update(code=snippet.code)
+    Rendering.objects.filter(pk=snippet.rendering_id).update(html=snippet.highlighted)
+
+
+def read(snippet):
+    Snippet.objects.select_related('content', 'rendering').get(pk=snippet.pk)
+
+
+def main():
+    with test_database():
+        user = User.objects.create_user(username='bench', password='bench')
+        print(f'{"":>7} {"codec":>5} {"text":>10} {"stored":>10} {"ratio":>6}  write / read')
+        for label, code in SAMPLES:
+            snippet = Snippet.objects.create(owner=user, code=code, language='python')
+            text = len(snippet.code.encode()) + len(snippet.highlighted.encode())
+            for codec in CODECS:
+                with override_settings(SNIPPET_COMPRESSION_CODEC=codec):
+                    writes = timed(lambda: write(snippet), REPEAT)
+                    reads = timed(lambda: read(snippet), REPEAT)
+                    size = stored_bytes(snippet)
+                print(f'{label:>7} {codec:>5} {text / 1024:>6.1f} KiB {size / 1024:>6.1f} KiB {text / size:>5.1f}x')
+                print(f'{"":>14} write {summarize(writes)}')
+                print(f'{"":>14}  read {summarize(reads)}')
+
+
+if __name__ == '__main__':
+    main()
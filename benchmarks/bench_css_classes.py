@@ -0,0 +1,57 @@
+"""
+Stored HTML size and detail response size for inline-styled versus class-based
+highlight markup, on real source files.
+"""
+import inspect
+
+from common import setup_django, test_database
+
+setup_django()
+
+import django.db.models.query  # noqa: E402
+import rest_framework.serializers  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+from django.db.models.functions import Length  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from snippets.highlighting import get_highlight_cache  # noqa: E402
+from snippets.models import Snippet  # noqa: E402
+
+SAMPLES = [
+    ('python', 'colorful', inspect.getsource(django.db.models.query)),
+    ('python', 'monokai', inspect.getsource(rest_framework.serializers)),
+    ('css', 'friendly', open(django.__path__[0] + '/contrib/admin/static/admin/css/base.css').read()),
+    ('javascript', 'default', open(django.__path__[0] + '/contrib/admin/static/admin/js/actions.js').read()),
+]
+
+
+def measure(user, client):
+    get_highlight_cache().clear()
+    Snippet.objects.all().delete()
+    response_bytes = 0
+    for language, style, code in SAMPLES:
+        snippet = Snippet.objects.create(owner=user, code=code, language=language, style=style)
+        response_bytes += len(client.get(f'/snippets/{snippet.pk}/').content)
+    stored = Snippet.objects.aggregate(html=Sum(Length('rendering__html')), code=Sum(Length('content__code')))
+    return stored['code'], stored['html'], response_bytes
+
+
+def main():
+    with test_database():
+        user = User.objects.create_user(username='bench', password='bench')
+        client = APIClient()
+        client.force_authenticate(user)
+        code, inline_html, inline_response = measure(user, client)
+        with override_settings(HIGHLIGHT_CSS_CLASSES=True):
+            _, css_html, css_response = measure(user, client)
+        print(f'{len(SAMPLES)} source files, {code / 1024:.1f} KiB of code')
+        print(f'{"":>8} {"stored HTML":>12} {"x code":>7} {"responses":>11}')
+        print(f'{"inline":>8} {inline_html / 1024:>8.1f} KiB {inline_html / code:>6.2f}x {inline_response / 1024:>7.1f} KiB')
+        print(f'{"css":>8} {css_html / 1024:>8.1f} KiB {css_html / code:>6.2f}x {css_response / 1024:>7.1f} KiB')
+        print(f'reduction: stored {1 - css_html / inline_html:.0%}, responses {1 - css_response / inline_response:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Deduplication report on a sample dataset: pastes drawn with a Zipf-like
+popularity from a pool of real functions, as when many users paste the same
+well-known snippets. Reports the dedup ratio, stored bytes with and without
+shared content, and create latency for new versus duplicate pastes.
+"""
+import inspect
+import random
+import time
+
+from common import setup_django, summarize, test_database
+
+setup_django()
+
+import django.db.models.query  # noqa: E402
+import django.db.models.sql.query  # noqa: E402
+import rest_framework.serializers  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+
+from snippets.highlighting import get_highlight_cache  # noqa: E402
+from snippets.models import Rendering, Snippet, SnippetContent  # noqa: E402
+
+PASTES = 2000
+STYLES = ['colorful', 'monokai', 'friendly']
+
+
+def sample_pool():
+    pool = []
+    for module in (django.db.models.query, django.db.models.sql.query, rest_framework.serializers):
+        for _, obj in inspect.getmembers(module, inspect.isclass):
+            if obj.__module__ == module.__name__:
+                pool.extend(inspect.getsource(member) for member in vars(obj).values() if inspect.isfunction(member))
+    return pool
+
+
+def main():
+    pool = sample_pool()
+    rng = random.Random(0)
+    weights = [1 / rank for rank in range(1, len(pool) + 1)]
+    pastes = rng.choices(pool, weights, k=PASTES)
+    with test_database():
+        user = User.objects.create_user(username='bench', password='bench')
+        get_highlight_cache().clear()
+        new, duplicate, seen = [], [], set()
+        for code in pastes:
+            style = rng.choice(STYLES) if rng.random() < 0.2 else 'colorful'
+            start = time.perf_counter()
+            Snippet.objects.create(owner=user, code=code, language='python', style=style)
+            elapsed = time.perf_counter() - start
+            (duplicate if (code, style) in seen else new).append(elapsed)
+            seen.add((code, style))
+        print(f'{PASTES} pastes from a pool of {len(pool)} functions: {SnippetContent.objects.count()} contents, {Rendering.objects.count()} renderings')
+        print(f'      new create {summarize(new)} ({len(new)})')
+        print(f'duplicate create {summarize(duplicate)} ({len(duplicate)})')
+        call_command('gc_content', dry_run=True)
+
+
+if __name__ == '__main__':
+    main()
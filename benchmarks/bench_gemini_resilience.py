@@ -0,0 +1,77 @@
+"""
+Reviews against a misbehaving Gemini, through the real SDK and
+snippets.gemini.ResilientClient, served by the local FakeGeminiServer.
+
+* flaky: FAILURE_RATE of requests answer 503. Share of reviews that succeed
+  without and with retries.
+* brownout: every answer takes BROWNOUT_LATENCY seconds. How long REVIEWS
+  reviews in THREADS threads hold those threads with only a long per-call
+  timeout, versus a short GEMINI_CALL_TIMEOUT and the circuit breaker.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import percentile, setup_django
+
+setup_django()
+
+from django.test import override_settings  # noqa: E402
+
+from snippets.ai_review import ReviewError, get_client, review_code  # noqa: E402
+from snippets.fake_gemini import FakeGeminiServer  # noqa: E402
+
+REVIEWS = 64
+THREADS = 8
+FAILURE_RATE = 0.3
+BROWNOUT_LATENCY = 5.0
+
+
+def run(server, **settings):
+    settings = dict(GEMINI_FAKE=False, GEMINI_API_KEY='bench', GEMINI_BASE_URL=server.url, GEMINI_MODEL='gemini-bench',
+                    GEMINI_RETRY_DELAY=0.1, REVIEW_CACHE_TTL=0, **settings)
+    with override_settings(**settings):
+        get_client()
+
+        def one(i):
+            start = time.perf_counter()
+            try:
+                review_code(f'x = {i}')
+                ok = True
+            except ReviewError:
+                ok = False
+            return ok, time.perf_counter() - start
+
+        requests = server.requests
+        start = time.perf_counter()
+        with ThreadPoolExecutor(THREADS) as pool:
+            outcomes = list(pool.map(one, range(REVIEWS)))
+        elapsed = time.perf_counter() - start
+        durations = [duration for _, duration in outcomes]
+        return (sum(ok for ok, _ in outcomes), elapsed, sum(durations), percentile(durations, 50),
+                server.requests - requests, get_client().stats()['breaker']['trips'])
+
+
+def main():
+    server = FakeGeminiServer(latency=0.2, jitter=0.25, failure_rate=FAILURE_RATE)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f'flaky: {FAILURE_RATE:.0%} of requests fail with 503, {REVIEWS} reviews in {THREADS} threads')
+    for label, retries in (('no retries', 0), ('2 retries', 2)):
+        ok, elapsed, _, p50, requests, _ = run(server, GEMINI_RETRIES=retries, GEMINI_BREAKER_THRESHOLD=1000)
+        print(f'{label:>22}: {ok}/{REVIEWS} succeeded, {requests} requests, p50 {p50:.2f}s, {elapsed:.1f}s')
+
+    server.failure_rate, server.client.latency = 0.0, BROWNOUT_LATENCY
+    print(f'brownout: every answer takes {BROWNOUT_LATENCY}s, {REVIEWS} reviews in {THREADS} threads')
+    runs = (
+        ('60s call timeout', dict(GEMINI_CALL_TIMEOUT=60.0, GEMINI_RETRIES=0, GEMINI_BREAKER_THRESHOLD=1000)),
+        ('1s timeout + breaker', dict(GEMINI_CALL_TIMEOUT=1.0, GEMINI_RETRIES=2, GEMINI_BREAKER_THRESHOLD=5)),
+    )
+    for label, settings in runs:
+        ok, elapsed, held, p50, requests, trips = run(server, **settings)
+        print(f'{label:>22}: {ok}/{REVIEWS} succeeded, threads held {held:.1f}s in total, '
+              f'p50 {p50:.2f}s, {elapsed:.1f}s, {requests} requests, breaker trips {trips}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
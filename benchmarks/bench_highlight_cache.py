@@ -0,0 +1,49 @@
+"""
+Snippet create throughput with and without the highlight cache at different
+duplicate rates.
+"""
+import random
+import time
+
+from common import setup_django, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from snippets.highlighting import get_highlight_cache  # noqa: E402
+from snippets.models import Snippet  # noqa: E402
+
+SAMPLE = open(__file__.replace('bench_highlight_cache.py', 'common.py')).read() * 4
+CREATES = 300
+DUPLICATE_RATES = [0.0, 0.25, 0.5, 0.9]
+
+
+def run(user, duplicate_rate, seed=0):
+    rng = random.Random(seed)
+    pool = [f'{SAMPLE}\n# variant {i}\n' for i in range(5)]
+    get_highlight_cache().clear()
+    start = time.perf_counter()
+    for i in range(CREATES):
+        code = rng.choice(pool) if rng.random() < duplicate_rate else f'{SAMPLE}\n# unique {i} {rng.random()}\n'
+        Snippet.objects.create(owner=user, code=code, language='python')
+    elapsed = time.perf_counter() - start
+    return CREATES / elapsed, get_highlight_cache().stats()
+
+
+def main():
+    with test_database():
+        user = User.objects.create_user(username='bench', password='bench')
+        print(f'{CREATES} creates of a {len(SAMPLE.splitlines())}-line Python file')
+        print(f'{"dup rate":>8} {"no cache":>12} {"cache":>12} {"speedup":>8}  hits/misses/evictions')
+        for rate in DUPLICATE_RATES:
+            with override_settings(HIGHLIGHT_CACHE_SIZE=0):
+                baseline, _ = run(user, rate)
+            cached, stats = run(user, rate)
+            print(f'{rate:>8.0%} {baseline:>9.1f}/s {cached:>9.1f}/s {cached / baseline:>7.2f}x  '
+                  f'{stats["hits"]}/{stats["misses"]}/{stats["evictions"]}')
+
+
+if __name__ == '__main__':
+    main()
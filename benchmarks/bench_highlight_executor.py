@@ -0,0 +1,96 @@
+"""
+Small-read latency while large pastes are being created concurrently, with
+highlighting inline in the request thread versus on the process pool.
+
+Writer threads create large unique snippets at a fixed rate while reader
+threads fetch a small, already rendered snippet. Inline, every read queues
+behind Pygments for the GIL; with workers the render runs in another process
+and reads stay fast, given spare cores for the workers. Runs against a
+file-backed test database so threads can share it.
+"""
+import os
+import threading
+import time
+
+from common import setup_django, summarize, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from snippets.executor import get_highlight_executor  # noqa: E402
+from snippets.highlighting import get_highlight_cache  # noqa: E402
+from snippets.models import Snippet  # noqa: E402
+
+DURATION = 10.0
+WRITERS = 2
+READERS = 4
+LARGE_LINES = 4000
+CREATE_INTERVAL = 1.0
+LINE = 'result = compute_value(alpha, beta, gamma)  # some trailing comment\n'
+
+
+def writer(user, stop, latencies, counter):
+    client = APIClient()
+    client.force_authenticate(user)
+    while not stop.is_set():
+        code = f'# {threading.get_ident()} {next(counter)}\n' + LINE * LARGE_LINES
+        start = time.perf_counter()
+        response = client.post('/snippets/raw/?language=python', code.encode(), content_type='text/plain')
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 201, response.content[:200]
+        stop.wait(max(0.0, CREATE_INTERVAL - latencies[-1]))
+    connection.close()
+
+
+def reader(user, url, stop, latencies):
+    client = APIClient()
+    client.force_authenticate(user)
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.content[:200]
+    connection.close()
+
+
+def run(user, url):
+    stop = threading.Event()
+    reads, creates = [], []
+    counter = iter(range(10 ** 9))
+    threads = [threading.Thread(target=writer, args=(user, stop, creates, counter)) for _ in range(WRITERS)]
+    threads += [threading.Thread(target=reader, args=(user, url, stop, reads)) for _ in range(READERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return reads, creates
+
+
+def main():
+    # In-memory sqlite is per connection; threads need a real file.
+    connection.settings_dict['TEST']['NAME'] = '/tmp/bench_highlight_executor.sqlite3'
+    with test_database():
+        user = User.objects.create_user(username='bench', password='bench')
+        small = Snippet.objects.create(owner=user, code='print("hello")\n', language='python')
+        url = f'/snippets/{small.pk}/'
+        print(f'{os.cpu_count()} CPU(s), {WRITERS} writers, {READERS} readers')
+        for workers in (0, 2):
+            with override_settings(HIGHLIGHT_WORKERS=workers, HIGHLIGHT_QUEUE_SIZE=WRITERS, HIGHLIGHT_DEFERRED=False):
+                get_highlight_cache().clear()
+                if workers:
+                    # Start the worker processes before the clock runs.
+                    get_highlight_executor().run('warmup', sum, range(10))
+                reads, creates = run(user, url)
+            print(f'HIGHLIGHT_WORKERS={workers}')
+            print(f'   small read {summarize(reads)} ({len(reads)} in {DURATION:.0f}s)')
+            print(f'  large create {summarize(creates)} ({len(creates)} in {DURATION:.0f}s)')
+
+
+if __name__ == '__main__':
+    main()
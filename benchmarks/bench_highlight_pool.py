@@ -0,0 +1,49 @@
+"""
+Per-render and per-save overhead for small snippets with fresh lexer/formatter
+instances versus the pooled ones. The highlight cache is disabled so every
+call really renders.
+"""
+from common import setup_django, summarize, test_database, timed
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from pygments import highlight  # noqa: E402
+from pygments.lexers import get_lexer_by_name  # noqa: E402
+
+from snippets.highlighting import formatter_pool, lexer_pool, make_formatter, render_highlight  # noqa: E402
+from snippets.models import Snippet  # noqa: E402
+
+CODE = 'def greet(name):\n    return f"hello {name}"\n'
+REPEAT = 2000
+CASES = [('python', 'colorful', False), ('javascript', 'monokai', True), ('rust', 'friendly', False)]
+
+
+def fresh():
+    for language, style, linenos in CASES:
+        highlight(CODE, get_lexer_by_name(language), make_formatter(style, linenos, 'inline'))
+
+
+def pooled():
+    for language, style, linenos in CASES:
+        render_highlight(CODE, language, style, linenos)
+
+
+def main():
+    with override_settings(HIGHLIGHT_CACHE_SIZE=0):
+        pooled()
+        print(f'render of a 2-line snippet, {len(CASES)} option sets per sample, {REPEAT} samples')
+        print(f'  fresh instances: {summarize(timed(fresh, REPEAT))}')
+        print(f'  pooled:          {summarize(timed(pooled, REPEAT))}')
+        with test_database():
+            user = User.objects.create_user(username='bench', password='bench')
+            snippet = Snippet.objects.create(owner=user, code=CODE)
+            print(f'  Snippet.save(), pooled:  {summarize(timed(snippet.save, REPEAT))}')
+            # A pool that keeps no idle instances behaves like the old per-save construction.
+            lexer_pool.max_idle = formatter_pool.max_idle = 0
+            print(f'  Snippet.save(), fresh:   {summarize(timed(snippet.save, REPEAT))}')
+
+
+if __name__ == '__main__':
+    main()
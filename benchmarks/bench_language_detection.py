@@ -0,0 +1,106 @@
+"""
+Latency and accuracy of language='auto' detection over a labeled sample set,
+against Pygments' guess_lexer on the full text.
+
+Samples are source files found on this machine, labeled by extension: the
+Python installation (stdlib, headers, site-packages) and the project tree,
+plus any directories given on the command line, e.g.
+`python benchmarks/bench_language_detection.py ~/src/some-go-project`.
+"""
+import collections
+import random
+import sys
+import sysconfig
+import time
+from pathlib import Path
+
+from common import percentile, setup_django, summarize
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from pygments.lexers import guess_lexer  # noqa: E402
+from pygments.util import ClassNotFound  # noqa: E402
+
+from snippets.detection import detect_language, get_detection_cache  # noqa: E402
+
+PER_LANGUAGE = 25
+MAX_FILE_BYTES = 200 * 1024
+LABELS = {
+    '.py': 'python', '.js': 'javascript', '.ts': 'typescript', '.java': 'java', '.c': 'c', '.h': 'c', '.cc': 'cpp',
+    '.cpp': 'cpp', '.hpp': 'cpp', '.html': 'html', '.css': 'css', '.sql': 'sql', '.php': 'php', '.rb': 'ruby', '.go': 'go',
+    '.rs': 'rust', '.swift': 'swift', '.kt': 'kotlin', '.sh': 'bash', '.json': 'json', '.yml': 'yaml', '.yaml': 'yaml',
+    '.md': 'markdown',
+}
+
+
+def sample_set(roots):
+    found = collections.defaultdict(list)
+    for root in roots:
+        for path in Path(root).rglob('*'):
+            language = LABELS.get(path.suffix)
+            if language is None or '.min.' in path.name or path.name.endswith('.d.ts') or 'node_modules' in path.parts:
+                continue
+            try:
+                if 1024 < path.stat().st_size < MAX_FILE_BYTES:
+                    found[language].append(path)
+            except OSError:
+                continue
+    rng = random.Random(0)
+    samples = []
+    for language, paths in sorted(found.items()):
+        rng.shuffle(paths)
+        for path in paths[:PER_LANGUAGE]:
+            try:
+                samples.append((language, path.name, path.read_text()))
+            except (OSError, UnicodeDecodeError):
+                continue
+    return samples
+
+
+def guess(code):
+    try:
+        return guess_lexer(code).aliases[0]
+    except ClassNotFound:
+        return 'text'
+
+
+def measure(label, samples, detect):
+    durations, correct, per_language = [], 0, collections.Counter()
+    for language, filename, code in samples:
+        start = time.perf_counter()
+        detected = detect(code, filename)
+        durations.append(time.perf_counter() - start)
+        correct += detected == language
+        per_language[language] += detected == language
+    print(f'{label:>28}: accuracy {correct / len(samples):6.1%}  {summarize(durations)}')
+    return per_language
+
+
+def main():
+    roots = [sysconfig.get_paths()['stdlib'], sysconfig.get_paths()['include'], sysconfig.get_paths()['purelib'],
+             Path(__file__).resolve().parent.parent, *sys.argv[1:]]
+    samples = sample_set(roots)
+    counts = collections.Counter(language for language, _, _ in samples)
+    print(f'{len(samples)} samples: ' + ', '.join(f'{language} {count}' for language, count in sorted(counts.items())))
+    print(f'sample {settings.LANGUAGE_DETECTION_SAMPLE} chars, {len(settings.LANGUAGE_DETECTION_CANDIDATES)} candidates')
+
+    def cold(code, filename):
+        get_detection_cache().clear()
+        return detect_language(code)
+
+    per_language = measure('detect (content only)', samples, cold)
+    for _, _, code in samples:
+        detect_language(code)
+    measure('detect (memoized)', samples, lambda code, filename: detect_language(code))
+    measure('detect (title as filename)', samples, lambda code, filename: (get_detection_cache().clear(), detect_language(code, filename))[1])
+    guessed = measure('pygments guess_lexer', samples, lambda code, filename: guess(code))
+    print('per language (detect / guess_lexer):')
+    for language in sorted(counts):
+        print(f'  {language:>10}: {per_language[language]:>2}/{counts[language]}  {guessed[language]:>2}/{counts[language]}')
+    sizes = [len(code) for _, _, code in samples]
+    print(f'sample file size p50 {percentile(sizes, 50) / 1024:.1f} KiB, max {max(sizes) / 1024:.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
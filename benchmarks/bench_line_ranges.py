@@ -0,0 +1,61 @@
+"""
+Latency, time to first byte and peak Python memory of the highlight action
+for a multi-megabyte paste: whole document, ?stream=1 and ?lines=START-END.
+"""
+import time
+import tracemalloc
+
+from common import setup_django, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from snippets.models import Snippet  # noqa: E402
+
+LINES = 60000
+CODE = ''.join(f'2024-05-01T12:{i % 60:02d}:00Z INFO worker-{i % 8} handled request id={i} status=200 in {i % 97}ms\n' for i in range(LINES))
+
+
+def fetch(client, url, params):
+    start = time.perf_counter()
+    response = client.get(url, params)
+    if response.streaming:
+        chunks = iter(response.streaming_content)
+        size = len(next(chunks))
+        first_byte = time.perf_counter() - start
+        size += sum(len(chunk) for chunk in chunks)
+    else:
+        size = len(response.content)
+        first_byte = time.perf_counter() - start
+    return first_byte, time.perf_counter() - start, size
+
+
+def measure(client, url, params):
+    """Warm the database cache, time a request, then repeat it under tracemalloc for peak memory."""
+    fetch(client, url, params)
+    first_byte, total, size = fetch(client, url, params)
+    tracemalloc.start()
+    fetch(client, url, params)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first_byte, total, peak, size
+
+
+def main():
+    with test_database():
+        user = User.objects.create_user(username='bench', password='bench')
+        snippet = Snippet.objects.create(owner=user, code=CODE, language='text', linenos=True)
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f'/snippets/{snippet.pk}/highlight/'
+        print(f'{LINES} lines, {len(CODE) / 1e6:.1f} MB code, {len(snippet.highlighted) / 1e6:.1f} MB stored HTML')
+        for label, params in [('whole', {}), ('stream', {'stream': '1'}), ('lines', {'lines': '30000-30100'})]:
+            first_byte, total, peak, size = measure(client, url, params)
+            print(f'{label:>8}: ttfb {first_byte * 1000:7.1f}ms  total {total * 1000:7.1f}ms  '
+                  f'peak {peak / 1e6:6.1f} MB  body {size / 1e6:6.2f} MB')
+
+
+if __name__ == '__main__':
+    main()
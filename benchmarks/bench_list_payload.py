@@ -0,0 +1,49 @@
+"""
+Payload size and latency of GET /snippets/ for a user with hundreds of large
+snippets: the compact default list versus the full representation.
+"""
+import time
+
+from common import setup_django, summarize, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from snippets.models import Snippet  # noqa: E402
+
+SNIPPETS = 300
+SAMPLE = open(__file__).read() * 12
+FULL_FIELDS = 'url,id,title,code,linenos,language,style,owner,highlight,uuid,shared_password'
+
+
+def crawl(client, params):
+    """Fetch every page of the list; return (total bytes, per-page latencies)."""
+    total, latencies, page = 0, [], 1
+    while True:
+        start = time.perf_counter()
+        response = client.get('/snippets/', {**params, 'page': page})
+        latencies.append(time.perf_counter() - start)
+        total += len(response.content)
+        if not response.data['next']:
+            return total, latencies
+        page += 1
+
+
+def main():
+    with test_database():
+        user = User.objects.create_user(username='bench', password='bench')
+        for i in range(SNIPPETS):
+            Snippet.objects.create(owner=user, title=f'Snippet {i}', code=f'# {i}\n{SAMPLE}', language='python')
+        client = APIClient()
+        client.force_authenticate(user)
+        print(f'{SNIPPETS} snippets of {len(SAMPLE) // 1024} KiB code each, all pages of /snippets/')
+        for label, params in [('full', {'fields': FULL_FIELDS}), ('compact', {})]:
+            crawl(client, params)  # warm up
+            size, latencies = crawl(client, params)
+            print(f'{label:>8}: {size / 1024:>9.1f} KiB  per page {summarize(latencies)}')
+
+
+if __name__ == '__main__':
+    main()
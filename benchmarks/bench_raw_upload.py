@@ -0,0 +1,60 @@
+"""
+Peak Python memory while creating a large snippet through the JSON endpoint
+versus the raw text/plain upload endpoint, with highlighting deferred (request
+handling only) and inline (including the render).
+
+The JSON endpoint echoes code and highlight back, so it is also measured with
+?fields=id to separate request handling from the response.
+"""
+import json
+import tracemalloc
+
+from common import setup_django, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+SIZES_MB = [1, 2, 4]
+LINE = 'result = compute_value(alpha, beta, gamma)  # some trailing comment\n'
+
+
+def peak(post):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    response = post()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    assert response.status_code == 201, response.content[:200]
+    return peak
+
+
+def main():
+    with test_database(), override_settings(SNIPPET_MAX_UPLOAD_BYTES=64 * 1024 * 1024, DATA_UPLOAD_MAX_MEMORY_SIZE=None):
+        user = User.objects.create_user(username='bench', password='bench')
+        client = APIClient()
+        client.force_authenticate(user)
+        for deferred in (True, False):
+            print('deferred highlighting' if deferred else 'highlighting on save')
+            with override_settings(HIGHLIGHT_DEFERRED=deferred):
+                for size in SIZES_MB:
+                    for variant in ('json', 'json?fields=id', 'raw'):
+                        # Unique code per run so deduplication does not skip the work.
+                        code = f'# {variant} {size} {deferred}\n' + LINE * (size * 1024 * 1024 // len(LINE))
+                        if variant.startswith('json'):
+                            body = json.dumps({'code': code, 'language': 'python'}).encode()
+                            url = '/snippets/' + variant[4:]
+                            post = lambda: client.post(url, body, content_type='application/json')  # noqa: E731
+                        else:
+                            body = code.encode()
+                            post = lambda: client.post('/snippets/raw/?language=python', body, content_type='text/plain')  # noqa: E731
+                        del code
+                        result = peak(post)
+                        print(f'  {size:>2} MB {variant:>14}: peak {result / 1024 / 1024:>6.1f} MiB ({result / len(body):.1f}x body)')
+
+
+if __name__ == '__main__':
+    main()
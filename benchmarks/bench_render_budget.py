@@ -0,0 +1,51 @@
+"""
+Create latency on a corpus of worst-case inputs with the render budget
+(HIGHLIGHT_MAX_BYTES / _LINES / _SECONDS) in force and with it lifted.
+
+Each case is made unique per create so neither content deduplication nor the
+highlight cache hides the render.
+"""
+from common import percentile, setup_django, test_database, timed
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from snippets.models import Snippet  # noqa: E402
+
+REPEAT = 3
+CORPUS = {
+    'minified js, one 1.5 MB line': ('javascript', 'var a=function(b,c){return b+c*2-"s"};' * 40000),
+    'dense python, 1.9 MB': ('python', 'x=(a+b)*c-[d,e,{f:g}]\n' * 85000),
+    'nested html, 1.4 MB': ('html', '<div class="a" id="b"><span data-x="1">t</span>' * 30000),
+    'unterminated docstring, 1 MB': ('python', '"""' + 'abc "" \\" ' * 100000),
+    '120k short lines': ('python', 'x = 1\n' * 120000),
+    '3 MB of comments': ('python', '# ' + 'comment ' * 390000),
+}
+UNBOUNDED = {'HIGHLIGHT_MAX_BYTES': None, 'HIGHLIGHT_MAX_LINES': None, 'HIGHLIGHT_MAX_SECONDS': None}
+
+
+def main():
+    with test_database(), override_settings(HIGHLIGHT_DEFERRED=False):
+        user = User.objects.create_user(username='bench', password='bench')
+        counter = iter(range(10 ** 6))
+        budget = f'{settings.HIGHLIGHT_MAX_BYTES} bytes, {settings.HIGHLIGHT_MAX_LINES} lines, {settings.HIGHLIGHT_MAX_SECONDS}s'
+        for label, limits in ((f'budget ({budget})', {}), ('unbounded', UNBOUNDED)):
+            print(label)
+            everything = []
+            with override_settings(**limits):
+                for name, (language, code) in CORPUS.items():
+                    def create():
+                        snippet = Snippet.objects.create(owner=user, code=f'{code}\n# {next(counter)}', language=language)
+                        outcomes.append(snippet.highlight_outcome)
+                    outcomes = []
+                    durations = timed(create, repeat=REPEAT if not limits else 1)
+                    everything += durations
+                    print(f'  {name:>30}: max {max(durations):>6.2f}s ({outcomes[0]})')
+            print(f'  {"p99 create":>30}: {percentile(everything, 99):>6.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Concurrent review throughput of the sync review path under WSGI versus the
+native async views under ASGI, against the offline fake Gemini client.
+
+WSGI is modelled as WSGI_THREADS request threads (startup.sh runs 2 Gunicorn
+workers x 4 threads), each holding its thread while the review runs. ASGI
+sends every request at once through Django's ASGI handler in one event loop.
+The stored review cache is off, so every request waits on the fake model.
+
+REVIEW_CONCURRENCY is raised from its default of 4 to REVIEWS, so that all
+reviews can be in flight at once; a last run keeps the default, where the
+requests queue for the 4 slots. However many requests the event loop holds,
+throughput is capped at REVIEW_CONCURRENCY / FAKE_LATENCY reviews per
+second: 4/s with the default, which is what that run measures.
+
+REVIEW_WORKERS is 0, so each request awaits its review inline and answers
+with the finished job, giving its full latency; with workers the 202 comes
+back at once and the job runs on as an event loop task.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import percentile, setup_django, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import AsyncClient, Client, override_settings  # noqa: E402
+from django.urls import include, path  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from snippets.models import ReviewJob, Snippet  # noqa: E402
+from snippets.urls import async_review_urls  # noqa: E402
+
+REVIEWS = 200
+WSGI_THREADS = 8
+FAKE_LATENCY = 1.0
+DEFAULT_CONCURRENCY = 4
+# What snippets.urls serves with REVIEW_ASYNC on.
+urlpatterns = [*async_review_urls, path('', include('snippets.urls'))]
+
+
+def wsgi(url, headers):
+    def one(_):
+        start = time.perf_counter()
+        response = Client(headers=headers).post(url)
+        assert response.status_code == 202 and response.json()['status'] == 'done', response.content[:200]
+        connection.close()
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(WSGI_THREADS) as pool:
+        return list(pool.map(one, range(REVIEWS)))
+
+
+async def asgi(url, headers):
+    client = AsyncClient()
+
+    async def one():
+        start = time.perf_counter()
+        response = await client.post(url, headers=headers)
+        assert response.status_code == 202 and response.json()['status'] == 'done', response.content[:200]
+        return time.perf_counter() - start
+
+    return await asyncio.gather(*(one() for _ in range(REVIEWS)))
+
+
+def main():
+    # In-memory sqlite is per connection; threads need a real file.
+    connection.settings_dict['TEST']['NAME'] = '/tmp/bench_review_asgi.sqlite3'
+    settings = dict(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=FAKE_LATENCY, REVIEW_WORKERS=0, REVIEW_CACHE_TTL=0)
+    with test_database(), override_settings(**settings):
+        user = User.objects.create_user(username='bench', password='bench')
+        headers = {'Authorization': f'Token {Token.objects.create(user=user).key}'}
+        snippet = Snippet.objects.create(owner=user, code='def add(a, b):\n    return a + b\n')
+        url = f'/snippets/{snippet.pk}/review/'
+        print(f'{REVIEWS} concurrent reviews, fake Gemini {FAKE_LATENCY}s')
+        runs = (
+            ('WSGI', REVIEWS, lambda: wsgi(url, headers)),
+            ('ASGI', REVIEWS, lambda: asyncio.run(asgi(url, headers))),
+            ('ASGI', DEFAULT_CONCURRENCY, lambda: asyncio.run(asgi(url, headers))),
+        )
+        for label, concurrency, run in runs:
+            ReviewJob.objects.all().delete()
+            urls = __name__ if label == 'ASGI' else 'config.urls'
+            with override_settings(ROOT_URLCONF=urls, REVIEW_CONCURRENCY=concurrency):
+                start = time.perf_counter()
+                latencies = run()
+                elapsed = time.perf_counter() - start
+            print(f'{label}, REVIEW_CONCURRENCY={concurrency}: {REVIEWS / elapsed:6.1f} reviews/s, all done in {elapsed:5.1f}s, '
+                  f'latency p50={percentile(latencies, 50):.2f}s p99={percentile(latencies, 99):.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Reviewing many snippets: one POST /snippets/{id}/review/ per snippet
+against a single POST /snippets/review/ batch, with a quarter of the
+snippets sharing code with another.
+
+Runs against a throwaway test database. The offline fake Gemini client
+answers after FAKE_LATENCY seconds. The batch is reviewed by
+REVIEW_BATCH_WORKERS threads at most REVIEW_BATCH_RATE starts a second;
+the time to the first NDJSON line is reported too.
+"""
+import time
+
+from common import setup_django, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from snippets.ai_review import get_client  # noqa: E402
+from snippets.models import Snippet  # noqa: E402
+
+FAKE_LATENCY = 0.5
+SNIPPETS = 24
+SETTINGS = ((4, 0), (4, 4.0), (8, 0))
+
+
+def snippets(owner):
+    # Every fourth snippet repeats the code of the one before it.
+    return [
+        Snippet.objects.create(owner=owner, code=f'def f(x):\n    return x + {i - (i % 4 == 3)}\n', language='python')
+        for i in range(SNIPPETS)
+    ]
+
+
+def main():
+    print(f'{SNIPPETS} snippets, fake Gemini {FAKE_LATENCY}s')
+    settings = dict(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=FAKE_LATENCY, REVIEW_CACHE_TTL=0, REVIEW_WORKERS=0)
+    with test_database(), override_settings(**settings):
+        owner = User.objects.create_user(username='owner', password='owner')
+        client = APIClient()
+        client.force_authenticate(owner)
+        fake = get_client()
+
+        calls = fake.calls
+        start = time.perf_counter()
+        for snippet in snippets(owner):
+            assert client.post(f'/snippets/{snippet.pk}/review/').data['status'] == 'done'
+        print(f'{"one by one":>22}: {time.perf_counter() - start:5.2f}s, {fake.calls - calls} calls')
+
+        for workers, rate in SETTINGS:
+            ids = [snippet.pk for snippet in snippets(owner)]
+            calls = fake.calls
+            with override_settings(REVIEW_BATCH_WORKERS=workers, REVIEW_BATCH_RATE=rate):
+                start = time.perf_counter()
+                lines = iter(client.post('/snippets/review/', {'ids': ids}, format='json').streaming_content)
+                next(lines)
+                first = time.perf_counter() - start
+                rest = b''.join(lines)
+                elapsed = time.perf_counter() - start
+            assert b'"failed": 0' in rest.splitlines()[-1], rest.splitlines()[-1]
+            label = f'batch, {workers} workers, {rate or "no"} rate'
+            print(f'{label:>22}: {elapsed:5.2f}s, {fake.calls - calls} calls, first line {first:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Latency of repeated review requests for one shared snippet, as when many
+share viewers press the review button, with the stored review cache on and
+off (REVIEW_CACHE_TTL=0).
+
+Reviews run inline (REVIEW_WORKERS=0) so each request's latency includes
+the model call when there is one; the model is the offline fake Gemini
+client answering after FAKE_LATENCY seconds.
+"""
+from common import setup_django, summarize, test_database, timed
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from snippets.ai_review import get_client, get_review_cache  # noqa: E402
+from snippets.models import Snippet  # noqa: E402
+
+FAKE_LATENCY = 2.0
+REQUESTS = 50
+
+
+def main():
+    with test_database(), override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=FAKE_LATENCY, REVIEW_WORKERS=0):
+        owner = User.objects.create_user(username='owner', password='owner')
+        viewer = User.objects.create_user(username='viewer', password='viewer')
+        snippet = Snippet.objects.create(owner=owner, code='def add(a, b):\n    return a + b\n' * 200, shared_password='secret')
+        client = APIClient()
+        client.force_authenticate(viewer)
+        url = f'/snippets/shared/{snippet.uuid}/review/'
+
+        def review():
+            response = client.post(url, {'password': 'secret'}, format='json')
+            assert response.status_code == 202 and response.data['status'] == 'done', response.data
+
+        print(f'fake Gemini {FAKE_LATENCY}s, {REQUESTS} review requests for one shared snippet')
+        for label, ttl, repeat in (('cache off', 0, 5), ('cache on', 7 * 24 * 3600, REQUESTS)):
+            with override_settings(REVIEW_CACHE_TTL=ttl):
+                calls = get_client().calls
+                first = timed(review)
+                rest = timed(review, repeat=repeat - 1)
+                stats = get_review_cache().stats()
+            print(f'{label:>10}: first {first[0] * 1000:.0f}ms, then {summarize(rest)}; '
+                  f'{get_client().calls - calls} model call(s), hits={stats["hits"]} misses={stats["misses"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Time to review one large file in a single prompt versus in chunks reviewed
+concurrently and then merged (REVIEW_TOKEN_BUDGET, REVIEW_CHUNK_WORKERS).
+
+The offline fake Gemini client answers after FAKE_LATENCY seconds plus
+TOKEN_LATENCY seconds per prompt token, as a model's time grows with the
+input it has to read. Also reports the largest prompt sent, which is what
+runs into the model's context limit.
+"""
+import time
+
+from common import setup_django
+
+setup_django()
+
+from django.test import override_settings  # noqa: E402
+
+from snippets.ai_review import get_client, review_code  # noqa: E402
+from snippets.chunking import estimate_tokens, split_code  # noqa: E402
+
+FAKE_LATENCY = 1.0
+TOKEN_LATENCY = 0.0001
+FUNCTIONS = 1500
+CODE = ''.join(
+    f'def handler_{i}(request, value):\n    """Handle case {i}."""\n'
+    f'    if value > {i}:\n        return request.respond(value - {i})\n    return None\n\n\n'
+    for i in range(FUNCTIONS)
+)
+
+
+def main():
+    print(f'{CODE.count(chr(10))} lines, ~{estimate_tokens(CODE)} tokens; fake Gemini {FAKE_LATENCY}s + {TOKEN_LATENCY * 1000:.1f}s per 1k prompt tokens')
+    runs = (('single prompt', 0, 1), ('chunked, 4 workers', 8000, 4), ('chunked, 8 workers', 8000, 8))
+    for label, budget, workers in runs:
+        settings = dict(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=FAKE_LATENCY, REVIEW_CACHE_TTL=0, REVIEW_TOKEN_BUDGET=budget, REVIEW_CHUNK_WORKERS=workers)
+        with override_settings(**settings):
+            client = get_client()
+            client.token_latency = TOKEN_LATENCY
+            start = time.perf_counter()
+            review_code(CODE, language='python')
+            elapsed = time.perf_counter() - start
+            largest = max(estimate_tokens(chunk.code) for chunk in split_code(CODE, 'python', budget))
+        print(f'{label:>20}: {elapsed:5.2f}s, {client.calls} model call(s), largest code part ~{largest} tokens')
+
+
+if __name__ == '__main__':
+    main()
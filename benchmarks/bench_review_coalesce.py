@@ -0,0 +1,62 @@
+"""
+Model calls and latency when a burst of viewers presses review on one shared
+snippet at the same moment, before any review of it is stored.
+
+BURST requests are sent together from as many threads, as Gunicorn threads
+would run them; reviews run inline (REVIEW_WORKERS=0) and the model is the
+offline fake Gemini client answering after FAKE_LATENCY seconds.
+"""
+import threading
+import time
+
+from common import setup_django, summarize, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from rest_framework.authtoken.models import Token  # noqa: E402
+
+from snippets.ai_review import get_client  # noqa: E402
+from snippets.models import Snippet  # noqa: E402
+
+FAKE_LATENCY = 1.0
+BURST = 32
+ROUNDS = 3
+
+
+def main():
+    # In-memory sqlite is per connection; threads need a real file.
+    connection.settings_dict['TEST']['NAME'] = '/tmp/bench_review_coalesce.sqlite3'
+    settings = dict(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=FAKE_LATENCY, REVIEW_WORKERS=0, REVIEW_CONCURRENCY=BURST)
+    with test_database(), override_settings(**settings):
+        owner = User.objects.create_user(username='owner', password='owner')
+        viewer = User.objects.create_user(username='viewer', password='viewer')
+        headers = {'Authorization': f'Token {Token.objects.create(user=viewer).key}'}
+        print(f'fake Gemini {FAKE_LATENCY}s, bursts of {BURST} review requests for one shared snippet')
+        for round in range(ROUNDS):
+            snippet = Snippet.objects.create(owner=owner, code=f'def add(a, b):\n    return a + b  # {round}\n', shared_password='secret')
+            url = f'/snippets/shared/{snippet.uuid}/review/'
+            start_line = threading.Barrier(BURST)
+            latencies = []
+
+            def review():
+                start_line.wait()
+                start = time.perf_counter()
+                response = Client(headers=headers).post(url, {'password': 'secret'}, content_type='application/json')
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 202 and response.json()['status'] == 'done', response.content[:200]
+                connection.close()
+
+            calls = get_client().calls
+            threads = [threading.Thread(target=review) for _ in range(BURST)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            print(f'round {round + 1}: {get_client().calls - calls} model call(s), {summarize(latencies)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Review after a one-line edit: the whole snippet reviewed again (full=true)
+against the snippet's last review updated from a diff of the edit.
+
+Runs the review jobs against a throwaway test database. The offline fake
+Gemini client answers after FAKE_LATENCY seconds plus TOKEN_LATENCY seconds
+per prompt token, as a model's time grows with the input it has to read.
+Reports the tokens of the prompt sent for the second review and the time
+to compute the diff.
+"""
+import time
+
+from common import setup_django, summarize, test_database, timed
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from snippets.ai_review import get_client  # noqa: E402
+from snippets.chunking import estimate_tokens  # noqa: E402
+from snippets.diffing import review_diff  # noqa: E402
+from snippets.models import Snippet  # noqa: E402
+
+FAKE_LATENCY = 1.0
+TOKEN_LATENCY = 0.0001
+SIZES = (100, 1500)
+
+
+def handlers(count):
+    return ''.join(
+        f'def handler_{i}(request, value):\n    """Handle case {i}."""\n'
+        f'    if value > {i}:\n        return request.respond(value - {i})\n    return None\n\n\n'
+        for i in range(count)
+    )
+
+
+def main():
+    print(f'fake Gemini {FAKE_LATENCY}s + {TOKEN_LATENCY * 1000:.1f}s per 1k prompt tokens')
+    settings = dict(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=FAKE_LATENCY, REVIEW_CACHE_TTL=0, REVIEW_WORKERS=0)
+    with test_database(), override_settings(**settings):
+        owner = User.objects.create_user(username='owner', password='owner')
+        client = APIClient()
+        client.force_authenticate(owner)
+        fake = get_client()
+        fake.token_latency = TOKEN_LATENCY
+        prompts = []
+        generate = fake.models.generate_content
+
+        def recording(model, contents, config=None):
+            prompts.append(contents[0])
+            return generate(model, contents, config)
+
+        fake.models.generate_content = recording
+        for count in SIZES:
+            code = handlers(count)
+            edited = code.replace('return request.respond(value - 7)\n', 'return request.respond(value + 7)\n')
+            for label, data in (('full review', {'full': 'true'}), ('diff update', {})):
+                snippet = Snippet.objects.create(owner=owner, code=code, language='python')
+                url = f'/snippets/{snippet.pk}/review/'
+                client.post(url, {'full': 'true'})
+                snippet.code = edited
+                snippet.save()
+                del prompts[:]
+                start = time.perf_counter()
+                response = client.post(url, data)
+                elapsed = time.perf_counter() - start
+                assert response.data['status'] == 'done', response.data
+                tokens = sum(estimate_tokens(prompt) for prompt in prompts)
+                print(f'{count * 7:>6} lines, {label}: {elapsed:5.2f}s, {len(prompts)} call(s), ~{tokens} prompt tokens, '
+                      f'incremental={response.data["incremental"]}')
+            review = response.data['review']
+            print(f'{"":>6}        diff: {summarize(timed(lambda: review_diff(code, edited, review, 5), repeat=20))}')
+
+
+if __name__ == '__main__':
+    main()
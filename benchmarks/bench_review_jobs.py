@@ -0,0 +1,84 @@
+"""
+API responsiveness during a burst of AI reviews, with reviews made inside the
+request (REVIEW_WORKERS=0, the old behaviour) versus as background jobs.
+
+A pool of REQUEST_WORKERS threads stands in for Gunicorn's sync workers.
+A burst of small snippet reads with review requests mixed in arrives at
+once, and each request's latency counts its wait for a free worker. Reviews
+use the offline fake Gemini client (GEMINI_FAKE), so no network or API key
+is needed. Runs against a file-backed test database so threads can share it.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import setup_django, summarize, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from snippets.models import ReviewJob, ReviewStatus, Snippet  # noqa: E402
+from snippets.reviews import get_review_queue  # noqa: E402
+
+REQUEST_WORKERS = 2
+READS = 60
+REVIEWS = 8
+FAKE_LATENCY = 2.0
+local = threading.local()
+
+
+def request(user, method, url):
+    if not hasattr(local, 'client'):
+        local.client = APIClient()
+        local.client.force_authenticate(user)
+    response = getattr(local.client, method)(url)
+    assert response.status_code in (200, 202), response.content[:200]
+    return response
+
+
+def burst(user, snippet):
+    read_url, review_url = f'/snippets/{snippet.pk}/', f'/snippets/{snippet.pk}/review/'
+    plan = ['get'] * READS
+    for index in range(REVIEWS):
+        plan.insert(index * len(plan) // REVIEWS, 'post')
+    reads, reviews = [], []
+    start = time.perf_counter()
+
+    def one(method):
+        request(user, method, review_url if method == 'post' else read_url)
+        (reviews if method == 'post' else reads).append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(REQUEST_WORKERS) as pool:
+        list(pool.map(one, plan))
+    # Background jobs keep going after their 202; wait for the last one.
+    while ReviewJob.objects.exclude(status__in=ReviewJob.FINISHED).exists():
+        time.sleep(0.05)
+    finished = time.perf_counter() - start
+    assert not ReviewJob.objects.filter(status=ReviewStatus.FAILED).exists()
+    return reads, reviews, finished
+
+
+def main():
+    # In-memory sqlite is per connection; threads need a real file.
+    connection.settings_dict['TEST']['NAME'] = '/tmp/bench_review_jobs.sqlite3'
+    with test_database(), override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=FAKE_LATENCY, REVIEW_CONCURRENCY=4):
+        user = User.objects.create_user(username='bench', password='bench')
+        snippet = Snippet.objects.create(owner=user, code='print("hello")\n', language='python')
+        print(f'{REQUEST_WORKERS} request workers, {READS} reads + {REVIEWS} reviews at once, fake Gemini {FAKE_LATENCY}s')
+        for workers in (0, 4):
+            ReviewJob.objects.all().delete()
+            with override_settings(REVIEW_WORKERS=workers):
+                reads, reviews, finished = burst(user, snippet)
+                get_review_queue().shutdown(wait=True)
+            print(f'REVIEW_WORKERS={workers}')
+            print(f'          read {summarize(reads)}')
+            print(f'  review request {summarize(reviews)}')
+            print(f'  all reviews done after {finished:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
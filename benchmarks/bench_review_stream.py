@@ -0,0 +1,54 @@
+"""
+Time until the user sees the first words of an AI review, for a review job
+(REVIEW_WORKERS=0, answered when complete) versus the Server-Sent Events
+stream (`?stream=1`). Uses the offline fake Gemini client with the stored
+review cache off, so every request reaches the model.
+"""
+import time
+
+from common import setup_django, summarize, test_database
+
+setup_django()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from snippets.models import Snippet  # noqa: E402
+
+FAKE_LATENCY = 4.0
+REPEAT = 5
+
+
+def main():
+    settings = dict(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=FAKE_LATENCY, REVIEW_WORKERS=0, REVIEW_CACHE_TTL=0)
+    with test_database(), override_settings(**settings):
+        user = User.objects.create_user(username='bench', password='bench')
+        snippet = Snippet.objects.create(owner=user, code='def add(a, b):\n    return a + b\n')
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f'/snippets/{snippet.pk}/review/'
+        print(f'fake Gemini {FAKE_LATENCY}s, {REPEAT} reviews each')
+
+        first = []
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            response = client.post(url)
+            assert response.data['status'] == 'done'
+            first.append(time.perf_counter() - start)
+        print(f'       job: first words {summarize(first)}')
+
+        first, total = [], []
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            response = client.post(url + '?stream=1')
+            for index, _ in enumerate(response.streaming_content):
+                if index == 0:
+                    first.append(time.perf_counter() - start)
+            total.append(time.perf_counter() - start)
+        print(f'    stream: first words {summarize(first)}')
+        print(f'            complete    {summarize(total)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Startup cost: time spent in django.setup() (which imports snippets.models),
+wall time of `manage.py check`, and a simulated gunicorn worker boot (load the
+WSGI app and resolve a URL).
+
+`python -X importtime` does not attribute snippets.models, because Django loads
+models through importlib.import_module, so setup is timed in-process instead.
+
+Pass another checkout of the repository to compare against it, e.g.
+`git worktree add /tmp/before <commit>` then
+`python benchmarks/bench_startup.py /tmp/before`.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+RUNS = 7
+WORKER_BOOT = "import config.wsgi; from django.urls import resolve; resolve('/snippets/')"
+SETUP = """
+import os, sys, time
+os.environ['DJANGO_SETTINGS_MODULE'] = 'config.settings'
+import django
+start = time.perf_counter()
+django.setup()
+print(time.perf_counter() - start, file=sys.stderr)
+"""
+
+
+def run(root, args):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=root, env=os.environ, capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result.stderr
+
+
+def setup_time(root):
+    return float(run(root, ['-c', SETUP])[1])
+
+
+def median_wall(root, args):
+    return statistics.median(run(root, args)[0] for _ in range(RUNS))
+
+
+def measure(root):
+    return {
+        'django.setup()': statistics.median(setup_time(root) for _ in range(RUNS)),
+        'manage.py check': median_wall(root, ['manage.py', 'check']),
+        'worker boot': median_wall(root, ['-c', WORKER_BOOT]),
+    }
+
+
+def main():
+    roots = [('current', Path(__file__).resolve().parent.parent)]
+    if len(sys.argv) > 1:
+        roots.insert(0, ('other', Path(sys.argv[1]).resolve()))
+    results = [(label, measure(root)) for label, root in roots]
+    print(f'median of {RUNS} fresh processes')
+    for metric in results[0][1]:
+        print(f'{metric:>24}: ' + '  '.join(f'{label} {values[metric] * 1000:7.1f}ms' for label, values in results))
+
+
+if __name__ == '__main__':
+    main()
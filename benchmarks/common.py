@@ -0,0 +1,57 @@
+"""
+Shared setup for the benchmark scripts in this directory.
+
+Run a benchmark from the project root, e.g. `python benchmarks/bench_highlight_cache.py`.
+Database benchmarks run against a throwaway test database created from the
+configured DATABASE_URL, exactly like `manage.py test` does.
+"""
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+
+def setup_django():
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def timed(fn, repeat=1):
+    """Run `fn` `repeat` times and return the list of wall-clock durations in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(values):
+    return f'mean={statistics.mean(values) * 1000:.2f}ms p50={percentile(values, 50) * 1000:.2f}ms p99={percentile(values, 99) * 1000:.2f}ms'
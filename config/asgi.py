@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Serve AI reviews from the native async views (snippets.async_views).
+os.environ.setdefault('REVIEW_ASYNC', 'True')
 
 application = get_asgi_application()
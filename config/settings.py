@@ -13,7 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 
 import dj_database_url
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,7 +47,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "snippets.middleware.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -145,6 +145,54 @@ CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS', default=[
 CORS_ALLOW_CREDENTIALS = True
 
 
+# Highlighting settings
+# HIGHLIGHT_CACHE_ALIAS names an entry in CACHES used as the shared tier across
+# workers (e.g. a Redis or database cache); leave empty for in-process only.
+HIGHLIGHT_CACHE_SIZE = config('HIGHLIGHT_CACHE_SIZE', default=512, cast=int)
+HIGHLIGHT_CACHE_MAX_BYTES = config('HIGHLIGHT_CACHE_MAX_BYTES', default=32 * 1024 * 1024, cast=int)
+HIGHLIGHT_CACHE_ALIAS = config('HIGHLIGHT_CACHE_ALIAS', default='')
+HIGHLIGHT_CACHE_TIMEOUT = config('HIGHLIGHT_CACHE_TIMEOUT', default=24 * 60 * 60, cast=int)
+# When deferred, save() only marks snippets pending; HTML is built on first read
+# or by `manage.py drain_highlights`.
+HIGHLIGHT_DEFERRED = config('HIGHLIGHT_DEFERRED', default=False, cast=bool)
+# Store class-based markup and serve colours from /styles/<style>.css instead of
+# inline style attributes. Toggling it marks existing HTML stale.
+HIGHLIGHT_CSS_CLASSES = config('HIGHLIGHT_CSS_CLASSES', default=False, cast=bool)
+# Renders run in a pool of HIGHLIGHT_WORKERS processes (0 renders inline in the
+# request, as tests do) with at most HIGHLIGHT_QUEUE_SIZE more jobs waiting.
+# save() waits HIGHLIGHT_SAVE_WAIT seconds and otherwise leaves the snippet
+# pending; reads wait up to HIGHLIGHT_TIMEOUT seconds before answering 503.
+HIGHLIGHT_WORKERS = config('HIGHLIGHT_WORKERS', default=0, cast=int)
+HIGHLIGHT_QUEUE_SIZE = config('HIGHLIGHT_QUEUE_SIZE', default=8, cast=int)
+HIGHLIGHT_SAVE_WAIT = config('HIGHLIGHT_SAVE_WAIT', default=1.0, cast=float)
+HIGHLIGHT_TIMEOUT = config('HIGHLIGHT_TIMEOUT', default=30.0, cast=float)
+# Render budget: code over HIGHLIGHT_MAX_BYTES or HIGHLIGHT_MAX_LINES is stored
+# as plain text without lexing, and lexing stops after HIGHLIGHT_MAX_SECONDS
+# with the rest left plain. `drain_highlights --upgrade` retries those renders.
+HIGHLIGHT_MAX_BYTES = config('HIGHLIGHT_MAX_BYTES', default=2 * 1024 * 1024, cast=int)
+HIGHLIGHT_MAX_LINES = config('HIGHLIGHT_MAX_LINES', default=50000, cast=int)
+HIGHLIGHT_MAX_SECONDS = config('HIGHLIGHT_MAX_SECONDS', default=5.0, cast=float)
+# language='auto' is resolved from a shebang, modeline or filename-like title,
+# else by scoring the first LANGUAGE_DETECTION_SAMPLE characters against the
+# LANGUAGE_DETECTION_CANDIDATES shortlist. Results are memoized in-process.
+LANGUAGE_DETECTION_SAMPLE = config('LANGUAGE_DETECTION_SAMPLE', default=4096, cast=int)
+LANGUAGE_DETECTION_CANDIDATES = config(
+    'LANGUAGE_DETECTION_CANDIDATES', cast=Csv(),
+    default='python,javascript,typescript,java,c,cpp,html,css,sql,php,ruby,go,rust,swift,kotlin,bash,json,yaml,markdown',
+)
+LANGUAGE_DETECTION_CACHE_SIZE = config('LANGUAGE_DETECTION_CACHE_SIZE', default=1024, cast=int)
+
+# Snippet storage
+# Code and highlighted HTML are compressed with zlib or zstd (zstd needs Python
+# 3.14+, otherwise zlib is used); values under MIN_BYTES are stored raw. Changes
+# only apply to rows written afterwards, existing rows stay readable.
+SNIPPET_COMPRESSION_CODEC = config('SNIPPET_COMPRESSION_CODEC', default='zlib')
+SNIPPET_COMPRESSION_LEVEL = config('SNIPPET_COMPRESSION_LEVEL', default=6, cast=int)
+SNIPPET_COMPRESSION_MIN_BYTES = config('SNIPPET_COMPRESSION_MIN_BYTES', default=256, cast=int)
+# Largest body accepted by the raw upload endpoint (POST /snippets/raw/).
+SNIPPET_MAX_UPLOAD_BYTES = config('SNIPPET_MAX_UPLOAD_BYTES', default=10 * 1024 * 1024, cast=int)
+
+
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
@@ -201,10 +249,80 @@ if not DEBUG:
                 'level': 'INFO',
                 'propagate': False,
             },
+            # One JSON line per AI model call and stored-review lookup.
+            'snippets.metrics': {
+                'handlers': ['console'],
+                'level': 'INFO',
+                'propagate': False,
+            },
         },
     }
 
 
 # Gemini settings
 GEMINI_API_KEY = config('GEMINI_API_KEY')
-GEMINI_MODEL = config('GEMINI_MODEL')
\ No newline at end of file
+GEMINI_MODEL = config('GEMINI_MODEL')
+# GEMINI_FAKE swaps in snippets.fake_gemini, which answers after
+# GEMINI_FAKE_LATENCY seconds without network access, for offline load tests.
+GEMINI_FAKE = config('GEMINI_FAKE', default=False, cast=bool)
+GEMINI_FAKE_LATENCY = config('GEMINI_FAKE_LATENCY', default=2.0, cast=float)
+# Calls to Gemini go through snippets.gemini.ResilientClient: each attempt may
+# take GEMINI_CALL_TIMEOUT seconds (the whole call at most REVIEW_TIMEOUT), up
+# to GEMINI_RETRIES failed attempts are retried after a jittered backoff from
+# GEMINI_RETRY_DELAY seconds, and GEMINI_BREAKER_THRESHOLD failures in a row
+# make calls fail fast for GEMINI_BREAKER_COOLDOWN seconds. GEMINI_BASE_URL
+# points the client elsewhere, e.g. at `manage.py fake_gemini_server`.
+GEMINI_BASE_URL = config('GEMINI_BASE_URL', default='')
+GEMINI_CALL_TIMEOUT = config('GEMINI_CALL_TIMEOUT', default=60.0, cast=float)
+GEMINI_RETRIES = config('GEMINI_RETRIES', default=2, cast=int)
+GEMINI_RETRY_DELAY = config('GEMINI_RETRY_DELAY', default=0.5, cast=float)
+GEMINI_BREAKER_THRESHOLD = config('GEMINI_BREAKER_THRESHOLD', default=5, cast=int)
+GEMINI_BREAKER_COOLDOWN = config('GEMINI_BREAKER_COOLDOWN', default=30.0, cast=float)
+GEMINI_MAX_CONNECTIONS = config('GEMINI_MAX_CONNECTIONS', default=20, cast=int)
+
+# Review jobs
+# Reviews run in REVIEW_WORKERS threads per process, or as event loop tasks
+# under the async views (0 runs them inline in the request, as tests do),
+# with at most REVIEW_QUEUE_SIZE more waiting; beyond
+# that a review request answers 503. At most REVIEW_CONCURRENCY Gemini calls
+# run at once across all processes. Jobs still running after REVIEW_TIMEOUT
+# seconds are failed, and status requests long-poll for at most
+# REVIEW_MAX_WAIT seconds.
+REVIEW_WORKERS = config('REVIEW_WORKERS', default=0, cast=int)
+REVIEW_QUEUE_SIZE = config('REVIEW_QUEUE_SIZE', default=32, cast=int)
+REVIEW_CONCURRENCY = config('REVIEW_CONCURRENCY', default=4, cast=int)
+REVIEW_TIMEOUT = config('REVIEW_TIMEOUT', default=120.0, cast=float)
+REVIEW_MAX_WAIT = config('REVIEW_MAX_WAIT', default=20.0, cast=float)
+# Route the review endpoints to the native async views in snippets.async_views,
+# which await Gemini on the event loop. config/asgi.py turns this on.
+REVIEW_ASYNC = config('REVIEW_ASYNC', default=False, cast=bool)
+# Reviews are stored and reused for identical code, model and prompt for
+# REVIEW_CACHE_TTL seconds (0 disables this), keeping at most
+# REVIEW_CACHE_MAX_ENTRIES. Clients can ask for a fresh one with refresh=true.
+REVIEW_CACHE_TTL = config('REVIEW_CACHE_TTL', default=7 * 24 * 60 * 60, cast=int)
+REVIEW_CACHE_MAX_ENTRIES = config('REVIEW_CACHE_MAX_ENTRIES', default=10000, cast=int)
+# Code estimated at over REVIEW_TOKEN_BUDGET tokens (0 for no limit) is split
+# at top-level definitions and the parts are reviewed in up to
+# REVIEW_CHUNK_WORKERS concurrent calls per review, then merged by one more.
+REVIEW_TOKEN_BUDGET = config('REVIEW_TOKEN_BUDGET', default=8000, cast=int)
+REVIEW_CHUNK_WORKERS = config('REVIEW_CHUNK_WORKERS', default=4, cast=int)
+# After an edit, a snippet's last review is updated from a diff with
+# REVIEW_DIFF_CONTEXT lines of context around each change, as long as the diff
+# and that review come to at most REVIEW_DIFF_MAX_RATIO of the code's tokens.
+# After REVIEW_DIFF_MAX_UPDATES updates in a row (0 turns updates off) the code
+# is reviewed whole again, as it is when a client asks with full=true.
+REVIEW_DIFF_CONTEXT = config('REVIEW_DIFF_CONTEXT', default=5, cast=int)
+REVIEW_DIFF_MAX_RATIO = config('REVIEW_DIFF_MAX_RATIO', default=0.5, cast=float)
+REVIEW_DIFF_MAX_UPDATES = config('REVIEW_DIFF_MAX_UPDATES', default=5, cast=int)
+# A batch review (POST /snippets/review/) covers at most REVIEW_BATCH_MAX_ITEMS
+# snippets and runs up to REVIEW_BATCH_WORKERS reviews at once, starting at most
+# REVIEW_BATCH_RATE per second (0 for no limit), within REVIEW_CONCURRENCY.
+REVIEW_BATCH_MAX_ITEMS = config('REVIEW_BATCH_MAX_ITEMS', default=100, cast=int)
+REVIEW_BATCH_WORKERS = config('REVIEW_BATCH_WORKERS', default=4, cast=int)
+REVIEW_BATCH_RATE = config('REVIEW_BATCH_RATE', default=2.0, cast=float)
+
+# Metrics
+# /metrics/ serves AI call and review cache metrics (snippets.metrics) in the
+# Prometheus text format to staff users and to requests sending
+# `Authorization: Bearer <METRICS_TOKEN>`.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
\ No newline at end of file
@@ -1,4 +1,5 @@
 import client from './client';
+import { postEventStream } from './sse';
 
 export const getSnippets = () => {
     return client.get('/snippets/');
@@ -16,8 +17,40 @@ export const getSharedSnippet = (uuid, password) => {
     return client.post(`/snippets/shared/${uuid}/`, { password });
 }
 
-export const reviewSnippet = (id) => client.post(`/snippets/${id}/review/`);
-export const reviewSharedSnippet = (uuid, password) => client.post(`/snippets/shared/${uuid}/review/`, { password });
+export const getReviewJob = (id, wait) => client.get(`/reviews/${id}/`, { params: { wait } });
+
+// Review requests answer 202 with a job; long-poll it until it has finished
+// and resolve with the finished job as response.data.
+const followReviewJob = async (response) => {
+    let job = response.data;
+    while (job.status === 'queued' || job.status === 'running') {
+        job = (await getReviewJob(job.id, 20)).data;
+    }
+    if (job.status === 'failed') {
+        throw new Error(job.error);
+    }
+    return { ...response, data: job };
+};
+
+// Reviews of unchanged code come from the server's store unless refresh is set.
+export const reviewSnippet = (id, refresh = false) => client.post(`/snippets/${id}/review/`, { refresh }).then(followReviewJob);
+export const reviewSharedSnippet = (uuid, password, refresh = false) => client.post(`/snippets/shared/${uuid}/review/`, { password, refresh }).then(followReviewJob);
+
+// Stream a review as the model writes it, calling onChunk with each piece of text.
+// Resolves with the finished job's summary; rejects on an error event.
+export const streamSnippetReview = (id, onChunk, { refresh = false, signal } = {}) => {
+    let result = null;
+    let failure = null;
+    return postEventStream(`/snippets/${id}/review/?stream=1`, { refresh }, (event, data) => {
+        if (event === 'chunk') onChunk(data);
+        else if (event === 'done') result = data;
+        else if (event === 'error') failure = new Error(data.detail);
+    }, signal).then(() => {
+        if (failure) throw failure;
+        if (!result) throw new Error('The review stream ended early.');
+        return result;
+    });
+};
 
 // Helper to check if url is a shared url from our app
 export const parseSharedUrl = (url) => {
@@ -0,0 +1,42 @@
+import client from './client';
+
+// POST to an endpoint that answers with Server-Sent Events and call
+// onEvent(event, data) for each message as it arrives. EventSource can only
+// GET and cannot send the Authorization header, hence fetch. Resolves when
+// the stream ends; pass an AbortSignal to stop early.
+export const postEventStream = async (path, body, onEvent, signal) => {
+    const token = localStorage.getItem('token');
+    const response = await fetch(new URL(path, client.defaults.baseURL), {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            Accept: 'text/event-stream',
+            ...(token ? { Authorization: `Token ${token}` } : {}),
+        },
+        body: JSON.stringify(body),
+        signal,
+    });
+    if (!response.ok) {
+        const detail = await response.json().catch(() => ({}));
+        throw new Error(detail.detail || `Request failed with status ${response.status}`);
+    }
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += value;
+        let end;
+        while ((end = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, end);
+            buffer = buffer.slice(end + 2);
+            let event = 'message';
+            let data = '';
+            for (const line of message.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            onEvent(event, data ? JSON.parse(data) : null);
+        }
+    }
+};
@@ -1,7 +1,7 @@
 import { useState, useEffect, useCallback } from "react";
 import Loading from "./Loading";
 import { updateUserProfile } from "../api/auth";
-import { getSnippets, parseSharedUrl, deleteSnippet, createSnippet, updateSnippet } from "../api/snippet";
+import { getSnippet, getSnippets, parseSharedUrl, deleteSnippet, createSnippet, updateSnippet } from "../api/snippet";
 import { useNavigate } from "react-router-dom";
 import { useAuth } from "../hooks/useAuth";
 import EditProfileModal from "./EditProfileModal";
@@ -78,9 +78,14 @@ const Dashboard = () => {
   };
 
   const openEditModal = (snippet) => {
-    setSelectedSnippet(snippet);
-    setFormMode("edit");
-    setShowFormModal(true);
+    // The list only carries a preview, so load the full snippet before editing.
+    getSnippet(snippet.id)
+      .then((res) => {
+        setSelectedSnippet(res.data);
+        setFormMode("edit");
+        setShowFormModal(true);
+      })
+      .catch(console.error);
   };
 
   const handleFormSubmit = (data) => {
@@ -157,7 +162,7 @@ const Dashboard = () => {
             snippets.map((snippet) => (
               <div key={snippet.id} className="snippet-card" onClick={() => navigate(`/snippets/${snippet.id}`)}>
                 <h3>{snippet.title || "Untitled"}</h3>
-                    <div className="snippet-preview">{snippet.code.substring(0, 100)} {snippet.code.length > 100 ? "..." : ""}</div>
+                    <div className="snippet-preview">{snippet.preview}</div>
                 <div className="card-actions">
                   <button
                     className="icon-btn"
@@ -1,7 +1,7 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import Loading from './Loading';
 import { useParams, useNavigate } from 'react-router-dom';
-import { getSnippet, deleteSnippet, updateSnippet, reviewSnippet } from '../api/snippet';
+import { getSnippet, deleteSnippet, updateSnippet, streamSnippetReview } from '../api/snippet';
 import ShareSnippetModal from './ShareSnippetModal';
 import SnippetFormModal from './SnippetFormModal';
 import SnippetDisplay from './SnippetDisplay';
@@ -18,6 +18,7 @@ function SnippetDetail() {
   const [showEditModal, setShowEditModal] = useState(false);
   const [review, setReview] = useState(null);
   const [reviewLoading, setReviewLoading] = useState(false);
+  const reviewAbort = useRef(null);
 
   const fetchSnippet = useCallback(async () => {
     try {
@@ -37,6 +38,9 @@ function SnippetDetail() {
     })();
   }, [fetchSnippet]);
 
+  // Stop a running review stream when leaving the page.
+  useEffect(() => () => reviewAbort.current?.abort(), []);
+
   const handleDelete = () => {
       if(window.confirm('Are you sure you want to delete this snippet?')) {
           deleteSnippet(id).then(() => {
@@ -46,11 +50,17 @@ function SnippetDetail() {
   };
 
   const handleReview = () => {
+    reviewAbort.current?.abort();
+    const controller = new AbortController();
+    reviewAbort.current = controller;
     setReviewLoading(true);
     setReview(null);
-    reviewSnippet(id).then((response) => {
-      setReview(response.data.review);
-    }).catch((err) => {
+    // Show the review as it is written rather than after a long spinner.
+    streamSnippetReview(id, (chunk) => {
+      setReviewLoading(false);
+      setReview((previous) => (previous || '') + chunk);
+    }, { signal: controller.signal }).catch((err) => {
+      if (err.name === 'AbortError') return;
       console.error('Error reviewing snippet:', err);
       alert('Failed to get review from AI.');
     }).finally(() => {
@@ -49,6 +49,15 @@ const SnippetDisplay = ({
               <span>Owner: {snippet.owner}</span>
             </div>
 
+            {/* Class-based markup needs its style's stylesheet; React hoists the link into <head>. */}
+            {snippet.stylesheet && <link rel="stylesheet" href={snippet.stylesheet} precedence="default" />}
+            {['truncated', 'skipped'].includes(snippet.highlight_outcome) && (
+              <div style={{marginBottom:'10px', color:'#757575', fontSize:'0.9em'}}>
+                {snippet.highlight_outcome === 'skipped'
+                  ? 'This snippet is too large to highlight; it is shown as plain text.'
+                  : 'Highlighting stopped partway through this snippet; the rest is shown as plain text.'}
+              </div>
+            )}
             <div className="code-block" dangerouslySetInnerHTML={{ __html: snippet.highlight }} />
 
             {reviewLoading && (
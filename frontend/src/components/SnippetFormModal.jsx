@@ -65,6 +65,7 @@ const SnippetFormModal = ({ snippet, onClose, onSave, mode = 'create' }) => {
                         <div className="form-group" style={{flex:1}}>
                             <label>Language</label>
                             <select name="language" value={formData.language} onChange={handleChange}>
+                                <option value="auto">Detect automatically</option>
                                 <option value="python">Python</option>
                                 <option value="javascript">JavaScript</option>
                                 <option value="java">Java</option>
@@ -1,7 +1,28 @@
+from django import forms
 from django.contrib import admin
 from .models import Snippet
 
 
+class SnippetAdminForm(forms.ModelForm):
+    # Code lives in the shared SnippetContent table; edit it through the property.
+    code = forms.CharField(widget=forms.Textarea)
+
+    class Meta:
+        model = Snippet
+        fields = ['title', 'code', 'linenos', 'language', 'style', 'owner', 'shared_password']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['code'].initial = self.instance.code
+
+    def save(self, commit=True):
+        self.instance.code = self.cleaned_data['code']
+        return super().save(commit)
+
+
 @admin.register(Snippet)
 class SnippetAdmin(admin.ModelAdmin):
-    list_display = ('title', 'code', 'linenos', 'language', 'style')
\ No newline at end of file
+    form = SnippetAdminForm
+    list_display = ('title', 'code', 'linenos', 'language', 'style')
+    list_select_related = ('content',)
@@ -1,23 +1,248 @@
-from google import genai
-from google.genai import types
+import asyncio
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from google.genai import types
 
-API_KEY = settings.GEMINI_API_KEY
-client = None
-if API_KEY:
-    try:
-        client = genai.Client(api_key=API_KEY)
-    except Exception as e:
-        print(f"Failed to initialize Gemini client: {e}")
+from .chunking import estimate_tokens, split_code
+from .fake_gemini import FakeGeminiClient
+from .gemini import CircuitBreaker, ResilientClient, RetryPolicy, build_client
+from .locks import SingleFlight
+from .metrics import ModelCall, record_cache_lookup
+from .models import ReviewFlight, ReviewResult, content_digest
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the prompts change, so reviews made with the old ones are not reused.
+# 2: code over REVIEW_TOKEN_BUDGET is reviewed in chunks, and the reviews merged.
+PROMPT_VERSION = 2
+TEMPERATURE = 0.7
+# How often a process waiting on another's model call checks whether it has finished.
+LEASE_POLL_INTERVAL = 0.1
+
+
+class ReviewError(Exception):
+    """The model could not produce a review; the message is shown to the user."""
 
-def review_code(code_content):
+
+class ReviewSource:
     """
-    Uses Google Gemini to review the provided code snippet.
+    Where a review came from, filled in by review_code and its siblings when
+    passed as `source`: `cached` if it was the stored review of the code,
+    otherwise the `phase` of the model call that wrote it (see ask_model),
+    also when that call was made for another caller.
     """
-    if not client:
-        return "Error: Gemini client is not initialized (likely missing API key)."
 
-    prompt = f"""
+    def __init__(self):
+        self.cached = False
+        self.phase = None
+
+    @property
+    def incremental(self):
+        """Whether the review is an earlier one updated from a diff."""
+        return self.phase == 'diff'
+
+    def follow(self, leader):
+        self.cached, self.phase = leader.cached, leader.phase
+
+
+_client = None
+
+
+def get_client():
+    """
+    The Gemini client behind a ResilientClient, or the offline fake when
+    GEMINI_FAKE is set; None without an API key.
+    """
+    global _client
+    if _client is None:
+        if settings.GEMINI_FAKE:
+            _client = FakeGeminiClient(latency=settings.GEMINI_FAKE_LATENCY)
+        elif settings.GEMINI_API_KEY:
+            try:
+                _client = ResilientClient(
+                    build_client(settings.GEMINI_API_KEY, settings.GEMINI_BASE_URL, settings.GEMINI_MAX_CONNECTIONS),
+                    breaker=CircuitBreaker(settings.GEMINI_BREAKER_THRESHOLD, settings.GEMINI_BREAKER_COOLDOWN),
+                    policy=RetryPolicy(settings.GEMINI_RETRIES, settings.GEMINI_RETRY_DELAY, settings.GEMINI_CALL_TIMEOUT, settings.REVIEW_TIMEOUT),
+                )
+            except Exception:
+                logger.exception('Failed to initialize Gemini client')
+    return _client
+
+
+@receiver(setting_changed)
+def _reset_client(setting, **kwargs):
+    global _client
+    # The model is chosen per call; everything else configures the client.
+    if setting.startswith('GEMINI_') and setting != 'GEMINI_MODEL':
+        _client = None
+
+
+class ReviewCache:
+    """
+    Reviews kept in the ReviewResult table, keyed by a hash of the code's
+    digest, the model, PROMPT_VERSION and TEMPERATURE, so any change to what
+    would be asked makes a new entry. Only whole reviews of the code are
+    kept: one updated from a diff depends on the review it started from.
+
+    Entries expire after `ttl` seconds (0 turns the cache off) and at most
+    `max_entries` are kept, dropping the oldest; both are enforced whenever
+    a review is stored. Hit and miss counts are per process, and each
+    lookup is recorded in snippets.metrics along with its `context`.
+
+    While the model writes a review, its key is leased (a ReviewFlight row),
+    so a burst of requests spread over several processes makes one call:
+    the others wait for the lease and then find the stored review.
+    """
+
+    def __init__(self, ttl, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def make_key(digest, diff=None):
+        """The key of the whole review of the code, or with a `diff`, of the update it asks for (never stored)."""
+        key = f'{digest}\0{settings.GEMINI_MODEL}\0{PROMPT_VERSION}\0{TEMPERATURE}'
+        if diff is not None:
+            key += f'\0diff\0{diff.review}\0{diff.hunks}'
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def cutoff(self):
+        return timezone.now() - timedelta(seconds=self.ttl)
+
+    def get(self, digest, since=None, context=None):
+        """The stored review of the code with this digest (stored after `since`, if given), or None."""
+        if not self.enabled:
+            return None
+        entries = ReviewResult.objects.filter(key=self.make_key(digest), created__gt=self.cutoff())
+        if since is not None:
+            entries = entries.filter(created__gt=since)
+        review = entries.values_list('review', flat=True).first()
+        if review is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        record_cache_lookup(review is not None, context)
+        return review
+
+    def set(self, digest, review):
+        if not self.enabled:
+            return
+        ReviewResult.objects.update_or_create(key=self.make_key(digest), defaults={
+            'model': settings.GEMINI_MODEL or '', 'prompt_version': PROMPT_VERSION, 'review': review, 'created': timezone.now(),
+        })
+        self.stores += 1
+        self.prune()
+
+    def prune(self):
+        ReviewResult.objects.filter(created__lte=self.cutoff()).delete()
+        if self.max_entries:
+            newest = ReviewResult.objects.order_by('-created').values_list('created', flat=True)
+            boundary = newest[self.max_entries:self.max_entries + 1].first()
+            if boundary is not None:
+                ReviewResult.objects.filter(created__lte=boundary).delete()
+
+    def claim(self, digest):
+        """Take the lease on reviewing this code; False while another call holds it."""
+        key = self.make_key(digest)
+        # A lease older than REVIEW_TIMEOUT was left by a killed process.
+        ReviewFlight.objects.filter(key=key, started__lt=timezone.now() - timedelta(seconds=settings.REVIEW_TIMEOUT)).delete()
+        try:
+            with transaction.atomic():
+                ReviewFlight.objects.create(key=key)
+        except IntegrityError:
+            return False
+        return True
+
+    def release(self, digest):
+        ReviewFlight.objects.filter(key=self.make_key(digest)).delete()
+
+    def holder(self, digest):
+        """When the lease on reviewing this code was taken, or None if nobody holds it."""
+        cutoff = timezone.now() - timedelta(seconds=settings.REVIEW_TIMEOUT)
+        return ReviewFlight.objects.filter(key=self.make_key(digest), started__gte=cutoff).values_list('started', flat=True).first()
+
+    @contextmanager
+    def lease(self, digest):
+        """
+        Hold the lease for the block, waiting up to REVIEW_TIMEOUT for it.
+        Yields True if another call held it first, so the review may just
+        have been stored. Raises ReviewError on timeout.
+        """
+        if not self.enabled:
+            # Nowhere to hand the review over; every process asks for itself.
+            yield False
+            return
+        deadline = time.monotonic() + settings.REVIEW_TIMEOUT
+        waited = False
+        while not self.claim(digest):
+            if time.monotonic() >= deadline:
+                raise ReviewError('Review timed out.')
+            waited = True
+            time.sleep(LEASE_POLL_INTERVAL)
+        try:
+            yield waited
+        finally:
+            self.release(digest)
+
+    @asynccontextmanager
+    async def alease(self, digest):
+        """`lease` for coroutines, waiting on the event loop."""
+        if not self.enabled:
+            yield False
+            return
+        deadline = time.monotonic() + settings.REVIEW_TIMEOUT
+        waited = False
+        while not await sync_to_async(self.claim)(digest):
+            if time.monotonic() >= deadline:
+                raise ReviewError('Review timed out.')
+            waited = True
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+        try:
+            yield waited
+        finally:
+            await sync_to_async(self.release)(digest)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores}
+
+
+_review_cache = None
+
+
+def get_review_cache():
+    global _review_cache
+    if _review_cache is None:
+        _review_cache = ReviewCache(ttl=settings.REVIEW_CACHE_TTL, max_entries=settings.REVIEW_CACHE_MAX_ENTRIES)
+    return _review_cache
+
+
+@receiver(setting_changed)
+def _reset_review_cache(setting, **kwargs):
+    global _review_cache
+    if setting.startswith('REVIEW_CACHE'):
+        _review_cache = None
+
+
+def build_prompt(code_content):
+    return f"""
     Please review the following code snippet.
     Provide constructive feedback, suggestions for improvement, and potential bug fixes.
     Also provide a refactored version of the code if applicable.
@@ -28,14 +253,476 @@ def review_code(code_content):
     ```
     """
 
+
+def build_chunk_prompt(chunk, total):
+    return f"""
+    Please review part of a larger code snippet: lines {chunk.first_line} to {chunk.last_line}, one of {total} parts.
+    Point out bugs and possible improvements in this part, citing line numbers.
+    Keep it brief; the reviews of all parts will be merged into one.
+
+    Code:
+    ```
+    {chunk.code}
+    ```
+    """
+
+
+def build_summary_prompt(chunks, reviews):
+    parts = '\n\n'.join(f'Lines {chunk.first_line} to {chunk.last_line}:\n{review}' for chunk, review in zip(chunks, reviews))
+    return f"""
+    Below are reviews of consecutive parts of one code snippet.
+    Merge them into a single review of the whole snippet: constructive feedback,
+    suggestions for improvement and potential bug fixes, most important first,
+    without repeating points.
+
+    {parts}
+    """
+
+
+def build_diff_prompt(diff):
+    return f"""
+    Below is a review of an earlier version of a code snippet, then the changes made to it since,
+    as a unified diff with a few lines of context around each of the {diff.changed_lines} changed lines.
+    Update the review for the new version: drop the points the changes have dealt with, keep those
+    that still apply, and add feedback on the changed code. Answer with the complete updated review.
+
+    Previous review:
+    {diff.review}
+
+    Changes:
+    ```diff
+    {diff.hunks}
+    ```
+    """
+
+
+def over_budget(code_content):
+    return bool(settings.REVIEW_TOKEN_BUDGET) and estimate_tokens(code_content) > settings.REVIEW_TOKEN_BUDGET
+
+
+def ask_model(client, prompt, phase='review', context=None):
+    """
+    The model's answer to `prompt`, recorded in snippets.metrics under
+    `phase`: a whole review, a chunk, the merge of chunk reviews, or the
+    update of an earlier review from a diff.
+    """
     try:
-        response = client.models.generate_content(
-            model=settings.GEMINI_MODEL,
-            contents=[prompt],
-            config=types.GenerateContentConfig(
-                temperature=0.7,
+        with ModelCall(settings.GEMINI_MODEL, phase, context=context) as call:
+            response = client.models.generate_content(
+                model=settings.GEMINI_MODEL,
+                contents=[prompt],
+                config=generation_config(),
             )
-        )
-        return response.text
+            call.record(response)
     except Exception as e:
-        return f"Error communicating with AI: {str(e)}"
+        raise ReviewError(f"Error communicating with AI: {str(e)}")
+    return response.text
+
+
+async def aask_model(client, prompt, phase='review', context=None):
+    try:
+        with ModelCall(settings.GEMINI_MODEL, phase, context=context) as call:
+            response = await client.aio.models.generate_content(
+                model=settings.GEMINI_MODEL,
+                contents=[prompt],
+                config=generation_config(),
+            )
+            call.record(response)
+    except Exception as e:
+        raise ReviewError(f"Error communicating with AI: {str(e)}")
+    return response.text
+
+
+def review_prompt(client, code_content, language=None, context=None, diff=None):
+    """
+    The prompt asking for the review and its phase for snippets.metrics: the
+    update of an earlier review from a `diff` (a snippets.diffing.ReviewDiff),
+    the code itself or, for code over REVIEW_TOKEN_BUDGET, the reviews of its
+    chunks to merge, made in up to REVIEW_CHUNK_WORKERS concurrent calls.
+    Raises ReviewError.
+    """
+    if diff is not None:
+        return build_diff_prompt(diff), 'diff'
+    if not over_budget(code_content):
+        return build_prompt(code_content), 'review'
+    chunks = split_code(code_content, language, settings.REVIEW_TOKEN_BUDGET)
+    pool = ThreadPoolExecutor(max(1, min(settings.REVIEW_CHUNK_WORKERS, len(chunks))), thread_name_prefix='review-chunk')
+    try:
+        reviews = list(pool.map(lambda chunk: ask_model(client, build_chunk_prompt(chunk, len(chunks)), 'chunk', context) or '', chunks))
+    finally:
+        # After a failed chunk, don't wait for (or start) the rest.
+        pool.shutdown(wait=False, cancel_futures=True)
+    return build_summary_prompt(chunks, reviews), 'merge'
+
+
+async def areview_prompt(client, code_content, language=None, context=None, diff=None):
+    """review_prompt for coroutines, over `client.aio`."""
+    if diff is not None:
+        return build_diff_prompt(diff), 'diff'
+    if not over_budget(code_content):
+        return build_prompt(code_content), 'review'
+    # Lexing a large file takes a while; keep it off the event loop.
+    chunks = await sync_to_async(split_code, thread_sensitive=False)(code_content, language, settings.REVIEW_TOKEN_BUDGET)
+    limit = asyncio.Semaphore(max(1, settings.REVIEW_CHUNK_WORKERS))
+
+    async def review(chunk):
+        async with limit:
+            return await aask_model(client, build_chunk_prompt(chunk, len(chunks)), 'chunk', context) or ''
+
+    tasks = [asyncio.ensure_future(review(chunk)) for chunk in chunks]
+    try:
+        reviews = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return build_summary_prompt(chunks, reviews), 'merge'
+
+
+class _ReviewRequest:
+    """
+    The steps review_code and its siblings share, so they cannot drift
+    apart: the stored review, then the flight of the same review in this
+    process, then (for whole reviews) the lease on it across processes,
+    and storing what the model wrote. The entry points differ only in how
+    they call the model, and whether they wait on the event loop.
+    """
+
+    def __init__(self, code_content, refresh=False, context=None, diff=None, source=None):
+        self.cache = get_review_cache()
+        self.digest = content_digest(code_content)
+        self.refresh = refresh
+        self.since = timezone.now() if refresh else None
+        self.context = context
+        self.diff = diff
+        self.source = ReviewSource() if source is None else source
+        self.key = self.cache.make_key(self.digest, diff)
+        self.flight = None
+        # Set by the leader once it has the review; the flight lands with it.
+        self.result = None
+
+    @property
+    def whole(self):
+        return self.diff is None
+
+    def lookup(self):
+        review = self.cache.get(self.digest, since=self.since, context=self.context)
+        self.source.cached = review is not None
+        return review
+
+    def cached(self):
+        """The stored review, unless refreshing."""
+        return None if self.refresh else self.lookup()
+
+    async def acached(self):
+        return None if self.refresh else await sync_to_async(self.lookup)()
+
+    def join(self):
+        """The review another caller in this process got for us, or None once we lead its flight."""
+        self.flight, shared = join_flight(self.key)
+        return self.follow(shared)
+
+    async def ajoin(self):
+        self.flight, shared = await ajoin_flight(self.key)
+        return self.follow(shared)
+
+    def follow(self, shared):
+        if shared is None:
+            return None
+        review, leader = shared
+        self.source.follow(leader)
+        return review
+
+    @contextmanager
+    def leading(self):
+        """
+        Hold the lease for the block and land the flight after it, with
+        `result`, or the block's ReviewError. Yields the review another
+        process stored while we waited for the lease, or None.
+        """
+        error = None
+        try:
+            with self.cache.lease(self.digest) if self.whole else nullcontext(False) as waited:
+                self.result = self.lookup() if waited else None
+                yield self.result
+        except ReviewError as e:
+            error = str(e)
+            raise
+        finally:
+            self.land(error)
+
+    @asynccontextmanager
+    async def aleading(self):
+        error = None
+        try:
+            async with self.cache.alease(self.digest) if self.whole else nullcontext(False) as waited:
+                self.result = await sync_to_async(self.lookup)() if waited else None
+                yield self.result
+        except ReviewError as e:
+            error = str(e)
+            raise
+        finally:
+            self.land(error)
+
+    def land(self, error):
+        _flights.end(self.key, self.flight, None if self.result is None else (self.result, self.source), error)
+
+    def keep(self, review):
+        """Take what the model wrote as the result, stored if it is a whole review (see ReviewCache)."""
+        self.result = review
+        if review and self.whole:
+            self.cache.set(self.digest, review)
+
+    async def akeep(self, review):
+        self.result = review
+        if review and self.whole:
+            await sync_to_async(self.cache.set)(self.digest, review)
+
+
+def review_code(code_content, refresh=False, language=None, context=None, diff=None, source=None):
+    """
+    Uses Google Gemini to review the provided code snippet, or returns the
+    stored review of identical code unless `refresh` is set. Concurrent
+    calls for the same review share one model call. Code over
+    REVIEW_TOKEN_BUDGET is reviewed in parts, split by its `language`.
+    Given a `diff` from code reviewed before, the model updates that
+    review instead of reviewing the code whole. `context` (e.g. user, snippet and job ids) is logged with the cache
+    lookups and model calls made for it (see snippets.metrics). A
+    ReviewSource passed as `source` is told how the review was made.
+    Raises ReviewError when the client is missing or the call fails.
+    """
+    request = _ReviewRequest(code_content, refresh, context, diff, source)
+    review = request.cached()
+    if review is not None:
+        return review
+    client = require_client()
+    review = request.join()
+    if review is not None:
+        return review
+    with request.leading() as review:
+        if review is None:
+            prompt, request.source.phase = review_prompt(client, code_content, language, context, diff)
+            review = ask_model(client, prompt, request.source.phase, context)
+            request.keep(review)
+    return review
+
+
+def stream_review(code_content, refresh=False, language=None, context=None, diff=None, source=None):
+    """
+    Like review_code, but yields the review piece by piece as the model writes
+    it. The full text is stored once the model has finished; a stream closed
+    part way (client gone, timeout) stores nothing and stops the model call.
+    Callers joining a review already in flight get it in one piece.
+    Raises ReviewError.
+    """
+    request = _ReviewRequest(code_content, refresh, context, diff, source)
+    review = request.cached()
+    if review is None:
+        client = require_client()
+        review = request.join()
+    if review is not None:
+        yield review
+        return
+    with request.leading() as review:
+        if review is not None:
+            yield review
+            return
+        prompt, request.source.phase = review_prompt(client, code_content, language, context, diff)
+        parts = []
+        with ModelCall(settings.GEMINI_MODEL, request.source.phase, stream=True, context=context) as call:
+            try:
+                stream = client.models.generate_content_stream(
+                    model=settings.GEMINI_MODEL,
+                    contents=[prompt],
+                    config=generation_config(),
+                )
+            except Exception as e:
+                raise ReviewError(f"Error communicating with AI: {str(e)}") from e
+            try:
+                while True:
+                    try:
+                        chunk = next(stream)
+                    except StopIteration:
+                        break
+                    except Exception as e:
+                        raise ReviewError(f"Error communicating with AI: {str(e)}") from e
+                    call.record(chunk)
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield chunk.text
+            finally:
+                stream.close()
+        request.keep(''.join(parts) or None)
+
+
+async def areview_code(code_content, refresh=False, language=None, context=None, diff=None, source=None):
+    """review_code for async views: the model call goes through the SDK's async client, `client.aio`."""
+    request = _ReviewRequest(code_content, refresh, context, diff, source)
+    review = await request.acached()
+    if review is not None:
+        return review
+    client = require_client()
+    review = await request.ajoin()
+    if review is not None:
+        return review
+    async with request.aleading() as review:
+        if review is None:
+            prompt, request.source.phase = await areview_prompt(client, code_content, language, context, diff)
+            review = await aask_model(client, prompt, request.source.phase, context)
+            await request.akeep(review)
+    return review
+
+
+async def astream_review(code_content, refresh=False, language=None, context=None, diff=None, source=None):
+    """stream_review for async views, over `client.aio`."""
+    request = _ReviewRequest(code_content, refresh, context, diff, source)
+    review = await request.acached()
+    if review is None:
+        client = require_client()
+        review = await request.ajoin()
+    if review is not None:
+        yield review
+        return
+    async with request.aleading() as review:
+        if review is not None:
+            yield review
+            return
+        prompt, request.source.phase = await areview_prompt(client, code_content, language, context, diff)
+        parts = []
+        with ModelCall(settings.GEMINI_MODEL, request.source.phase, stream=True, context=context) as call:
+            try:
+                stream = await client.aio.models.generate_content_stream(
+                    model=settings.GEMINI_MODEL,
+                    contents=[prompt],
+                    config=generation_config(),
+                )
+            except Exception as e:
+                raise ReviewError(f"Error communicating with AI: {str(e)}") from e
+            try:
+                while True:
+                    try:
+                        chunk = await anext(stream)
+                    except StopAsyncIteration:
+                        break
+                    except Exception as e:
+                        raise ReviewError(f"Error communicating with AI: {str(e)}") from e
+                    call.record(chunk)
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield chunk.text
+            finally:
+                await stream.aclose()
+        await request.akeep(''.join(parts) or None)
+
+
+# Reviews being asked for in this process, by ReviewCache key.
+_flights = SingleFlight()
+
+
+def join_flight(key):
+    """
+    Wait for the same review if another caller in this process is already
+    asking for it. Returns `(None, (review, source))` with its review and
+    ReviewSource, or `(flight, None)` when there is none to wait for: the
+    caller then asks the model itself and must end the flight with both.
+    Raises ReviewError if the other caller failed.
+    """
+    while True:
+        flight, leading = _flights.begin(key)
+        if leading:
+            return flight, None
+        shared = landed(flight, flight.wait(settings.REVIEW_TIMEOUT))
+        if shared is not None:
+            return None, shared
+        # The other caller gave up part way (its client went away); take over.
+
+
+async def ajoin_flight(key):
+    """`join_flight` for coroutines."""
+    while True:
+        flight, leading = _flights.begin(key)
+        if leading:
+            return flight, None
+        shared = landed(flight, await flight.await_landing(settings.REVIEW_TIMEOUT))
+        if shared is not None:
+            return None, shared
+
+
+def landed(flight, in_time):
+    """What a flight waited on landed with: `(review, source)`, or None if its leader gave up. Raises ReviewError."""
+    if not in_time:
+        raise ReviewError('Review timed out.')
+    if flight.error:
+        raise ReviewError(flight.error)
+    return flight.result
+
+
+def review_in_flight(code_content, diff=None):
+    """
+    Whether a review of this code, or given a `diff` this update, is being
+    asked for right now, in this process or (for whole reviews) another.
+    """
+    request = _ReviewRequest(code_content, diff=diff)
+    if request.key in _flights:
+        return True
+    return request.whole and request.cache.enabled and request.cache.holder(request.digest) is not None
+
+
+def follow_review(code_content, diff=None, context=None):
+    """
+    Wait for the review of this code (or update) that another call is
+    asking for, without asking the model: through its flight in this
+    process, or for whole reviews, its lease and then the stored review.
+    Returns `(review, source)`, or None when there is no such call or it
+    ended without a review. Raises ReviewError if it failed or outlasts
+    REVIEW_TIMEOUT.
+    """
+    request = _ReviewRequest(code_content, context=context, diff=diff)
+    flight = _flights.follow(request.key)
+    if flight is not None:
+        return landed(flight, flight.wait(settings.REVIEW_TIMEOUT))
+    if not request.whole or not request.cache.enabled:
+        return None
+    request.since = request.cache.holder(request.digest)
+    if request.since is None:
+        return None
+    deadline = time.monotonic() + settings.REVIEW_TIMEOUT
+    while request.cache.holder(request.digest) is not None:
+        if time.monotonic() >= deadline:
+            raise ReviewError('Review timed out.')
+        time.sleep(LEASE_POLL_INTERVAL)
+    review = request.lookup()
+    return None if review is None else (review, request.source)
+
+
+async def afollow_review(code_content, diff=None, context=None):
+    """`follow_review` for coroutines."""
+    request = _ReviewRequest(code_content, context=context, diff=diff)
+    flight = _flights.follow(request.key)
+    if flight is not None:
+        return landed(flight, await flight.await_landing(settings.REVIEW_TIMEOUT))
+    if not request.whole or not request.cache.enabled:
+        return None
+    request.since = await sync_to_async(request.cache.holder)(request.digest)
+    if request.since is None:
+        return None
+    deadline = time.monotonic() + settings.REVIEW_TIMEOUT
+    while await sync_to_async(request.cache.holder)(request.digest) is not None:
+        if time.monotonic() >= deadline:
+            raise ReviewError('Review timed out.')
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+    review = await sync_to_async(request.lookup)()
+    return None if review is None else (review, request.source)
+
+
+def require_client():
+    client = get_client()
+    if not client:
+        raise ReviewError("Gemini client is not initialized (likely missing API key).")
+    return client
+
+
+def generation_config():
+    return types.GenerateContentConfig(
+        temperature=TEMPERATURE,
+        http_options=types.HttpOptions(timeout=int(settings.REVIEW_TIMEOUT * 1000)),
+    )
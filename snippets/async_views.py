@@ -0,0 +1,144 @@
+"""
+Native async review endpoints for ASGI servers.
+
+Under ASGI, Django runs a sync view in a thread, and a sync review ties up
+that thread until Gemini answers. With REVIEW_ASYNC (set by config/asgi.py),
+snippets.urls routes the review endpoints to these views instead. They call
+the model through the SDK's async client, so one worker process can wait
+on hundreds of reviews without a thread for each.
+
+They answer exactly like the sync `review` and `review_shared` actions:
+the job is queued and the 202 comes back at once, for the client to poll,
+but the job runs as a task on the event loop rather than in a thread (see
+ReviewQueue.asubmit). `?stream=1` relays it as Server-Sent Events. The
+sync path through DRF viewsets stays in place for WSGI.
+
+Only REVIEW_CONCURRENCY reviews (4 by default) call the model at once,
+which caps throughput at REVIEW_CONCURRENCY reviews per model latency,
+however many are waiting. The rest wait for a slot, woken as soon as one
+frees up in the same process. Raise REVIEW_CONCURRENCY along with the
+model quota to have more in flight.
+"""
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Snippet
+from .reviews import ReviewUnavailable, areview_events, get_review_queue, open_review
+from .serializers import ReviewJobSerializer
+
+
+def error(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def authenticate(request):
+    """
+    Wrap `request` for DRF so the API's own token and session authentication
+    and parsers apply, and resolve its user and body (both may touch the
+    database, so call this through sync_to_async).
+    """
+    drf_request = Request(
+        request,
+        parsers=[JSONParser(), FormParser(), MultiPartParser()],
+        authenticators=[TokenAuthentication(), SessionAuthentication()],
+    )
+    # Both are lazy properties; resolve them here, outside the event loop.
+    _ = drf_request.user, drf_request.data
+    return drf_request
+
+
+def lookup(queryset, **filters):
+    # Reviews are looked up by the content digest; the job reads the code itself.
+    return queryset.select_related('content').defer('content__code', 'content__line_index').filter(**filters).first()
+
+
+async def authenticated(request):
+    try:
+        drf_request = await sync_to_async(authenticate)(request)
+    except exceptions.APIException as exc:
+        return None, error(exc.detail, exc.status_code)
+    if not drf_request.user.is_authenticated:
+        return None, error('Authentication credentials were not provided.', 401)
+    return drf_request, None
+
+
+# CSRF is checked by SessionAuthentication, as in DRF views; token clients send none.
+@csrf_exempt
+async def review(request, pk):
+    """Async counterpart of SnippetViewSet.review."""
+    drf_request, failure = await authenticated(request)
+    if failure is not None:
+        return failure
+    if request.method == 'GET':
+        return JsonResponse({'detail': 'Send a POST request to review this snippet.'})
+    if request.method != 'POST':
+        return error(f'Method "{request.method}" not allowed.', 405)
+    snippet = await sync_to_async(lookup)(Snippet.objects.filter(owner=drf_request.user), pk=pk)
+    if snippet is None:
+        return error('No Snippet matches the given query.', 404)
+    return await start_review(drf_request, snippet)
+
+
+@csrf_exempt
+async def review_shared(request, uuid):
+    """Async counterpart of SnippetViewSet.review_shared."""
+    drf_request, failure = await authenticated(request)
+    if failure is not None:
+        return failure
+    if request.method != 'POST':
+        return error(f'Method "{request.method}" not allowed.', 405)
+    try:
+        snippet = await sync_to_async(lookup)(Snippet.objects.all(), uuid=uuid)
+    except ValidationError:
+        snippet = None
+    if snippet is None:
+        return error('Snippet not found.', 404)
+    password = drf_request.data.get('password')
+    if drf_request.user.pk == snippet.owner_id:
+        pass  # Owner can bypass password check
+    elif not password:
+        return error('Password required.', 400)
+    elif snippet.shared_password != password:
+        return error('Incorrect password.', 403)
+    return await start_review(drf_request, snippet)
+
+
+def flag(drf_request, name):
+    return str(drf_request.data.get(name, drf_request.query_params.get(name))).lower() in ('1', 'true')
+
+
+async def start_review(drf_request, snippet):
+    """SnippetViewSet.start_review, running the job on the event loop."""
+    full, refresh = flag(drf_request, 'full'), flag(drf_request, 'refresh')
+    job = await sync_to_async(open_review)(snippet, drf_request.user, full=full, refresh=refresh)
+    if drf_request.query_params.get('stream') in ('1', 'true'):
+        try:
+            return event_stream(await areview_events(job))
+        except ReviewUnavailable as exc:
+            return error(exc.detail, exc.status_code)
+    if not job.is_finished:
+        try:
+            await get_review_queue().asubmit(job.pk)
+        except ReviewUnavailable as exc:
+            await job.adelete()
+            return error(exc.detail, exc.status_code)
+        await job.arefresh_from_db()
+    data = await sync_to_async(lambda: ReviewJobSerializer(job, context={'request': drf_request}).data)()
+    response = JsonResponse(data, status=202, encoder=JSONEncoder)
+    response['Location'] = data['url']
+    return response
+
+
+def event_stream(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
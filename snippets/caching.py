@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache bounded by entry count and, optionally,
+    by the total size of the cached values as reported by `weigh`.
+    """
+
+    def __init__(self, max_entries=512, max_weight=None, weigh=len):
+        self.max_entries = max_entries
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        size = self.weigh(value) if self.max_weight else 0
+        if self.max_weight and size > self.max_weight:
+            # Never let a single oversized value flush the whole cache.
+            return
+        with self._lock:
+            if key in self._data:
+                self.weight -= self.weigh(self._data.pop(key)) if self.max_weight else 0
+            self._data[key] = value
+            self.weight += size
+            while len(self._data) > self.max_entries or (self.max_weight and self.weight > self.max_weight):
+                _, evicted = self._data.popitem(last=False)
+                self.weight -= self.weigh(evicted) if self.max_weight else 0
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._data),
+            'weight': self.weight,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class InstancePool:
+    """
+    Thread-safe pool of reusable objects built by `factory(*key)`.
+
+    Callers check an instance out for exclusive use, so objects that are not
+    safe to share between threads can still be reused. Up to `max_idle`
+    instances are kept per key and idle instances are kept for at most
+    `max_keys` keys, least recently used first out.
+    """
+
+    def __init__(self, factory, max_keys=64, max_idle=4):
+        self.factory = factory
+        self.max_keys = max_keys
+        self.max_idle = max_idle
+        self.hits = 0
+        self.misses = 0
+        self._idle = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            instance = idle.pop() if idle else None
+            if instance is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if instance is None:
+            instance = self.factory(*key)
+        try:
+            yield instance
+        finally:
+            self._release(key, instance)
+
+    def _release(self, key, instance):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            if len(idle) < self.max_idle:
+                idle.append(instance)
+            while len(self._idle) > self.max_keys:
+                self._idle.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._idle.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {'keys': len(self._idle), 'hits': self.hits, 'misses': self.misses}
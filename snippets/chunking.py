@@ -0,0 +1,121 @@
+"""
+Splitting code too large to review in one prompt.
+
+Code estimated at more than REVIEW_TOKEN_BUDGET tokens is reviewed in chunks
+(see snippets.ai_review.review_code and review_prompt). Chunks are cut between top-level
+constructs, found with the snippet language's Pygments lexer, so each one
+holds whole functions and classes where they fit: a chunk starts before a
+line at column 0 that declares something (a keyword, decorator or a name
+the lexer tags as a function or class), together with the comments right
+above it. Failing that, chunks are cut at a blank line, and a single line
+over the budget is cut into pieces.
+"""
+from bisect import bisect_right
+from typing import NamedTuple
+
+from pygments.token import Comment, Keyword, Name
+from pygments.util import ClassNotFound
+
+from .highlighting import lexer_pool
+
+# Gemini averages about four characters per token on source code. Counting
+# exactly would take a request to the API for every review.
+CHARS_PER_TOKEN = 4
+
+DECLARATIONS = (Keyword, Name.Function, Name.Class, Name.Decorator)
+
+# How good a place to cut a line boundary is.
+DECLARATION = 2
+BLANK_LINE = 1
+
+
+class Chunk(NamedTuple):
+    first_line: int
+    code: str
+
+    @property
+    def last_line(self):
+        return self.first_line + self.code.count('\n', 0, len(self.code) - 1)
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def line_kinds(code, language):
+    """
+    For each line of `code`: 'declaration' or 'comment' if it starts at
+    column 0 with one, 'blank', or None. Every line is None when there is
+    no lexer for `language`.
+    """
+    lines = code.splitlines(keepends=True)
+    starts = [0]
+    for line in lines[:-1]:
+        starts.append(starts[-1] + len(line))
+    kinds = ['blank' if not line.strip() else None for line in lines]
+    try:
+        with lexer_pool.acquire((language or 'text',)) as lexer:
+            tokens = list(lexer.get_tokens_unprocessed(code))
+    except ClassNotFound:
+        return kinds
+    for index, ttype, value in tokens:
+        if not value.strip():
+            continue
+        number = bisect_right(starts, index) - 1
+        if lines[number][:1].isspace() or kinds[number] == 'declaration':
+            continue
+        if any(ttype in kind for kind in DECLARATIONS):
+            kinds[number] = 'declaration'
+        elif ttype in Comment and index == starts[number]:
+            kinds[number] = 'comment'
+    return kinds
+
+
+def split_points(code, language):
+    """
+    Map line indexes to how good a place they are to start a chunk:
+    DECLARATION before a top-level declaration (and the comments on top of
+    it), BLANK_LINE after a blank line.
+    """
+    kinds = line_kinds(code, language)
+    points = {}
+    for number in range(1, len(kinds)):
+        kind, previous = kinds[number], kinds[number - 1]
+        if kind in ('declaration', 'comment') and previous not in ('declaration', 'comment'):
+            points[number] = DECLARATION
+        elif kind != 'blank' and previous == 'blank':
+            points[number] = BLANK_LINE
+    return points
+
+
+def split_code(code, language, max_tokens):
+    """
+    Split `code` into chunks of at most `max_tokens` estimated tokens, cut at
+    the best split point that keeps each chunk within budget. Code within
+    budget, or with no budget, is one chunk.
+    """
+    if not max_tokens or estimate_tokens(code) <= max_tokens:
+        return [Chunk(1, code)]
+    lines = code.splitlines(keepends=True)
+    points = split_points(code, language)
+    chunks = []
+    start = 0
+    while start < len(lines):
+        end, size, cut = start, 0, None
+        while end < len(lines) and size + estimate_tokens(lines[end]) <= max_tokens:
+            size += estimate_tokens(lines[end])
+            end += 1
+            if end in points and points[end] >= points.get(cut, 0):
+                cut = end
+        if end == start:
+            # One line over the budget on its own.
+            width = max_tokens * CHARS_PER_TOKEN
+            line = lines[start]
+            chunks.extend(Chunk(start + 1, line[i:i + width]) for i in range(0, len(line), width))
+            start += 1
+            continue
+        if end == len(lines) or cut is None:
+            cut = end
+        chunks.append(Chunk(start + 1, ''.join(lines[start:cut])))
+        start = cut
+    return chunks
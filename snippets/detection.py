@@ -0,0 +1,237 @@
+"""
+Language detection for snippets posted with language='auto'.
+
+Pygments' guess_lexer runs every lexer's analyse_text over the whole input,
+which is slow on large pastes and easily fooled (any "import " reads as
+Python). Detection here only looks at a bounded sample and stops at the first
+cheap signal: a shebang, an editor modeline or a filename-like title. Failing
+those, the sample is scored against line-level signatures of a configurable
+shortlist of languages. Results are memoized by a hash of the sample.
+"""
+import functools
+import hashlib
+import re
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from pygments.lexers import find_lexer_class_by_name
+from pygments.modeline import get_filetype_from_buffer
+from pygments.util import ClassNotFound
+
+from . import registry
+from .caching import LRUCache
+
+AUTO_LANGUAGE = 'auto'
+FALLBACK_LANGUAGE = 'text'
+
+SHEBANG = re.compile(r'#!\s*(?:\S*/)?(?:env\s+(?:-\S+\s+)*)?([A-Za-z]+)')
+INTERPRETERS = {
+    'python': 'python', 'bash': 'bash', 'sh': 'bash', 'zsh': 'bash', 'ksh': 'bash', 'dash': 'bash',
+    'node': 'javascript', 'nodejs': 'javascript', 'deno': 'typescript', 'ruby': 'ruby', 'perl': 'perl',
+    'php': 'php', 'lua': 'lua', 'Rscript': 'splus', 'tclsh': 'tcl', 'awk': 'awk',
+}
+EMACS_MODELINE = re.compile(r'-\*-\s*(?:.*?\bmode:\s*)?([\w+-]+)\s*(?:;.*?)?-\*-', re.IGNORECASE)
+
+_C_LIKE = [(r';\s*$', 1), (r'^\s*(if|for|while|switch)\s*\(', 1), (r'^\s*/?\*|/\*|//', 0.5), (r'\{\s*$', 0.5)]
+_HASH_COMMENT = (r'^\s*#', 0.8)
+
+# Weighted patterns counted per match and normalized by the sample's line
+# count. Strong markers (#include, <?php, package main) weigh 3 or more;
+# syntax shared by several languages weighs 1 or less.
+SIGNATURES = {
+    'python': [
+        (r'^\s*def \w+\(.*(\)\s*(->.*)?:\s*$|,\s*$)', 3), (r'^\s*(from [\w.]+ )?import \w[\w.]*(\s+as \w+)?(,\s*\w+)*\s*$', 2),
+        (r'\bself\.', 1), (r'^\s*(if|elif|else|try|except|finally|for|while|with)\b.*:\s*$', 2), (r'\b(None|True|False)\b', 0.5),
+        (r'^\s*class \w+(\(.*\))?:\s*$', 3), (r'^\s*@\w', 0.5), (r'"""|\'\'\'', 1), _HASH_COMMENT,
+    ],
+    'javascript': _C_LIKE + [
+        (r'\bfunction\b', 1.5), (r'^\s*(const|let|var) \w+\s*=', 1.5), (r'=>', 1), (r'===|!==', 1.5), (r'\brequire\(', 2),
+        (r'\bmodule\.exports\b', 2), (r'\bconsole\.\w+\(', 2), (r'\bexport (default|const|function)\b', 1), (r'\bthis\.\w+', 0.5),
+        (r'\bundefined\b', 1),
+    ],
+    'typescript': _C_LIKE + [
+        (r'\bfunction\b', 1), (r'^\s*(const|let|var) \w+', 1), (r'=>', 1), (r'===|!==', 1), (r'\binterface \w+', 3),
+        (r'\w[?]?:\s*(string|number|boolean|any|void|unknown|never)\b', 3), (r'^\s*(export )?type \w+(<.*>)?\s*=', 3),
+        (r'\b(private|public|readonly|protected) \w+', 1), (r'\bimport .* from [\'"]', 1), (r'\bimplements\b', 1),
+        (r'\bas (const|any|unknown)\b', 2), (r'^\s*export (declare|interface|type|enum)\b', 3),
+    ],
+    'java': _C_LIKE + [
+        (r'\bpublic (static )?(class|void|final|abstract|interface)\b', 3), (r'\bprivate (static )?(final )?\w+', 1),
+        (r'System\.out', 3), (r'@Override', 3), (r'^import (java|javax|org|com)\.', 3), (r'^package [\w.]+;', 3),
+    ],
+    'c': _C_LIKE + [
+        (r'^#include [<"][\w/]+\.h[>"]', 3), (r'^#\s*(define|ifdef|ifndef|endif|if|else|undef)\b', 2), (r'\bint main\(', 2),
+        (r'->', 0.5), (r'\b(malloc|free|sizeof|NULL)\b', 1.5), (r'\btypedef\b', 2), (r'\bstruct \w+', 1),
+        (r'^\s*(static |extern |const )*(int|void|char|unsigned|long|size_t|double)\b', 1),
+    ],
+    'cpp': _C_LIKE + [
+        (r'^#include [<"][\w/]+(\.h|\.hpp)?[>"]', 2), (r'^#\s*(define|ifdef|ifndef|endif|if|else)\b', 1.5), (r'\bstd::', 3),
+        (r'\bnamespace \w+', 3), (r'\btemplate\s*<', 3), (r'\b(nullptr|constexpr|auto|override|virtual)\b', 2),
+        (r'^\s*(public|private|protected):', 3), (r'\bclass \w+', 1), (r'\w::\w', 0.5), (r'->', 0.5),
+    ],
+    'html': [(r'<!DOCTYPE', 3), (r'<html', 3), (r'</\w+>', 2), (r'<\w+[^>]*>', 1.5), (r'\b(class|href|src|id)="', 1)],
+    'css': [
+        (r'^\s*[.#@]?[\w\-\[\]=":., >*+~()]+\{\s*$', 3), (r'^\s*[\w-]+:\s*[^;{}]+;\s*$', 2), (r'\d(px|em|rem|vh|vw)\b', 1),
+        (r'@media\b', 2), (r'^\s*\}\s*$', 0.5), (r'#[0-9a-fA-F]{3,6}\b', 1),
+    ],
+    'sql': [
+        (r'(?i)\bSELECT\b.*\bFROM\b', 3), (r'(?i)\bINSERT INTO\b', 3), (r'(?i)\bCREATE (TABLE|INDEX|VIEW)\b', 3),
+        (r'(?i)^\s*(WHERE|FROM|JOIN|GROUP BY|ORDER BY)\b', 2), (r'^\s*--', 1),
+    ],
+    'php': [(r'<\?php', 5), (r'\$this->', 3), (r'\$\w+\s*=', 1), (r'\bfunction \w+\(\$', 3)],
+    'ruby': [
+        (r'^\s*def \w+[?!]?(\(.*\))?\s*$', 3), (r'^\s*end\s*$', 2), (r'^\s*require(_relative)? [\'"]', 2),
+        (r'\battr_(accessor|reader|writer)\b', 3), (r'\bdo(\s*\|.*\|)?\s*$', 2), (r'\bputs\b', 1), (r'@\w+', 0.5),
+        (r'^\s*(module|class) [A-Z]\w*(\s*<\s*[\w:]+)?\s*$', 2), (r'\.each\b', 1), (r'\bnil\b', 1), (r'\bunless\b', 1), _HASH_COMMENT,
+    ],
+    'go': [
+        (r'^package \w+\s*$', 3), (r'^func ', 3), (r':=', 2), (r'\bfmt\.\w+', 2), (r'^import \(', 3), (r'\berr != nil\b', 3),
+        (r'\bgo func\b', 2), (r'\bchan\b', 1), (r'^\s*//', 0.3), (r'\{\s*$', 0.5),
+    ],
+    'rust': [
+        (r'\bfn \w+', 3), (r'\blet (mut )?\w+', 1.5), (r'^\s*impl\b', 3), (r'\bpub(\(crate\))? (fn|struct|enum|mod|use|trait)\b', 3),
+        (r'^\s*use \w+(::\w+)+', 3), (r'&(mut )?self\b', 2), (r'^\s*#!?\[\w+', 2), (r'\.unwrap\(\)', 2), (r'\bmatch \w+', 1),
+        (r'\b(Some|Ok|Err)\(', 1), (r'::<', 2), (r'\w::\w', 1), (r'^\s*//', 0.3), (r'\{\s*$', 0.5), (r';\s*$', 0.5),
+    ],
+    'swift': [
+        (r'^import (UIKit|Foundation|SwiftUI)', 3), (r'\bguard let\b', 3), (r'\bfunc \w+\(.*\)\s*(->|\{)', 2),
+        (r'\bvar \w+:\s*\w+', 1), (r'\bif let\b', 2),
+    ],
+    'kotlin': [(r'\bfun \w+\(', 3), (r'\bval \w+', 1.5), (r'\bdata class\b', 3), (r'\bwhen\s*[\({]', 1), (r'\bprintln\(', 1)],
+    'bash': [
+        (r'\$\(', 1.5), (r'^\s*fi\s*$', 3), (r';\s*then\s*$|^\s*then\s*$', 3), (r'\besac\b', 3), (r'\$\{\w+', 2),
+        (r'^\s*echo\b', 2), (r'\[\[? ', 1), (r'^\s*done\s*$', 2), (r'^\s*export \w+=', 2), (r'^\s*local \w+', 2),
+        (r'\$\w+', 0.5), (r'^\s*\w+=\S', 1), _HASH_COMMENT,
+    ],
+    'json': [
+        (r'^\s*"[^"\n]+"\s*:\s*("|\d|\[|\{|true|false|null)', 3), (r'^\s*[\[{]\s*$', 1), (r'^\s*[\]}],?\s*$', 1),
+        (r'^\s*"[^"\n]*",?\s*$', 1),
+    ],
+    'yaml': [(r'^\s*[\w.-]+:(\s+[^\s;{(]|\s*$)(?!.*[;{]\s*$)', 1.5), (r'^\s*- \S', 1.5), (r'^---\s*$', 3), (r'^\s*#', 0.3)],
+    'markdown': [
+        (r'^#{1,6} \S', 1), (r'^\s*[-*+] \S', 1), (r'^```', 3), (r'\[[^\]\n]+\]\([^)\n]+\)', 2), (r'`[^`\n]+`', 1),
+        (r'\*\*\w', 1), (r'^\s*\d+\. ', 1), (r'^[=-]{3,}\s*$', 2),
+    ],
+}
+
+
+@functools.cache
+def compiled_signature(language):
+    return [(re.compile(pattern, re.MULTILINE), weight) for pattern, weight in SIGNATURES.get(language, ())]
+
+
+def canonical_language(name):
+    """The registry alias for a Pygments name or alias, or None if Pygments has no such lexer."""
+    if registry.is_language(name):
+        return name
+    try:
+        return find_lexer_class_by_name(name).aliases[0]
+    except ClassNotFound:
+        return None
+
+
+def sample_of(code, size):
+    """The first `size` characters of `code`, cut back to a whole line when possible."""
+    if len(code) <= size:
+        return code
+    head = code[:size]
+    cut = head.rfind('\n')
+    return head[:cut] if cut > 0 else head
+
+
+def hinted_language(code, filename=None):
+    """A language named by a shebang, a vim or emacs modeline, or an unambiguous file extension."""
+    first_line = code[:256].split('\n', 1)[0]
+    if first_line.startswith('#!') and (match := SHEBANG.match(first_line)):
+        interpreter = match.group(1)
+        language = INTERPRETERS.get(interpreter) or INTERPRETERS.get(interpreter.rstrip('0123456789.'))
+        if language and (language := canonical_language(language)):
+            return language
+    # Emacs reads its modeline from the first two lines, vim from the first and last five.
+    match = EMACS_MODELINE.search('\n'.join(code[:1024].split('\n', 2)[:2]))
+    filetype = match.group(1) if match else get_filetype_from_buffer(code[:1024]) or get_filetype_from_buffer(code[-1024:])
+    if filetype and (language := canonical_language(filetype.lower())):
+        return language
+    if filename:
+        claimed = registry.languages_for_filename(filename)
+        if len(claimed) == 1:
+            return claimed[0]
+    return None
+
+
+def score_languages(sample, candidates):
+    """Signature score of `sample` for each candidate, normalized by its non-blank line count."""
+    lines = max(1, sum(1 for line in sample.splitlines() if line.strip()))
+    scores = {}
+    for language in candidates:
+        signature = compiled_signature(language)
+        if signature:
+            scores[language] = sum(weight * len(pattern.findall(sample)) for pattern, weight in signature) / lines
+        else:
+            # Without a signature, fall back to the lexer's own (mostly shebang-based) check.
+            try:
+                scores[language] = 3 * find_lexer_class_by_name(language).analyse_text(sample)
+            except ClassNotFound:
+                continue
+    return scores
+
+
+def _detect(code, filename, sample):
+    hinted = hinted_language(code, filename)
+    if hinted:
+        return hinted
+    candidates = settings.LANGUAGE_DETECTION_CANDIDATES
+    if filename:
+        # An ambiguous extension (.h is C, C++ or Objective-C) still narrows the field.
+        narrowed = [language for language in registry.languages_for_filename(filename) if language in candidates]
+        candidates = narrowed or candidates
+        if len(candidates) == 1:
+            return candidates[0]
+    scores = score_languages(sample, candidates)
+    best = max(scores, key=scores.get, default=None)
+    return best if best is not None and scores[best] > 0 else FALLBACK_LANGUAGE
+
+
+class DetectionCache(LRUCache):
+    @staticmethod
+    def make_key(code, filename, sample):
+        digest = hashlib.sha256((filename or '').encode())
+        digest.update(b'\0')
+        digest.update(sample.encode('utf-8', 'surrogatepass'))
+        # Modelines can sit at the end, past the sample.
+        digest.update(b'\0')
+        digest.update(code[-1024:].encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+
+_detection_cache = None
+
+
+def get_detection_cache():
+    global _detection_cache
+    if _detection_cache is None:
+        _detection_cache = DetectionCache(max_entries=settings.LANGUAGE_DETECTION_CACHE_SIZE)
+    return _detection_cache
+
+
+@receiver(setting_changed)
+def _reset_detection_cache(setting, **kwargs):
+    global _detection_cache
+    if setting.startswith('LANGUAGE_DETECTION'):
+        _detection_cache = None
+
+
+def detect_language(code, filename=None):
+    """
+    Best registry language for `code`, or 'text' when nothing matches.
+    `filename` is an optional hint such as the snippet title.
+    """
+    sample = sample_of(code, settings.LANGUAGE_DETECTION_SAMPLE)
+    cache = get_detection_cache()
+    key = cache.make_key(code, filename, sample)
+    language = cache.get(key)
+    if language is None:
+        language = _detect(code, filename, sample)
+        cache.set(key, language)
+    return language
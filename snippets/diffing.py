@@ -0,0 +1,49 @@
+"""
+Reviewing an edited snippet from what changed.
+
+Users edit a snippet a little and ask for a review again. Instead of
+reviewing the whole code once more, the model can be given the review of
+the version it last saw and a unified diff of the edit, with
+REVIEW_DIFF_CONTEXT lines of context around each change, and asked to
+update that review (see snippets.ai_review.build_diff_prompt).
+
+An update is only worth it while it is much smaller than the code: the diff
+and the previous review together must come to at most REVIEW_DIFF_MAX_RATIO
+of the code's estimated tokens. Errors compound over successive updates,
+so after REVIEW_DIFF_MAX_UPDATES of them the code is reviewed whole again.
+"""
+import difflib
+from itertools import islice
+from typing import NamedTuple
+
+from .chunking import estimate_tokens
+
+
+class ReviewDiff(NamedTuple):
+    # Unified diff hunks from the reviewed code to the current code.
+    hunks: str
+    # The review of the code before the edit.
+    review: str
+    changed_lines: int
+
+
+def diff_hunks(old, new, context=3):
+    """The hunks of a unified diff from `old` to `new`, without the file header."""
+    lines = difflib.unified_diff(old.splitlines(), new.splitlines(), n=context, lineterm='')
+    # The first two lines are the ---/+++ header; changed lines can start the same way.
+    return '\n'.join(islice(lines, 2, None))
+
+
+def review_diff(old, new, review, context=3, max_ratio=0.5):
+    """
+    A ReviewDiff updating `review` of `old` code to `new`, or None when a
+    whole review of `new` is called for: the code did not change, or the
+    update would not come to at most `max_ratio` of its size.
+    """
+    if old == new or not review:
+        return None
+    hunks = diff_hunks(old, new, context)
+    if estimate_tokens(hunks) + estimate_tokens(review) > max_ratio * estimate_tokens(new):
+        return None
+    changed = sum(1 for line in hunks.splitlines() if line.startswith(('+', '-')))
+    return ReviewDiff(hunks, review, changed)
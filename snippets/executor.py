@@ -0,0 +1,150 @@
+"""
+Process pool for highlight jobs.
+
+Pygments is pure Python, so a large render inside a request holds the worker
+(and the GIL) for its whole duration. The executor moves that CPU work into a
+small pool of worker processes. The request thread only waits for the result,
+and only for as long as it is willing to.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HighlightUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Highlighting is busy, try again shortly.'
+    default_code = 'highlight_unavailable'
+
+
+class HighlightExecutor:
+    """
+    Runs jobs in `max_workers` processes with at most `max_queued` more waiting,
+    so a burst of large pastes cannot pile up unbounded work. Jobs submitted
+    with a key already in flight share its result instead of running twice.
+
+    A caller that stops waiting (timeout) does not cancel the job: it keeps
+    its slot until it finishes and its `on_done` callback still runs, so the
+    result can be cached for the next caller. With max_workers=0 jobs run
+    inline in the calling thread, which is what tests use.
+    """
+
+    def __init__(self, max_workers=0, max_queued=0):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.submitted = 0
+        self.shared = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued) if max_workers else None
+        self._in_flight = {}
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def inline(self):
+        return not self.max_workers
+
+    def _reset_pool(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, key, fn, *args, wait=None, on_done=None):
+        """
+        Start `fn(*args)` in the pool and return its future. Waits up to `wait`
+        seconds for a free slot (not at all when None) before raising
+        HighlightUnavailable.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.shared += 1
+                return future
+        acquired = self._slots.acquire(timeout=wait) if wait else self._slots.acquire(blocking=False)
+        if not acquired:
+            self.rejected += 1
+            raise HighlightUnavailable()
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._slots.release()
+                self.shared += 1
+                return future
+            try:
+                if self._pool is None:
+                    # spawn keeps request-time state (database connections, locks) out of the workers.
+                    self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+                future = self._pool.submit(fn, *args)
+            except (BrokenProcessPool, RuntimeError):
+                self._slots.release()
+                self._pool = None
+                raise HighlightUnavailable()
+            self._in_flight[key] = future
+            self.submitted += 1
+        future.add_done_callback(lambda done: self._finish(key, done, on_done))
+        return future
+
+    def _finish(self, key, future, on_done):
+        with self._lock:
+            self._in_flight.pop(key, None)
+        self._slots.release()
+        if on_done is not None and not future.cancelled() and future.exception() is None:
+            on_done(future.result())
+
+    def run(self, key, fn, *args, timeout=None, wait=None, on_done=None):
+        """Run `fn(*args)` and return its result, raising HighlightUnavailable if it is not ready within `timeout` seconds."""
+        if self.inline:
+            result = fn(*args)
+            if on_done is not None:
+                on_done(result)
+            return result
+        future = self.submit(key, fn, *args, wait=wait, on_done=on_done)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            raise HighlightUnavailable('Highlighting is taking too long, try again shortly.')
+        except BrokenProcessPool:
+            self._reset_pool()
+            raise HighlightUnavailable()
+
+    def shutdown(self):
+        self._reset_pool()
+
+    def stats(self):
+        return {
+            'workers': self.max_workers,
+            'in_flight': len(self._in_flight),
+            'submitted': self.submitted,
+            'shared': self.shared,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+        }
+
+
+_executor = None
+
+
+def get_highlight_executor():
+    global _executor
+    if _executor is None:
+        _executor = HighlightExecutor(max_workers=settings.HIGHLIGHT_WORKERS, max_queued=settings.HIGHLIGHT_QUEUE_SIZE)
+    return _executor
+
+
+@receiver(setting_changed)
+def _reset_highlight_executor(setting, **kwargs):
+    global _executor
+    if setting in ('HIGHLIGHT_WORKERS', 'HIGHLIGHT_QUEUE_SIZE') and _executor is not None:
+        _executor.shutdown()
+        _executor = None
@@ -0,0 +1,222 @@
+"""
+Stand-ins for Gemini, for running reviews offline.
+
+Set GEMINI_FAKE=True to have snippets.ai_review use FakeGeminiClient instead
+of calling Gemini: each call sleeps for GEMINI_FAKE_LATENCY seconds (give or
+take `jitter`) and answers with a short canned review of the code, so the
+review flow can be exercised and load-tested without an API key or network
+access.
+
+FakeGeminiServer gives the same answers over HTTP, from the REST endpoints
+the SDK calls, and can fail requests with an error status. Run it with
+`manage.py fake_gemini_server` and point the real client at it with
+GEMINI_BASE_URL to load-test the transport, timeouts, retries and circuit
+breaker of snippets.gemini as well.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+
+class FakeUsage(NamedTuple):
+    prompt_token_count: int
+    candidates_token_count: int
+    total_token_count: int
+
+
+class FakeResponse:
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def estimate_usage(contents, answer):
+    """Token counts as Gemini would report them, estimated at four characters per token."""
+    prompt = -(-sum(len(part) for part in contents) // 4)
+    response = -(-len(answer) // 4)
+    return FakeUsage(prompt, response, prompt + response)
+
+
+class FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def _delay(self, contents):
+        # Reading the prompt takes token_latency seconds per (estimated) token.
+        reading = self._client.token_latency * sum(len(part) for part in contents) / 4
+        return reading + self._client.latency * random.uniform(1 - self._client.jitter, 1 + self._client.jitter)
+
+    def _answer(self, model, contents):
+        if random.random() < self._client.failure_rate:
+            raise ConnectionError('Fake Gemini failure.')
+        prompt = '\n'.join(contents)
+        lines = prompt.count('\n') + 1
+        return (
+            f'## Review ({model}, fake)\n\n'
+            f'Looked at {lines} lines of prompt. The code reads clearly; consider adding tests '
+            'and handling errors at the boundaries.'
+        )
+
+    def generate_content(self, model, contents, config=None):
+        self._client.calls += 1
+        delay = self._delay(contents)
+        if delay > 0:
+            time.sleep(delay)
+        answer = self._answer(model, contents)
+        return FakeResponse(answer, estimate_usage(contents, answer))
+
+    def _chunks(self, model, contents):
+        """
+        The answer a few words per chunk, with the delay before each one and
+        the token usage (reported with the last chunk, otherwise None).
+        """
+        answer = self._answer(model, contents)
+        words = answer.split(' ')
+        chunks = [(' ' if i else '') + ' '.join(words[i:i + 4]) for i in range(0, len(words), 4)]
+        delay = self._delay(contents) / len(chunks)
+        usage = estimate_usage(contents, answer)
+        return [(delay, chunk, usage if i == len(chunks) - 1 else None) for i, chunk in enumerate(chunks)]
+
+    def generate_content_stream(self, model, contents, config=None):
+        """Yield the answer a few words per chunk, spreading the latency over the chunks."""
+        self._client.calls += 1
+        for delay, chunk, usage in self._chunks(model, contents):
+            if delay > 0:
+                time.sleep(delay)
+            yield FakeResponse(chunk, usage)
+
+
+class AsyncFakeModels(FakeModels):
+    """The `client.aio.models` side: the same answers, waiting with asyncio instead of blocking."""
+
+    async def generate_content(self, model, contents, config=None):
+        self._client.calls += 1
+        delay = self._delay(contents)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        answer = self._answer(model, contents)
+        return FakeResponse(answer, estimate_usage(contents, answer))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self._client.calls += 1
+        chunks = self._chunks(model, contents)
+
+        async def stream():
+            for delay, chunk, usage in chunks:
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield FakeResponse(chunk, usage)
+        return stream()
+
+
+class AsyncFakeClient:
+    def __init__(self, client):
+        self.models = AsyncFakeModels(client)
+
+
+class FakeGeminiClient:
+    """
+    Mimics `generate_content` and `generate_content_stream` of google.genai.Client,
+    both on `client.models` and on the async `client.aio.models`.
+    """
+
+    def __init__(self, latency=2.0, jitter=0.25, failure_rate=0.0, token_latency=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.token_latency = token_latency
+        self.calls = 0
+        self.models = FakeModels(self)
+        self.aio = AsyncFakeClient(self)
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    # Keep connections open, as Google's endpoint does, so clients can pool them.
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        contents = [part.get('text', '') for content in body.get('contents', []) for part in content.get('parts', [])]
+        model = self.path.partition('/models/')[2].partition(':')[0]
+        if not server.count_request():
+            status = server.error_status
+            self.send_json(status, {'error': {'code': status, 'message': 'Fake Gemini failure.', 'status': 'UNAVAILABLE'}})
+            return
+        models = server.client.models
+        if ':streamGenerateContent' in self.path:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for delay, chunk, usage in models._chunks(model, contents):
+                time.sleep(delay)
+                self.write_chunk(f'data: {json.dumps(self.candidate(chunk, usage))}\r\n\r\n'.encode())
+            self.write_chunk(b'')
+        else:
+            time.sleep(models._delay(contents))
+            answer = models._answer(model, contents)
+            self.send_json(200, self.candidate(answer, estimate_usage(contents, answer)))
+
+    @staticmethod
+    def candidate(text, usage=None):
+        data = {'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP', 'index': 0}]}
+        if usage is not None:
+            data['usageMetadata'] = {
+                'promptTokenCount': usage.prompt_token_count,
+                'candidatesTokenCount': usage.candidates_token_count,
+                'totalTokenCount': usage.total_token_count,
+            }
+        return data
+
+    def send_json(self, status, data):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def write_chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    """
+    Serves `generateContent` and `streamGenerateContent` (as Server-Sent
+    Events) like Gemini's REST API, answering as FakeGeminiClient does, and
+    fails a `failure_rate` share of requests with `error_status`. Binds to a
+    free port by default; `url` is the address to use as GEMINI_BASE_URL.
+    """
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=2.0, jitter=0.25, failure_rate=0.0, error_status=503, token_latency=0.0):
+        super().__init__(address, FakeGeminiHandler)
+        self.client = FakeGeminiClient(latency=latency, jitter=jitter, token_latency=token_latency)
+        self.failure_rate = failure_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count_request(self):
+        """Count a request; False if it should fail."""
+        with self._lock:
+            self.requests += 1
+            if random.random() < self.failure_rate:
+                self.failures += 1
+                return False
+            return True
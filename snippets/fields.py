@@ -0,0 +1,121 @@
+"""
+Compressed text column.
+
+Values are stored as bytes: one format byte naming the codec, then the
+payload. Text shorter than SNIPPET_COMPRESSION_MIN_BYTES (or text that does not
+shrink) is stored raw, so small snippets pay only the extra byte. The format
+byte leaves room for new codecs without rewriting existing rows.
+"""
+import codecs
+import zlib
+
+from django import forms
+from django.conf import settings
+from django.db import models
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    zstd = None
+
+FORMAT_RAW = 0
+FORMAT_ZLIB = 1
+FORMAT_ZSTD = 2
+
+
+def compress_text(text, codec=None, min_bytes=None):
+    codec = codec or settings.SNIPPET_COMPRESSION_CODEC
+    if min_bytes is None:
+        min_bytes = settings.SNIPPET_COMPRESSION_MIN_BYTES
+    # Like content_digest: JSON can carry lone surrogates, which strict UTF-8 rejects.
+    data = text.encode('utf-8', 'surrogatepass')
+    if len(data) >= min_bytes:
+        if codec == 'zstd' and zstd is not None:
+            packed = bytes([FORMAT_ZSTD]) + zstd.compress(data, settings.SNIPPET_COMPRESSION_LEVEL)
+        elif codec in ('zlib', 'zstd'):
+            packed = bytes([FORMAT_ZLIB]) + zlib.compress(data, settings.SNIPPET_COMPRESSION_LEVEL)
+        else:
+            packed = None
+        if packed is not None and len(packed) < len(data) + 1:
+            return packed
+    return bytes([FORMAT_RAW]) + data
+
+
+def _decompressor(fmt):
+    if fmt == FORMAT_RAW:
+        return None
+    if fmt == FORMAT_ZLIB:
+        return zlib.decompressobj()
+    if fmt == FORMAT_ZSTD:
+        if zstd is None:
+            raise ValueError('Value is zstd-compressed but compression.zstd is not available.')
+        return zstd.ZstdDecompressor()
+    raise ValueError(f'Unknown compressed text format {fmt}.')
+
+
+def decompress_text(value):
+    return ''.join(iter_decompressed([value]))
+
+
+def iter_decompressed(chunks):
+    """Decode a stored value given as consecutive byte chunks, yielding text as it is decompressed."""
+    decoder = codecs.getincrementaldecoder('utf-8')('surrogatepass')
+    decompressor = None
+    started = False
+    for chunk in chunks:
+        chunk = bytes(chunk)
+        if not started:
+            if not chunk:
+                continue
+            decompressor = _decompressor(chunk[0])
+            chunk = chunk[1:]
+            started = True
+        text = decoder.decode(decompressor.decompress(chunk) if decompressor else chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+class CompressedTextField(models.BinaryField):
+    """A BinaryField that reads and writes `str` and compresses it on the way to the database."""
+
+    description = 'Compressed text'
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        # editable=True is this field's default, unlike BinaryField's.
+        kwargs.pop('editable', None)
+        if not self.editable:
+            kwargs['editable'] = False
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return decompress_text(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return decompress_text(value)
+        return value
+
+    def get_default(self):
+        default = super().get_default()
+        return '' if default == b'' else default
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = compress_text(value)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': forms.CharField, 'widget': forms.Textarea, **kwargs})
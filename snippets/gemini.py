@@ -0,0 +1,252 @@
+"""
+Resilient calls to Gemini.
+
+Reviews wait on a remote model. When it browns out, calls hang or fail,
+and without limits every review thread sat on a dead connection until the
+SDK gave up. ResilientClient wraps a google.genai.Client with the same
+`models` and `aio.models` methods used by snippets.ai_review, and:
+
+* gives each attempt its own deadline (GEMINI_CALL_TIMEOUT) and the whole
+  call, retries included, at most REVIEW_TIMEOUT;
+* retries timeouts, connection errors and retryable HTTP statuses up to
+  GEMINI_RETRIES times, after a random delay of up to GEMINI_RETRY_DELAY
+  seconds doubled per retry ("full jitter"), so retries don't pile up in
+  lockstep;
+* stops calling for GEMINI_BREAKER_COOLDOWN seconds once
+  GEMINI_BREAKER_THRESHOLD calls in a row have failed, failing fast
+  instead (CircuitOpen), then lets one trial call through to probe;
+* reuses pooled HTTP connections, up to GEMINI_MAX_CONNECTIONS per process.
+
+A stream is only retried until its first chunk arrives; after that a
+failure ends it.
+"""
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+from google import genai
+from google.genai import errors, types
+
+# Timeouts, rate limiting and server-side failures are worth another try.
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class CircuitOpen(Exception):
+    """Gemini has been failing; calls are refused until the cooldown ends."""
+
+
+def is_retryable(exc):
+    if isinstance(exc, errors.APIError):
+        return exc.code in RETRYABLE_STATUS
+    return isinstance(exc, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+class CircuitBreaker:
+    """
+    Counts calls failing in a row. At `threshold` it opens: `check` raises
+    CircuitOpen for `cooldown` seconds. Then it is half open: one caller
+    gets through, and its outcome closes the breaker or opens it again. A
+    probe with no outcome after another `cooldown` (its caller went away)
+    is replaced by the next caller.
+    """
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = None
+        self.rejected = 0
+        self.trips = 0
+        self._probe = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened >= self.cooldown else 'open'
+
+    def check(self):
+        with self._lock:
+            if self.opened is None:
+                return
+            now = time.monotonic()
+            remaining = self.opened + self.cooldown - now
+            if remaining <= 0 and (self._probe is None or now - self._probe >= self.cooldown):
+                self._probe = now
+                return
+            self.rejected += 1
+        raise CircuitOpen(f'Gemini is unavailable, not trying again for {max(remaining, 0):.0f}s.')
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+            self._probe = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probe is not None or (self.opened is None and self.failures >= self.threshold):
+                self.opened = time.monotonic()
+                self.trips += 1
+            self._probe = None
+
+    def stats(self):
+        return {'state': self.state, 'failures': self.failures, 'trips': self.trips, 'rejected': self.rejected}
+
+
+class RetryPolicy:
+    def __init__(self, retries=2, delay=0.5, call_timeout=60.0, total_timeout=120.0):
+        self.retries = retries
+        self.delay = delay
+        self.call_timeout = call_timeout
+        self.total_timeout = total_timeout
+
+    def backoff(self, retry):
+        return random.uniform(0, self.delay * 2 ** retry)
+
+
+def with_timeout(config, seconds):
+    """`config` (a GenerateContentConfig or None) with its HTTP timeout set to `seconds`."""
+    http_options = types.HttpOptions(timeout=max(1, int(seconds * 1000)))
+    if config is None:
+        return types.GenerateContentConfig(http_options=http_options)
+    return config.model_copy(update={'http_options': http_options})
+
+
+class ResilientClient:
+    def __init__(self, client, breaker=None, policy=None):
+        self.client = client
+        self.breaker = breaker or CircuitBreaker()
+        self.policy = policy or RetryPolicy()
+        self.attempts = 0
+        self.retries = 0
+        self.models = ResilientModels(self)
+        self.aio = AsyncResilientClient(self)
+
+    def _attempts(self):
+        """Yield the timeout for each attempt while the breaker and the deadline allow one."""
+        deadline = time.monotonic() + self.policy.total_timeout
+        for retry in range(self.policy.retries + 1):
+            if retry:
+                self.retries += 1
+            self.breaker.check()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError('Gemini did not answer in time.')
+            self.attempts += 1
+            yield retry, min(self.policy.call_timeout, remaining), deadline
+
+    def _should_retry(self, exc, retry, deadline):
+        """Record a failed attempt; return the backoff before the next one, or None to give up."""
+        if not is_retryable(exc):
+            # Gemini answered; the request itself was at fault.
+            self.breaker.record_success()
+            return None
+        self.breaker.record_failure()
+        if retry >= self.policy.retries:
+            return None
+        backoff = self.policy.backoff(retry)
+        return backoff if time.monotonic() + backoff < deadline else None
+
+    def call(self, attempt, config):
+        """Run `attempt(config)` with per-attempt deadlines, retries and the breaker."""
+        for retry, timeout, deadline in self._attempts():
+            try:
+                result = attempt(with_timeout(config, timeout))
+            except Exception as exc:
+                backoff = self._should_retry(exc, retry, deadline)
+                if backoff is None:
+                    raise
+                time.sleep(backoff)
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, attempt, config):
+        """`call` for coroutine `attempt`s."""
+        for retry, timeout, deadline in self._attempts():
+            try:
+                result = await attempt(with_timeout(config, timeout))
+            except Exception as exc:
+                backoff = self._should_retry(exc, retry, deadline)
+                if backoff is None:
+                    raise
+                await asyncio.sleep(backoff)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def stats(self):
+        return {'attempts': self.attempts, 'retries': self.retries, 'breaker': self.breaker.stats()}
+
+
+class ResilientModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate_content(self, model, contents, config=None):
+        models = self._owner.client.models
+        return self._owner.call(lambda config: models.generate_content(model=model, contents=contents, config=config), config)
+
+    def generate_content_stream(self, model, contents, config=None):
+        models = self._owner.client.models
+
+        def first_chunk(config):
+            stream = models.generate_content_stream(model=model, contents=contents, config=config)
+            return stream, next(stream, None)
+
+        stream, chunk = self._owner.call(first_chunk, config)
+        try:
+            if chunk is not None:
+                yield chunk
+                yield from stream
+        finally:
+            stream.close()
+
+
+class AsyncResilientModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def generate_content(self, model, contents, config=None):
+        models = self._owner.client.aio.models
+        return await self._owner.acall(lambda config: models.generate_content(model=model, contents=contents, config=config), config)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        models = self._owner.client.aio.models
+
+        async def first_chunk(config):
+            stream = await models.generate_content_stream(model=model, contents=contents, config=config)
+            return stream, await anext(stream, None)
+
+        stream, chunk = await self._owner.acall(first_chunk, config)
+
+        async def rest():
+            try:
+                if chunk is not None:
+                    yield chunk
+                    async for more in stream:
+                        yield more
+            finally:
+                await stream.aclose()
+        return rest()
+
+
+class AsyncResilientClient:
+    def __init__(self, owner):
+        self.models = AsyncResilientModels(owner)
+
+
+def build_client(api_key, base_url='', max_connections=20):
+    """A google.genai.Client on pooled connections, optionally against another endpoint (e.g. the fake server)."""
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    http_options = types.HttpOptions(
+        base_url=base_url or None,
+        client_args={'limits': limits},
+        async_client_args={'limits': limits},
+    )
+    return genai.Client(api_key=api_key, http_options=http_options)
@@ -0,0 +1,278 @@
+import functools
+import hashlib
+import time
+from typing import NamedTuple
+
+import pygments
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import models
+from django.dispatch import receiver
+from pygments import format as format_tokens
+from pygments.filter import apply_filters
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name
+from pygments.token import Text
+
+from .caching import InstancePool, LRUCache
+from .executor import get_highlight_executor
+
+# Bump whenever formatter options change so stored HTML is detected as stale.
+RENDER_REVISION = 1
+
+
+def markup_mode():
+    return 'css' if settings.HIGHLIGHT_CSS_CLASSES else 'inline'
+
+
+def current_render_version():
+    """Stamp stored next to rendered HTML; a mismatch means it must be rebuilt."""
+    return f'{RENDER_REVISION}-{markup_mode()}-{pygments.__version__}'
+
+
+def style_class(style):
+    """CSS class that scopes a style's rules, so several styles can share a page."""
+    return f'highlight-{style}'
+
+
+class CompactHtmlFormatter(HtmlFormatter):
+    """
+    Class-based formatter that tags a token only with the class of its nearest
+    styled ancestor. Tokens the style leaves uncoloured become plain text and
+    neighbours sharing a class merge into one span, as with inline styles.
+    """
+
+    def _get_css_classes(self, ttype):
+        return self._get_css_inline_styles(ttype)
+
+
+def make_formatter(style, linenos, mode):
+    if mode == 'css':
+        return CompactHtmlFormatter(style=style, linenos=linenos, cssclass=style_class(style))
+    return HtmlFormatter(style=style, linenos=linenos, noclasses=True)
+
+
+# Building a lexer means an alias lookup and building a formatter recomputes
+# the style tables, so both are reused across renders.
+lexer_pool = InstancePool(get_lexer_by_name, max_keys=64)
+formatter_pool = InstancePool(make_formatter, max_keys=64)
+
+
+@functools.cache
+def stylesheet(style):
+    """
+    Rules for class-based markup in `style`, built once per style and process.
+    Raises pygments.util.ClassNotFound for unknown styles.
+    """
+    with formatter_pool.acquire((style, False, 'css')) as formatter:
+        return formatter.get_style_defs(f'.{style_class(style)}')
+
+
+class HighlightCache:
+    """
+    Content-addressed cache of rendered HTML.
+
+    Keys are a hash of the code, the render options and the Pygments version, so
+    identical pastes share one entry no matter which snippet they belong to. The
+    first tier is a bounded in-process LRU; the optional second tier is a Django
+    cache alias shared by every gunicorn worker.
+    """
+
+    def __init__(self, max_entries, max_bytes=None, alias='', timeout=None):
+        self.local = LRUCache(max_entries=max_entries, max_weight=max_bytes)
+        self.alias = alias
+        self.timeout = timeout
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(code, **options):
+        digest = hashlib.sha256(pygments.__version__.encode())
+        for name in sorted(options):
+            digest.update(f'\0{name}={options[name]!r}'.encode())
+        digest.update(b'\0')
+        digest.update(code.encode('utf-8', 'surrogatepass'))
+        return f'highlight:{digest.hexdigest()}'
+
+    @property
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def get(self, key):
+        html = self.local.get(key)
+        if html is not None:
+            return html
+        if self.shared is not None:
+            html = self.shared.get(key)
+            if html is not None:
+                self.shared_hits += 1
+                self.local.set(key, html)
+                return html
+        self.misses += 1
+        return None
+
+    def set(self, key, html):
+        self.local.set(key, html)
+        if self.shared is not None:
+            self.shared.set(key, html, self.timeout)
+
+    def clear(self):
+        self.local.clear()
+        self.shared_hits = self.misses = 0
+
+    def stats(self):
+        local = self.local.stats()
+        return {
+            'hits': local['hits'] + self.shared_hits,
+            'local_hits': local['hits'],
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'evictions': local['evictions'],
+            'entries': local['entries'],
+            'bytes': local['weight'],
+        }
+
+
+_highlight_cache = None
+
+
+def get_highlight_cache():
+    global _highlight_cache
+    if _highlight_cache is None:
+        _highlight_cache = HighlightCache(
+            max_entries=settings.HIGHLIGHT_CACHE_SIZE,
+            max_bytes=settings.HIGHLIGHT_CACHE_MAX_BYTES,
+            alias=settings.HIGHLIGHT_CACHE_ALIAS,
+            timeout=settings.HIGHLIGHT_CACHE_TIMEOUT,
+        )
+    return _highlight_cache
+
+
+@receiver(setting_changed)
+def _reset_highlight_cache(setting, **kwargs):
+    global _highlight_cache
+    if setting.startswith('HIGHLIGHT_CACHE'):
+        _highlight_cache = None
+
+
+class RenderOutcome(models.TextChoices):
+    FULL = 'full', 'Full'
+    # The time budget ran out; the rest of the code is plain text.
+    TRUNCATED = 'truncated', 'Truncated'
+    # Over the size budget; the whole code is plain text.
+    SKIPPED = 'skipped', 'Skipped'
+
+
+class RenderBudget(NamedTuple):
+    """Limits for one render. None lifts a limit."""
+    max_bytes: int | None = None
+    max_lines: int | None = None
+    max_seconds: float | None = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls(settings.HIGHLIGHT_MAX_BYTES, settings.HIGHLIGHT_MAX_LINES, settings.HIGHLIGHT_MAX_SECONDS)
+
+    def allows_size(self, code):
+        if self.max_lines is not None and code.count('\n') + 1 > self.max_lines:
+            return False
+        # Every character is at least one byte, so most code never needs encoding.
+        if self.max_bytes is not None and len(code) * 4 > self.max_bytes:
+            return len(code.encode('utf-8', 'surrogatepass')) <= self.max_bytes
+        return True
+
+
+class Highlight(NamedTuple):
+    html: str
+    outcome: str = RenderOutcome.FULL
+
+
+class BudgetedTokens:
+    """
+    The lexer's token stream, cut off once `deadline` passes: the code not lexed
+    yet becomes one plain Text token. The clock is only checked every
+    `check_every` tokens, and a single slow regex match cannot be interrupted.
+    """
+
+    def __init__(self, lexer, code, deadline, check_every=64):
+        self.lexer = lexer
+        self.code = code
+        self.deadline = deadline
+        self.check_every = check_every
+        self.truncated = False
+
+    def __iter__(self):
+        # What Lexer.get_tokens does, keeping the offsets needed to cut off.
+        text = self.lexer._preprocess_lexer_input(self.code)
+        yield from apply_filters(self._tokens(text), self.lexer.filters, self.lexer)
+
+    def _tokens(self, text):
+        for count, (index, ttype, value) in enumerate(self.lexer.get_tokens_unprocessed(text)):
+            if self.deadline is not None and count % self.check_every == 0 and time.monotonic() > self.deadline:
+                self.truncated = True
+                yield Text, text[index:]
+                return
+            yield ttype, value
+
+
+def highlight_code(code, language, style, linenos, mode, first_line=1, budget=RenderBudget()):
+    """
+    Render `code` with pooled lexer and formatter instances, without caching,
+    within `budget`. Code over the size budget is not lexed at all. Returns a
+    Highlight; runs in executor workers.
+    """
+    start = time.monotonic()
+    with lexer_pool.acquire((language,)) as lexer, formatter_pool.acquire((style, linenos, mode)) as formatter:
+        # The formatter is checked out exclusively, so it can be adjusted for this render.
+        formatter.linenostart = first_line
+        try:
+            if not budget.allows_size(code):
+                return Highlight(format_tokens([(Text, code)], formatter), RenderOutcome.SKIPPED)
+            deadline = start + budget.max_seconds if budget.max_seconds is not None else None
+            tokens = BudgetedTokens(lexer, code, deadline)
+            html = format_tokens(tokens, formatter)
+            return Highlight(html, RenderOutcome.TRUNCATED if tokens.truncated else RenderOutcome.FULL)
+        finally:
+            formatter.linenostart = 1
+
+
+def render_highlight(code, language, style, linenos, first_line=1, timeout=None, wait=True, budget=None):
+    """
+    Render `code` to HTML, reusing a cached render of the same code and options
+    when one exists. Markup is inline-styled, or class-based (paired with
+    `stylesheet(style)`) when HIGHLIGHT_CSS_CLASSES is set. `first_line` numbers
+    a fragment that starts further down the document.
+    """
+    return render_highlight_result(code, language, style, linenos, first_line, timeout, wait, budget).html
+
+
+def render_highlight_result(code, language, style, linenos, first_line=1, timeout=None, wait=True, budget=None):
+    """
+    Like render_highlight, but returns a Highlight telling whether the render
+    stayed within `budget` (the HIGHLIGHT_MAX_* settings by default). Only
+    full renders are cached, so a fallback can be upgraded with a larger budget.
+
+    Cache misses run on the highlight executor. Callers wait up to `timeout`
+    seconds (HIGHLIGHT_TIMEOUT by default) for the result, and with `wait`
+    also for a free slot, before HighlightUnavailable is raised; a render that
+    finishes after its caller gave up is still cached.
+    """
+    mode = markup_mode()
+    first_line = first_line if linenos else 1
+    cache = get_highlight_cache()
+    key = cache.make_key(code, language=language, style=style, linenos=linenos, mode=mode, first_line=first_line)
+    html = cache.get(key)
+    if html is not None:
+        return Highlight(html)
+
+    def store(result):
+        if result.outcome == RenderOutcome.FULL:
+            cache.set(key, result.html)
+
+    budget = RenderBudget.from_settings() if budget is None else budget
+    timeout = settings.HIGHLIGHT_TIMEOUT if timeout is None else timeout
+    return get_highlight_executor().run(
+        (key, budget), highlight_code, code, language, style, linenos, mode, first_line, budget,
+        timeout=timeout, wait=timeout if wait else None, on_done=store,
+    )
@@ -0,0 +1,63 @@
+"""
+Line-offset index for snippet code.
+
+Instead of one offset per line, the index keeps the character offset of every
+`LINE_INDEX_STRIDE`-th line start, so a range of lines can be located by
+reading only the blocks that contain it.
+"""
+from rest_framework.exceptions import ValidationError
+
+LINE_INDEX_STRIDE = 256
+
+
+def build_line_index(code, stride=LINE_INDEX_STRIDE):
+    """Return (line_count, offsets) with offsets of lines 1, 1 + stride, 1 + 2 * stride, ..."""
+    if not code:
+        return 0, []
+    offsets = [0]
+    count = 1
+    position = code.find('\n')
+    while position != -1 and position + 1 < len(code):
+        if count % stride == 0:
+            offsets.append(position + 1)
+        count += 1
+        position = code.find('\n', position + 1)
+    return count, offsets
+
+
+def block_bounds(offsets, start, end, stride=LINE_INDEX_STRIDE):
+    """
+    Character span (begin, finish) covering lines start..end, plus the number of
+    lines to skip at the beginning of that span. `finish` is None for "to the end".
+    """
+    first_block = (start - 1) // stride
+    last_block = (end - 1) // stride + 1
+    finish = offsets[last_block] if last_block < len(offsets) else None
+    return offsets[first_block], finish, start - 1 - first_block * stride
+
+
+def take_lines(text, skip, count):
+    """Lines skip + 1 .. skip + count of `text`, keeping their line endings."""
+    parts = text.split('\n')
+    selected = '\n'.join(parts[skip:skip + count])
+    if skip + count < len(parts):
+        selected += '\n'
+    return selected
+
+
+def parse_line_range(value):
+    """
+    Parse `?lines=` values: "START-END", "START-" (to the end) or "N" (one line).
+    Returns (start, end) with end None for open ranges, or None when not given.
+    """
+    if not value:
+        return None
+    start, sep, end = value.partition('-')
+    try:
+        start = int(start)
+        end = (int(end) if end else None) if sep else start
+    except ValueError:
+        raise ValidationError({'lines': 'Expected START-END, START- or a single line number.'})
+    if start < 1 or (end is not None and end < start):
+        raise ValidationError({'lines': 'Line numbers start at 1 and END must not be before START.'})
+    return start, end
@@ -0,0 +1,176 @@
+import asyncio
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class KeyedLock:
+    """
+    Hands out one lock per key so threads working on the same object serialize
+    while unrelated keys proceed in parallel. Locks are dropped once nobody
+    holds or waits on them, so the table does not grow with every key seen.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+        self._users = defaultdict(int)
+
+    @contextmanager
+    def __call__(self, key):
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+            self._users[key] += 1
+        try:
+            with lock:
+                yield
+        finally:
+            with self._guard:
+                self._users[key] -= 1
+                if not self._users[key]:
+                    del self._users[key]
+                    del self._locks[key]
+
+
+class Flight:
+    """
+    One call in progress, shared through SingleFlight. Waiters read `result`,
+    or `error`, once it has landed; neither is set if the caller leading it
+    gave up part way.
+    """
+
+    def __init__(self):
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._futures = []
+
+    def land(self, result=None, error=None):
+        with self._lock:
+            self.result, self.error = result, error
+            self._done.set()
+            futures, self._futures = self._futures, []
+        for loop, future in futures:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # That event loop has closed.
+
+    def wait(self, timeout=None):
+        """Block until the flight has landed; False if `timeout` passed first."""
+        return self._done.wait(timeout)
+
+    async def await_landing(self, timeout=None):
+        """`wait` for coroutines, without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._done.is_set():
+                return True
+            future = loop.create_future()
+            self._futures.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except TimeoutError:
+            return False
+        return True
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    """
+    Lets concurrent callers wanting the same result share one call. The
+    first caller for a key leads: it makes the call and lands the flight
+    with the outcome. Callers arriving meanwhile get the same flight to wait
+    on. Works across threads and event loops alike.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._flights = {}
+        self.led = 0
+        self.joined = 0
+
+    def begin(self, key):
+        """Return `(flight, leading)`; the leader must pass the flight to `end`."""
+        with self._guard:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.joined += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.led += 1
+            return flight, True
+
+    def follow(self, key):
+        """The flight in progress for `key` to wait on, or None; unlike `begin`, never leads."""
+        with self._guard:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.joined += 1
+            return flight
+
+    def __contains__(self, key):
+        with self._guard:
+            return key in self._flights
+
+    def end(self, key, flight, result=None, error=None):
+        with self._guard:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.land(result, error)
+
+    def stats(self):
+        return {'in_flight': len(self._flights), 'led': self.led, 'joined': self.joined}
+
+
+class Notifier:
+    """
+    Wakes the threads and coroutines waiting for something to change (such
+    as a slot freeing up) as soon as it does, rather than each looking again
+    on a timer. Waiters pass the `generation` they last looked at, so a
+    notice sent in between is not missed, and a timeout for changes that
+    happen elsewhere (another process) and send no notice.
+    """
+
+    def __init__(self):
+        self._changed = threading.Condition()
+        self._futures = set()
+        self.generation = 0
+
+    def notify(self):
+        with self._changed:
+            self.generation += 1
+            self._changed.notify_all()
+            futures, self._futures = self._futures, set()
+        for loop, future in futures:
+            try:
+                loop.call_soon_threadsafe(_resolve, future)
+            except RuntimeError:
+                pass  # That event loop has closed.
+
+    def wait(self, generation, timeout):
+        """Block until notified after `generation`; False if `timeout` passed first."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.generation != generation, timeout)
+
+    async def await_notice(self, generation, timeout):
+        """`wait` for coroutines, without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        with self._changed:
+            if self.generation != generation:
+                return True
+            waiter = (loop, loop.create_future())
+            self._futures.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout)
+        except TimeoutError:
+            return False
+        finally:
+            with self._changed:
+                self._futures.discard(waiter)
+        return True
@@ -0,0 +1,87 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from snippets.executor import HighlightUnavailable
+from snippets.highlighting import RenderBudget, RenderOutcome, current_render_version
+from snippets.models import HighlightState, Rendering, Snippet
+
+
+class Command(BaseCommand):
+    help = 'Render snippets whose highlighted HTML is pending, optionally including stale renders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--stale', action='store_true', help='Also rebuild HTML produced by an older render version.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new work instead of exiting once the queue is empty.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep between polls in --loop mode.')
+        parser.add_argument('--upgrade', action='store_true', help='First retry renders that fell back to plain text, with the budget below.')
+        parser.add_argument('--max-seconds', type=float, default=60.0, help='Time budget per upgraded render.')
+        parser.add_argument('--max-bytes', type=int, default=None, help='Size budget for upgraded renders (default: unlimited).')
+        parser.add_argument('--max-lines', type=int, default=None, help='Line budget for upgraded renders (default: unlimited).')
+
+    def handle(self, *args, **options):
+        total = 0
+        if options['upgrade']:
+            budget = RenderBudget(options['max_bytes'], options['max_lines'], options['max_seconds'])
+            upgraded = self.upgrade_fallbacks(options['batch_size'], budget)
+            self.stdout.write(f'Upgraded {upgraded} plain-text render(s).')
+        while True:
+            rendered = self.drain_batch(options['batch_size'])
+            if options['stale']:
+                rendered += self.drain_stale_batch(options['batch_size'])
+            total += rendered
+            if rendered:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(f'Rendered {total} snippet(s).')
+
+    def drain_batch(self, batch_size):
+        with transaction.atomic():
+            # skip_locked lets several drainers (and first reads) share the queue.
+            queue = Snippet.objects.filter(highlight_state=HighlightState.PENDING)
+            batch = list(queue.order_by('pk').select_for_update(skip_locked=True)[:batch_size])
+            rendered = [snippet for snippet in batch if self.try_render(snippet)]
+            Snippet.objects.bulk_update(rendered, Snippet.RENDER_FIELDS)
+        return len(rendered)
+
+    def drain_stale_batch(self, batch_size):
+        """Rebuild renderings from an older render version; each is shared by every snippet using it."""
+        with transaction.atomic():
+            queue = Rendering.objects.exclude(render_version=current_render_version()).select_related('content')
+            batch = list(queue.order_by('pk').select_for_update(skip_locked=True, of=('self',))[:batch_size])
+            rendered = [rendering for rendering in batch if self.try_render(rendering)]
+            Rendering.objects.bulk_update(rendered, Rendering.RENDER_FIELDS)
+        return len(rendered)
+
+    def upgrade_fallbacks(self, batch_size, budget):
+        """
+        Re-render every truncated or skipped rendering once, in pk order, and
+        return how many now have full highlighting. Renders that exceed the
+        budget again keep their fallback until the next upgrade run.
+        """
+        # The executor must not give up before the budget does.
+        timeout = settings.HIGHLIGHT_TIMEOUT + (budget.max_seconds or 0)
+        last_pk, upgraded = 0, 0
+        while True:
+            with transaction.atomic():
+                queue = Rendering.objects.exclude(outcome=RenderOutcome.FULL).filter(pk__gt=last_pk).select_related('content')
+                batch = list(queue.order_by('pk').select_for_update(skip_locked=True, of=('self',))[:batch_size])
+                if not batch:
+                    return upgraded
+                last_pk = batch[-1].pk
+                rendered = [rendering for rendering in batch if self.try_render(rendering, timeout=timeout, budget=budget)]
+                Rendering.objects.bulk_update(rendered, Rendering.RENDER_FIELDS)
+            upgraded += sum(rendering.outcome == RenderOutcome.FULL for rendering in rendered)
+
+    def try_render(self, obj, **kwargs):
+        try:
+            obj.render(**kwargs)
+        except HighlightUnavailable as e:
+            self.stderr.write(f'Skipped {obj._meta.model_name} {obj.pk}: {e.detail}')
+            return False
+        return True
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from snippets.fake_gemini import FakeGeminiServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve a fake Gemini API for load tests, with injectable latency and errors. '
+        'Point the app at it with GEMINI_BASE_URL (any GEMINI_API_KEY will do).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=2.0, help='Seconds each answer takes.')
+        parser.add_argument('--jitter', type=float, default=0.25, help='Share by which the latency varies either way.')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of requests answered with --error-status.')
+        parser.add_argument('--error-status', type=int, default=503)
+
+    def handle(self, *args, **options):
+        server = FakeGeminiServer(
+            (options['host'], options['port']), latency=options['latency'], jitter=options['jitter'],
+            failure_rate=options['failure_rate'], error_status=options['error_status'],
+        )
+        self.stdout.write(f'Fake Gemini listening on {server.url}; set GEMINI_BASE_URL={server.url}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Served {server.requests} request(s), failed {server.failures}.')
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Length
+
+from snippets.models import Rendering, Snippet, SnippetContent
+
+
+class Command(BaseCommand):
+    help = 'Delete snippet contents no snippet or review refers to (with their renderings) and report deduplication.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help='Recompute reference counts from the snippets and reviews tables first. Run it while no snippets are being written.')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting it.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['recount']:
+                drifted = SnippetContent.objects.annotate(
+                    refs=Count('snippets', distinct=True) + Count('reviews', distinct=True),
+                ).exclude(ref_count=F('refs'))
+                fixed = 0
+                for content in drifted.only('pk'):
+                    if not options['dry_run']:
+                        SnippetContent.objects.filter(pk=content.pk).update(ref_count=content.refs)
+                    fixed += 1
+                self.stdout.write(f'Fixed {fixed} reference count(s).')
+            # A content being acquired already has ref_count > 0 before its snippet is saved.
+            garbage = SnippetContent.objects.filter(ref_count=0, snippets=None, reviews=None)
+            count = garbage.count()
+            if not options['dry_run']:
+                garbage.delete()
+        self.stdout.write(f'{"Would delete" if options["dry_run"] else "Deleted"} {count} unreferenced content(s).')
+        self.report()
+
+    def report(self):
+        snippets = Snippet.objects.count()
+        contents = SnippetContent.objects.count()
+        renderings = Rendering.objects.count()
+        stored = SnippetContent.objects.aggregate(size=Sum(Length('code')))['size'] or 0
+        undeduplicated = Snippet.objects.aggregate(size=Sum(Length('content__code')))['size'] or 0
+        html = Rendering.objects.aggregate(size=Sum(Length('html')))['size'] or 0
+        undeduplicated_html = Snippet.objects.aggregate(size=Sum(Length('rendering__html')))['size'] or 0
+        self.stdout.write(f'{snippets} snippet(s) share {contents} content(s) and {renderings} rendering(s).')
+        if contents:
+            self.stdout.write(f'Dedup ratio {snippets / contents:.2f}: code {stored / 1024:.1f} KiB stored vs {undeduplicated / 1024:.1f} KiB per-row, '
+                              f'HTML {html / 1024:.1f} KiB vs {undeduplicated_html / 1024:.1f} KiB.')
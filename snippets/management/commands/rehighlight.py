@@ -0,0 +1,103 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from snippets.highlighting import RenderBudget, current_render_version, highlight_code, markup_mode
+from snippets.models import Rendering, Snippet
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-render stored highlighted HTML, e.g. after a Pygments upgrade or a formatter change. '
+        'Walks renderings in primary key order and can resume from a checkpoint file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--language', help='Only renderings in this language.')
+        parser.add_argument('--style', help='Only renderings in this style.')
+        parser.add_argument('--owner', help='Only renderings used by this user\'s snippets.')
+        parser.add_argument('--stale', action='store_true', help='Only renderings produced by an older render version.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Render processes; 0 renders in this process.')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Renderings read, rendered and written per chunk.')
+        parser.add_argument('--rate', type=float, default=None, help='Maximum renderings per second.')
+        parser.add_argument('--checkpoint', type=Path, help='File recording progress; an existing one is resumed from.')
+        parser.add_argument('--max-seconds', type=float, default=60.0, help='Time budget per render.')
+        parser.add_argument('--max-bytes', type=int, default=None, help='Size budget per render (default: unlimited).')
+        parser.add_argument('--max-lines', type=int, default=None, help='Line budget per render (default: unlimited).')
+
+    def handle(self, *args, **options):
+        filters = {name: options[name] for name in ('language', 'style', 'owner', 'stale')}
+        state = self.load_checkpoint(options['checkpoint'], filters)
+        budget = RenderBudget(options['max_bytes'], options['max_lines'], options['max_seconds'])
+        queryset = self.get_queryset(filters).filter(pk__gt=state['last_pk']).order_by('pk').select_related('content')
+        # One iterator over the whole walk: on PostgreSQL it reads through a
+        # server-side cursor, so memory stays at one chunk.
+        rows = queryset.iterator(chunk_size=options['chunk_size'])
+        pool = None
+        if options['workers']:
+            pool = ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('spawn'))
+        started = time.monotonic()
+        rendered_this_run = 0
+        try:
+            while chunk := list(islice(rows, options['chunk_size'])):
+                self.render_chunk(chunk, budget, pool)
+                rendered_this_run += len(chunk)
+                state['last_pk'] = chunk[-1].pk
+                state['rendered'] += len(chunk)
+                self.save_checkpoint(options['checkpoint'], state)
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f'Rendered {state["rendered"]} rendering(s), up to pk {state["last_pk"]}.')
+                if options['rate']:
+                    # Sleep off any lead over the allowed rate before the next chunk.
+                    time.sleep(max(0.0, rendered_this_run / options['rate'] - (time.monotonic() - started)))
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        if options['checkpoint'] is not None:
+            options['checkpoint'].unlink(missing_ok=True)
+        self.stdout.write(f'Rendered {state["rendered"]} rendering(s).')
+
+    def get_queryset(self, filters):
+        queryset = Rendering.objects.all()
+        if filters['language']:
+            queryset = queryset.filter(language=filters['language'])
+        if filters['style']:
+            queryset = queryset.filter(style=filters['style'])
+        if filters['owner']:
+            queryset = queryset.filter(pk__in=Snippet.objects.filter(owner__username=filters['owner']).values('rendering_id'))
+        if filters['stale']:
+            queryset = queryset.exclude(render_version=current_render_version())
+        return queryset
+
+    def render_chunk(self, chunk, budget, pool):
+        mode = markup_mode()
+        jobs = [(rendering.content.code, rendering.language, rendering.style, rendering.linenos, mode, 1, budget) for rendering in chunk]
+        # highlight_code is sent to the workers by reference; its module loads without the app registry.
+        results = (pool.map if pool is not None else map)(highlight_code, *zip(*jobs))
+        version = current_render_version()
+        for rendering, (html, outcome) in zip(chunk, results):
+            rendering.html, rendering.outcome, rendering.render_version = html, outcome, version
+        Rendering.objects.bulk_update(chunk, Rendering.RENDER_FIELDS)
+
+    def load_checkpoint(self, path, filters):
+        if path is None or not path.exists():
+            return {'filters': filters, 'last_pk': 0, 'rendered': 0}
+        state = json.loads(path.read_text())
+        if state['filters'] != filters:
+            raise CommandError(f'{path} was written with filters {state["filters"]}; pass the same filters or remove it.')
+        self.stdout.write(f'Resuming after pk {state["last_pk"]} ({state["rendered"]} rendering(s) already done).')
+        return state
+
+    def save_checkpoint(self, path, state):
+        if path is None:
+            return
+        # Write then rename, so an interruption never leaves a torn file.
+        partial = path.with_name(path.name + '.tmp')
+        partial.write_text(json.dumps(state))
+        os.replace(partial, path)
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from snippets.models import ReviewJob, ReviewStatus
+from snippets.reviews import reap_stale_jobs, run_review_job
+
+
+class Command(BaseCommand):
+    help = (
+        'Run review jobs still queued in the database, e.g. ones a web process accepted '
+        'but exited before starting. Running jobs past REVIEW_TIMEOUT are failed first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=60.0, help='Only jobs queued at least this many seconds ago.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new work instead of exiting once the queue is empty.')
+        parser.add_argument('--interval', type=float, default=10.0, help='Seconds to sleep between polls in --loop mode.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            reaped = reap_stale_jobs()
+            if reaped:
+                self.stdout.write(f'Failed {reaped} job(s) that ran past the timeout.')
+            cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+            queued = list(ReviewJob.objects.filter(status=ReviewStatus.QUEUED, created__lte=cutoff).order_by('pk').values_list('pk', flat=True))
+            # Claiming is atomic, so a job picked up by a web process meanwhile is skipped.
+            for job_id in queued:
+                run_review_job(job_id)
+            total += len(queued)
+            if queued:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(f'Processed {total} queued review job(s).')
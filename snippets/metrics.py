@@ -0,0 +1,224 @@
+"""
+Counters and histograms of the model calls behind AI reviews.
+
+Every call to Gemini is timed with a ModelCall: how long it took and, for
+streams, how long until the first chunk arrived; the prompt and response
+tokens reported in the response's `usage_metadata`; and whether it
+succeeded, failed (counted by error class) or was cancelled part way.
+Lookups of stored reviews are counted as hits and misses. The values are
+kept per process and served in the Prometheus text format at /metrics/.
+
+Each call and cache lookup is also logged to the `snippets.metrics` logger
+as one line of JSON, with the user, snippet and job it was made for, so
+usage can be added up per user.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SECONDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+TOKENS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+
+def format_labels(labels):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}' if labels else ''
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f'{self.name} takes the labels {", ".join(self.labels)}.')
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.extend(self.samples(list(zip(self.labels, key)), value))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self, labels, value):
+        yield f'{self.name}_total{format_labels(labels)} {format_value(value)}'
+
+
+class Histogram(Metric):
+    """Counts observations into cumulative `buckets` (upper bounds), with their sum."""
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=SECONDS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, one over the last bucket, and the sum.
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-2] += 1
+            counts[-1] += value
+
+    def count(self, **labels):
+        counts = self._values.get(self._key(labels))
+        return sum(counts[:-1]) if counts else 0
+
+    def sum(self, **labels):
+        counts = self._values.get(self._key(labels))
+        return counts[-1] if counts else 0
+
+    def samples(self, labels, counts):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), counts):
+            cumulative += count
+            yield f'{self.name}_bucket{format_labels([*labels, ("le", bound)])} {cumulative}'
+        yield f'{self.name}_sum{format_labels(labels)} {format_value(counts[-1])}'
+        yield f'{self.name}_count{format_labels(labels)} {cumulative}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        return ''.join(metric.render() + '\n' for metric in self.metrics)
+
+
+registry = Registry()
+
+ai_calls = registry.add(Counter(
+    'snippets_ai_calls', 'Calls to the model, by outcome (ok, error or cancelled).',
+    ('model', 'phase', 'mode', 'outcome'),
+))
+ai_errors = registry.add(Counter('snippets_ai_errors', 'Failed calls to the model, by error class.', ('model', 'error')))
+ai_call_seconds = registry.add(Histogram(
+    'snippets_ai_call_seconds', 'Wall time of calls to the model, retries included.', ('model', 'phase', 'mode'),
+))
+ai_first_token_seconds = registry.add(Histogram(
+    'snippets_ai_first_token_seconds', 'Time until the first chunk of a streamed answer.', ('model', 'phase'),
+))
+ai_tokens = registry.add(Histogram(
+    'snippets_ai_tokens', 'Tokens per call reported by the model, by kind (prompt or response).',
+    ('model', 'phase', 'kind'), buckets=TOKENS,
+))
+review_cache = registry.add(Counter('snippets_review_cache', 'Lookups of stored reviews, by result (hit or miss).', ('result',)))
+
+
+def log_event(event, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'event': event, **fields}, default=str))
+
+
+def record_cache_lookup(hit, context=None):
+    result = 'hit' if hit else 'miss'
+    review_cache.inc(result=result)
+    log_event('review_cache', result=result, **(context or {}))
+
+
+class ModelCall:
+    """
+    Records one call to the model when its block ends. Pass each response,
+    or each chunk of a stream, to `record`. A block ending with an
+    exception counts as an error of that class, or of the class of the
+    exception it was raised from; one closed early (the generator or task
+    around it went away) counts as cancelled. `context` is logged with it.
+    """
+
+    def __init__(self, model, phase='review', stream=False, context=None):
+        self.model = model or ''
+        self.phase = phase
+        self.mode = 'stream' if stream else 'generate'
+        self.context = context or {}
+        self.started = None
+        self.first_chunk = None
+        self.usage = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def record(self, response):
+        if self.first_chunk is None:
+            self.first_chunk = time.perf_counter() - self.started
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            # Streams report running totals; the last one counts.
+            self.usage = usage
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.started
+        error = None
+        if exc is None:
+            outcome = 'ok'
+        elif isinstance(exc, (GeneratorExit, asyncio.CancelledError)):
+            outcome = 'cancelled'
+        else:
+            outcome = 'error'
+            error = type(exc.__cause__ or exc).__name__
+            ai_errors.inc(model=self.model, error=error)
+        ai_calls.inc(model=self.model, phase=self.phase, mode=self.mode, outcome=outcome)
+        ai_call_seconds.observe(seconds, model=self.model, phase=self.phase, mode=self.mode)
+        first_chunk = self.first_chunk if self.mode == 'stream' else None
+        if first_chunk is not None:
+            ai_first_token_seconds.observe(first_chunk, model=self.model, phase=self.phase)
+        prompt_tokens = getattr(self.usage, 'prompt_token_count', None)
+        response_tokens = getattr(self.usage, 'candidates_token_count', None)
+        for kind, tokens in (('prompt', prompt_tokens), ('response', response_tokens)):
+            if tokens is not None:
+                ai_tokens.observe(tokens, model=self.model, phase=self.phase, kind=kind)
+        log_event(
+            'ai_call', model=self.model, phase=self.phase, mode=self.mode, outcome=outcome, error=error,
+            seconds=round(seconds, 4), first_token_seconds=None if first_chunk is None else round(first_chunk, 4),
+            prompt_tokens=prompt_tokens, response_tokens=response_tokens, **self.context,
+        )
+        return False
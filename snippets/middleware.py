@@ -0,0 +1,37 @@
+"""
+WhiteNoise, usable in async middleware chains.
+
+WhiteNoiseMiddleware is sync-only. Under ASGI, Django adapts a sync
+middleware by running it, and everything after it in the chain, in the one
+thread that thread-sensitive code shares, so every request in the process
+took turns there and the async review views ran one at a time. Serving a
+static file needs no waiting, so this subclass does the same lookup in an
+async `__call__` and hands other requests straight on.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
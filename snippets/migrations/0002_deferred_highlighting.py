@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snippet',
+            name='highlight_state',
+            field=models.CharField(choices=[('ready', 'Ready'), ('pending', 'Pending')], default='ready', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='render_version',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:09
+
+import snippets.registry
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0002_deferred_highlighting'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='snippet',
+            name='language',
+            field=models.CharField(choices=snippets.registry.language_choices, default='python', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='snippet',
+            name='style',
+            field=models.CharField(choices=snippets.registry.style_choices, default='colorful', max_length=100),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+from snippets.lines import build_line_index
+
+
+def index_existing_snippets(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    for snippet in Snippet.objects.only('pk', 'code').iterator(chunk_size=200):
+        snippet.line_count, snippet.line_index = build_line_index(snippet.code)
+        snippet.save(update_fields=['line_count', 'line_index'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0003_lazy_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='snippet',
+            name='line_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='line_index',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(index_existing_snippets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+import snippets.fields
+
+PREVIEW_LENGTH = 100
+
+
+def compress_existing_snippets(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    batch = []
+    for snippet in Snippet.objects.only('pk', 'plain_code', 'plain_highlighted').iterator(chunk_size=200):
+        snippet.code = snippet.plain_code
+        snippet.highlighted = snippet.plain_highlighted
+        snippet.code_preview = snippet.plain_code[:PREVIEW_LENGTH + 1]
+        batch.append(snippet)
+        if len(batch) == 200:
+            Snippet.objects.bulk_update(batch, ['code', 'highlighted', 'code_preview'])
+            batch = []
+    Snippet.objects.bulk_update(batch, ['code', 'highlighted', 'code_preview'])
+
+
+def decompress_existing_snippets(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    batch = []
+    for snippet in Snippet.objects.only('pk', 'code', 'highlighted').iterator(chunk_size=200):
+        snippet.plain_code = snippet.code
+        snippet.plain_highlighted = snippet.highlighted
+        batch.append(snippet)
+        if len(batch) == 200:
+            Snippet.objects.bulk_update(batch, ['plain_code', 'plain_highlighted'])
+            batch = []
+    Snippet.objects.bulk_update(batch, ['plain_code', 'plain_highlighted'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0004_line_index'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='snippet',
+            old_name='code',
+            new_name='plain_code',
+        ),
+        migrations.RenameField(
+            model_name='snippet',
+            old_name='highlighted',
+            new_name='plain_highlighted',
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='code',
+            field=snippets.fields.CompressedTextField(default=b''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='highlighted',
+            field=snippets.fields.CompressedTextField(default=b''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='code_preview',
+            field=models.CharField(blank=True, default='', editable=False, max_length=101),
+        ),
+        migrations.RunPython(compress_existing_snippets, decompress_existing_snippets),
+        # blank=True gives the columns an empty default when unapplying.
+        migrations.AlterField(
+            model_name='snippet',
+            name='plain_code',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='snippet',
+            name='plain_highlighted',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RemoveField(
+            model_name='snippet',
+            name='plain_code',
+        ),
+        migrations.RemoveField(
+            model_name='snippet',
+            name='plain_highlighted',
+        ),
+    ]
@@ -0,0 +1,135 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:29
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import snippets.fields
+from snippets.lines import build_line_index
+
+
+def move_code_to_content(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    SnippetContent = apps.get_model('snippets', 'SnippetContent')
+    Rendering = apps.get_model('snippets', 'Rendering')
+    batch = []
+    fields = ['pk', 'code', 'highlighted', 'highlight_state', 'render_version', 'language', 'style', 'linenos']
+    for snippet in Snippet.objects.only(*fields).iterator(chunk_size=200):
+        digest = hashlib.sha256(snippet.code.encode('utf-8', 'surrogatepass')).hexdigest()
+        content = SnippetContent.objects.filter(digest=digest).first()
+        if content is None:
+            line_count, line_index = build_line_index(snippet.code)
+            content = SnippetContent.objects.create(digest=digest, code=snippet.code, line_count=line_count, line_index=line_index)
+        SnippetContent.objects.filter(pk=content.pk).update(ref_count=models.F('ref_count') + 1)
+        snippet.content = content
+        if snippet.highlight_state == 'ready':
+            snippet.rendering, _ = Rendering.objects.get_or_create(
+                content=content, language=snippet.language, style=snippet.style, linenos=snippet.linenos,
+                defaults={'html': snippet.highlighted, 'render_version': snippet.render_version},
+            )
+        batch.append(snippet)
+        if len(batch) == 200:
+            Snippet.objects.bulk_update(batch, ['content', 'rendering'])
+            batch = []
+    Snippet.objects.bulk_update(batch, ['content', 'rendering'])
+
+
+def copy_content_back(apps, schema_editor):
+    Snippet = apps.get_model('snippets', 'Snippet')
+    batch = []
+    for snippet in Snippet.objects.select_related('content', 'rendering').iterator(chunk_size=200):
+        snippet.code = snippet.content.code
+        snippet.line_count = snippet.content.line_count
+        snippet.line_index = snippet.content.line_index
+        snippet.highlighted = snippet.rendering.html if snippet.rendering else ''
+        snippet.render_version = snippet.rendering.render_version if snippet.rendering else ''
+        batch.append(snippet)
+        if len(batch) == 200:
+            Snippet.objects.bulk_update(batch, ['code', 'line_count', 'line_index', 'highlighted', 'render_version'])
+            batch = []
+    Snippet.objects.bulk_update(batch, ['code', 'line_count', 'line_index', 'highlighted', 'render_version'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0005_compressed_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnippetContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('code', snippets.fields.CompressedTextField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('line_count', models.PositiveIntegerField(default=0)),
+                ('line_index', models.JSONField(blank=True, default=list)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Rendering',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(max_length=100)),
+                ('style', models.CharField(max_length=100)),
+                ('linenos', models.BooleanField(default=False)),
+                ('html', snippets.fields.CompressedTextField()),
+                ('render_version', models.CharField(blank=True, default='', max_length=32)),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renderings', to='snippets.snippetcontent')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content', 'language', 'style', 'linenos'), name='unique_rendering')],
+            },
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='content',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='snippets', to='snippets.snippetcontent'),
+        ),
+        migrations.AddField(
+            model_name='snippet',
+            name='rendering',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='snippets', to='snippets.rendering'),
+        ),
+        migrations.RunPython(move_code_to_content, copy_content_back),
+        migrations.AlterField(
+            model_name='snippet',
+            name='content',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='snippets', to='snippets.snippetcontent'),
+        ),
+        # Defaults give the columns a value when unapplying.
+        migrations.AlterField(
+            model_name='snippet',
+            name='code',
+            field=snippets.fields.CompressedTextField(default=b''),
+        ),
+        migrations.AlterField(
+            model_name='snippet',
+            name='highlighted',
+            field=snippets.fields.CompressedTextField(default=b''),
+        ),
+        migrations.RemoveField(
+            model_name='snippet',
+            name='code',
+        ),
+        migrations.RemoveField(
+            model_name='snippet',
+            name='highlighted',
+        ),
+        migrations.RemoveField(
+            model_name='snippet',
+            name='line_count',
+        ),
+        migrations.RemoveField(
+            model_name='snippet',
+            name='line_index',
+        ),
+        migrations.RemoveField(
+            model_name='snippet',
+            name='render_version',
+        ),
+    ]
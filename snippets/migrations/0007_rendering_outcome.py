@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0006_content_dedup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rendering',
+            name='outcome',
+            field=models.CharField(choices=[('full', 'Full'), ('truncated', 'Truncated'), ('skipped', 'Skipped')], default='full', max_length=16),
+        ),
+    ]
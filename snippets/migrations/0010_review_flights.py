@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0009_review_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewFlight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('started', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
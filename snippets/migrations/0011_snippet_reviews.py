@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('snippets', '0010_review_flights'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewjob',
+            name='full',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='reviewjob',
+            name='incremental',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='SnippetReview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('review', models.TextField()),
+                ('updates', models.PositiveSmallIntegerField(default=0)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='reviews', to='snippets.snippetcontent')),
+                ('snippet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='last_review', to='snippets.snippet')),
+            ],
+        ),
+    ]
@@ -1,36 +1,473 @@
+import hashlib
 import uuid
 
-from django.db import models
-from pygments import highlight
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import get_all_lexers, get_lexer_by_name
-from pygments.styles import get_all_styles
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Substr
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import registry
+from .executor import HighlightUnavailable
+from .fields import CompressedTextField, iter_decompressed
+from .detection import AUTO_LANGUAGE, detect_language
+from .highlighting import RenderOutcome, current_render_version, render_highlight, render_highlight_result
+from .lines import block_bounds, build_line_index, take_lines
+from .locks import KeyedLock
+
+_render_lock = KeyedLock()
+
+PREVIEW_LENGTH = 100
+
+
+def content_digest(code):
+    return hashlib.sha256(code.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class HighlightState(models.TextChoices):
+    READY = 'ready', 'Ready'
+    PENDING = 'pending', 'Pending'
+
+
+class ChunkedColumnsModel(models.Model):
+    """Chunked reads of compressed text columns, for values too large to load at once."""
+
+    class Meta:
+        abstract = True
+
+    def read_column(self, field, start=0, length=None):
+        """Read part of a column's stored (compressed) bytes in SQL, without loading the whole value."""
+        output = models.BinaryField()
+        part = Substr(field, start + 1, length, output_field=output) if length is not None else Substr(field, start + 1, output_field=output)
+        return type(self)._default_manager.filter(pk=self.pk).annotate(part=part).values_list('part', flat=True).get()
+
+    def iter_column(self, field, chunk_size=1024 * 1024):
+        """Yield a compressed text column as text, reading and decompressing one stored chunk per query."""
+        return iter_decompressed(self._iter_stored(field, chunk_size))
+
+    def _iter_stored(self, field, chunk_size):
+        start = 0
+        while True:
+            chunk = self.read_column(field, start, chunk_size) or b''
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+            start += chunk_size
+
+
+class SnippetContentManager(models.Manager):
+    def acquire(self, code):
+        """Return the content row for `code`, creating it if needed, and count one more reference to it."""
+        digest = content_digest(code)
+        while True:
+            content = self.filter(digest=digest).first()
+            if content is None:
+                line_count, line_index = build_line_index(code)
+                content, _ = self.get_or_create(digest=digest, defaults={'code': code, 'line_count': line_count, 'line_index': line_index})
+            # The row may have been collected between the lookup and the increment; look it up again.
+            if self.filter(pk=content.pk).update(ref_count=F('ref_count') + 1):
+                content.ref_count += 1
+                return content
+
+    def release(self, pk):
+        """Drop one reference to a content row and delete it once no snippet or review refers to it."""
+        self.filter(pk=pk, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        self.filter(pk=pk, ref_count=0, snippets=None, reviews=None).delete()
+
+
+class SnippetContent(ChunkedColumnsModel):
+    """
+    Code shared by every snippet whose text is identical, addressed by its
+    SHA-256 digest, together with its line index.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    code = CompressedTextField()
+    created = models.DateTimeField(auto_now_add=True)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    # Sparse line-offset index, see snippets.lines
+    line_count = models.PositiveIntegerField(default=0)
+    line_index = models.JSONField(default=list, blank=True)
+
+    objects = SnippetContentManager()
+
+    def __str__(self):
+        return self.digest[:12]
+
+
+class Rendering(ChunkedColumnsModel):
+    """Highlighted HTML of a content for one set of render options, shared by every snippet using them."""
+    content = models.ForeignKey(SnippetContent, related_name='renderings', on_delete=models.CASCADE)
+    language = models.CharField(max_length=100)
+    style = models.CharField(max_length=100)
+    linenos = models.BooleanField(default=False)
+    html = CompressedTextField()
+    render_version = models.CharField(max_length=32, blank=True, default='')
+    # Whether the render stayed within its budget or fell back to plain text.
+    outcome = models.CharField(max_length=16, choices=RenderOutcome.choices, default=RenderOutcome.FULL)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content', 'language', 'style', 'linenos'], name='unique_rendering'),
+        ]
+
+    @property
+    def is_current(self):
+        return self.render_version == current_render_version()
+
+    RENDER_FIELDS = ['html', 'render_version', 'outcome']
+
+    def render(self, timeout=None, wait=True, budget=None):
+        result = render_highlight_result(self.content.code, self.language, self.style, self.linenos, timeout=timeout, wait=wait, budget=budget)
+        self.html, self.outcome = result
+        self.render_version = current_render_version()
 
-LEXERS = [item for item in get_all_lexers() if item[1]]
-LANGUAGE_CHOICES = sorted([(item[1][0], item[0]) for item in LEXERS])
-STYLES = sorted((item, item) for item in get_all_styles())
 
 class Snippet(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     title = models.CharField(max_length=100, blank=True, default='')
-    code = models.TextField()
+    content = models.ForeignKey(SnippetContent, related_name='snippets', on_delete=models.PROTECT)
     linenos = models.BooleanField(default=False)
-    language = models.CharField(choices=LANGUAGE_CHOICES, default='python', max_length=100)
-    style = models.CharField(choices=STYLES, default='colorful', max_length=100)
+    language = models.CharField(choices=registry.language_choices, default='python', max_length=100)
+    style = models.CharField(choices=registry.style_choices, default='colorful', max_length=100)
     owner = models.ForeignKey('auth.User', related_name='snippets', on_delete=models.CASCADE)
-    highlighted = models.TextField()
+    rendering = models.ForeignKey(Rendering, related_name='snippets', null=True, blank=True, on_delete=models.SET_NULL)
+    # Uncompressed start of the code for the list view; one extra character
+    # tells whether the code was cut off.
+    code_preview = models.CharField(max_length=PREVIEW_LENGTH + 1, blank=True, default='', editable=False)
+
+    # Fields for deferred highlighting
+    highlight_state = models.CharField(max_length=16, choices=HighlightState.choices, default=HighlightState.READY)
 
     # Fields for sharing
-    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True) 
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     shared_password = models.CharField(max_length=50, blank=True, null=True)
 
+    RENDER_FIELDS = ['rendering', 'highlight_state']
+    # Changing any of these needs a different rendering; other fields are metadata.
+    RENDER_INPUTS = ['content_id', 'language', 'style', 'linenos']
+
     class Meta:
         ordering = ['created']
 
-    def save(self, *args, **kwargs):    
-        lexer = get_lexer_by_name(self.language)
-        formatter = HtmlFormatter(style=self.style, linenos=self.linenos, noclasses=True)
-        self.highlighted = highlight(self.code, lexer, formatter)
+    def __init__(self, *args, **kwargs):
+        # Code assigned but not yet stored; None means "read it from content".
+        self._code = None
+        # Column values as last read from or written to the database, by
+        # attname; None until the instance has been loaded or saved.
+        self._loaded = None
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded = {name: value for name, value in zip(field_names, values) if value is not models.DEFERRED}
+        return instance
+
+    def _snapshot(self, attnames=None):
+        loaded = self._loaded if attnames is not None and self._loaded is not None else {}
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__ and (attnames is None or field.attname in attnames):
+                loaded[field.attname] = self.__dict__[field.attname]
+        self._loaded = loaded
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        # Lazily loaded deferred columns arrive here too; they are not edits.
+        self._snapshot(None if fields is None else self._attnames(fields))
+
+    def _attnames(self, names):
+        return {getattr(self._meta.get_field(name), 'attname', name) for name in names}
+
+    def dirty_fields(self):
+        """
+        Attnames of the columns changed since the row was loaded, or None when
+        that is unknown (a new instance, or one built by hand).
+        """
+        if self._loaded is None:
+            return None
+        return [
+            field.attname for field in self._meta.concrete_fields
+            if field.attname in self.__dict__ and self._loaded.get(field.attname, models.DEFERRED) != self.__dict__[field.attname]
+        ]
+
+    @property
+    def code(self):
+        if self._code is None:
+            return self.content.code if self.content_id else ''
+        return self._code
+
+    @code.setter
+    def code(self, value):
+        self._code = value
+
+    @property
+    def highlighted(self):
+        return self.rendering.html if self.rendering_id else ''
+
+    @property
+    def render_version(self):
+        return self.rendering.render_version if self.rendering_id else ''
+
+    @property
+    def highlight_outcome(self):
+        return self.rendering.outcome if self.rendering_id else ''
+
+    @property
+    def line_count(self):
+        return self.content.line_count if self.content_id else 0
+
+    @property
+    def line_index(self):
+        return self.content.line_index if self.content_id else []
+
+    def save(self, *args, **kwargs):
+        previous = self.content_id
+        if self.language == AUTO_LANGUAGE:
+            self.language = detect_language(self.code, filename=self.title)
+        code, acquired = self._code, None
+        if code is not None:
+            acquired = self._store_code(code)
+        try:
+            self._save(*args, **kwargs)
+        except BaseException:
+            if acquired is not None:
+                self._give_back(acquired, previous, code)
+            raise
+        if previous is not None and previous != self.content_id:
+            SnippetContent.objects.release(previous)
+
+    def _save(self, *args, **kwargs):
+        if self._state.adding or self._loaded is None:
+            dirty = None
+        elif kwargs.get('update_fields') is not None:
+            dirty = self._attnames(kwargs['update_fields'])
+        else:
+            dirty = self.dirty_fields()
+        # Metadata edits (title, sharing) keep the current rendering.
+        if dirty is None or set(dirty) & set(self.RENDER_INPUTS):
+            self._attach_rendering()
         if not self.uuid:
             self.uuid = uuid.uuid4()
+        if dirty is not None and kwargs.get('update_fields') is None:
+            # Write only the changed columns; nothing changed means no query at all.
+            kwargs['update_fields'] = self.dirty_fields()
+            if not kwargs['update_fields']:
+                return
         super().save(*args, **kwargs)
+        self._snapshot(None if kwargs.get('update_fields') is None else self._attnames(kwargs['update_fields']))
+
+    def _attach_rendering(self):
+        if settings.HIGHLIGHT_DEFERRED:
+            # A duplicate paste can still pick up an existing current render.
+            rendering = self._find_rendering()
+            self.rendering = rendering if rendering is not None and rendering.is_current else None
+            self.highlight_state = HighlightState.READY if self.rendering else HighlightState.PENDING
+            return
+        try:
+            self.render(timeout=settings.HIGHLIGHT_SAVE_WAIT, wait=False)
+        except HighlightUnavailable:
+            # The executor is saturated or the render is slow; the first
+            # read or drain_highlights picks it up from the cache later.
+            self.rendering = None
+            self.highlight_state = HighlightState.PENDING
+
+    def _store_code(self, code):
+        """
+        Point at the shared content row for `code`, unless the current one
+        already holds it. Returns the row if a reference to it was taken.
+        """
+        self._code = None
+        if not self.content_id or self.content.digest != content_digest(code):
+            self.content = SnippetContent.objects.acquire(code)
+            self.code_preview = code[:PREVIEW_LENGTH + 1]
+            return self.content
+        return None
+
+    def _give_back(self, content, previous, code):
+        """Undo _store_code after a failed save, so the row is not referenced forever and a retry stores `code` again."""
+        self.content_id = previous
+        self._code = code
+        # A transaction being rolled back takes the increment with it.
+        if not transaction.get_connection().needs_rollback:
+            SnippetContent.objects.release(content.pk)
+
+    def _find_rendering(self):
+        return Rendering.objects.filter(content=self.content, language=self.language, style=self.style, linenos=self.linenos).first()
+
+    def render(self, timeout=None, wait=True):
+        """Attach the shared rendering for the current options, building it only if it is missing or stale."""
+        rendering, _ = Rendering.objects.get_or_create(content=self.content, language=self.language, style=self.style, linenos=self.linenos)
+        if not rendering.is_current:
+            rendering.render(timeout=timeout, wait=wait)
+            rendering.save(update_fields=Rendering.RENDER_FIELDS)
+        self.rendering = rendering
+        self.highlight_state = HighlightState.READY
+
+    @property
+    def needs_render(self):
+        return self.highlight_state == HighlightState.PENDING or not self.rendering_id or not self.rendering.is_current
+
+    def ensure_highlighted(self):
+        """
+        Return the highlighted HTML, rendering it first if it is pending or was
+        produced by an older render version. Concurrent callers render only once:
+        threads in this process queue on a per-snippet lock and other processes
+        on the row lock, and both re-check the row before rendering.
+        """
+        if not self.needs_render:
+            return self.highlighted
+        with _render_lock(self.pk), transaction.atomic():
+            current = Snippet.objects.select_for_update().get(pk=self.pk)
+            if current.needs_render:
+                current.render()
+                Snippet.objects.filter(pk=self.pk).update(**{field: getattr(current, field) for field in self.RENDER_FIELDS})
+        for field in self.RENDER_FIELDS:
+            setattr(self, field, getattr(current, field))
+        self._snapshot(self._attnames(self.RENDER_FIELDS))
+        return self.highlighted
+
+    @property
+    def rendered_highlight(self):
+        return self.ensure_highlighted()
+
+    def iter_highlighted(self):
+        """Yield the highlighted HTML in chunks, streamed from the database when it was not loaded."""
+        if self.needs_render or 'html' not in self.rendering.get_deferred_fields():
+            yield self.ensure_highlighted()
+        else:
+            yield from self.rendering.iter_column('html')
+
+    def code_lines(self, start, end=None):
+        """
+        Lines start..end (1-based, inclusive) of the code. When the code was not
+        loaded, it is decompressed from the database only up to the indexed
+        block that ends the range.
+        """
+        end = min(end or self.line_count, self.line_count)
+        if start > end:
+            return ''
+        begin, finish, skip = block_bounds(self.line_index, start, end)
+        if self._code is None and 'code' in self.content.get_deferred_fields():
+            parts, size = [], 0
+            for chunk in self.content.iter_column('code', chunk_size=64 * 1024):
+                parts.append(chunk)
+                size += len(chunk)
+                if finish is not None and size >= finish:
+                    break
+            text = ''.join(parts)[begin:finish]
+        else:
+            text = self.code[begin:finish]
+        return take_lines(text, skip, end - start + 1)
+
+    def render_lines(self, start, end=None):
+        """Highlight only lines start..end, numbered from `start`.
+
+        The lexer starts fresh at `start`, so a range that begins inside a
+        multi-line construct (a docstring, say) may colour its first lines
+        differently from the full render.
+        """
+        return render_highlight(self.code_lines(start, end), self.language, self.style, self.linenos, first_line=start)
+
+
+class ReviewStatus(models.TextChoices):
+    QUEUED = 'queued', 'Queued'
+    RUNNING = 'running', 'Running'
+    DONE = 'done', 'Done'
+    FAILED = 'failed', 'Failed'
+
+
+class ReviewJob(models.Model):
+    """
+    One AI review of a snippet, run in the background by snippets.reviews.
+
+    A running job holds one of the REVIEW_CONCURRENCY slots; the partial unique
+    constraint on `slot` is what keeps every process together under that limit.
+    """
+    snippet = models.ForeignKey(Snippet, related_name='review_jobs', on_delete=models.CASCADE)
+    requested_by = models.ForeignKey('auth.User', related_name='review_jobs', on_delete=models.CASCADE)
+    status = models.CharField(max_length=16, choices=ReviewStatus.choices, default=ReviewStatus.QUEUED)
+    slot = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    # Ask the model again even if a stored review of this code exists.
+    refresh = models.BooleanField(default=False)
+    # Answered from a stored review rather than a new model call.
+    cached = models.BooleanField(default=False)
+    # Review the whole code, not only what changed since the last review.
+    full = models.BooleanField(default=False)
+    # Made by updating the snippet's last review from a diff of its code.
+    incremental = models.BooleanField(default=False)
+    result = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    FINISHED = (ReviewStatus.DONE, ReviewStatus.FAILED)
+
+    class Meta:
+        ordering = ['created']
+        constraints = [
+            models.UniqueConstraint(fields=['slot'], condition=Q(status='running'), name='one_review_per_slot'),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED
+
+
+class ReviewResult(models.Model):
+    """
+    A model's review of some code, reused for every later review of identical
+    code with the same model and prompt. See snippets.ai_review.ReviewCache.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    prompt_version = models.PositiveSmallIntegerField()
+    review = models.TextField()
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.key[:12]
+
+
+class ReviewFlight(models.Model):
+    """
+    A model call in progress for a ReviewResult key. The unique key lets one
+    process at a time ask for a given review; the others wait for it to be
+    stored. See snippets.ai_review.ReviewCache.lease.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    started = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.key[:12]
+
+
+class SnippetReview(models.Model):
+    """
+    The latest review of a snippet and the code it was made for, from which
+    the next review after an edit can be updated (see snippets.diffing). The
+    reviewed code is shared content, held by reference like a snippet's.
+    """
+    snippet = models.OneToOneField(Snippet, related_name='last_review', on_delete=models.CASCADE)
+    content = models.ForeignKey(SnippetContent, related_name='reviews', on_delete=models.PROTECT)
+    review = models.TextField()
+    # Incremental reviews made since the last review of the whole code.
+    updates = models.PositiveSmallIntegerField(default=0)
+    created = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.snippet_id}@{self.content}'
+
+
+@receiver(post_delete, sender=Snippet)
+def _release_content(sender, instance, **kwargs):
+    SnippetContent.objects.release(instance.content_id)
+
+
+@receiver(post_delete, sender=SnippetReview)
+def _release_reviewed_content(sender, instance, **kwargs):
+    SnippetContent.objects.release(instance.content_id)
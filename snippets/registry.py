@@ -0,0 +1,117 @@
+"""
+Precomputed registry of Pygments languages and styles.
+
+Enumerating lexers and styles walks every Pygments module and plugin entry
+point, which used to happen on every import of snippets.models. The result is
+stored in pygments_registry.json, written at build time by
+
+    python -m snippets.registry
+
+and only read at runtime. If it was made for another Pygments version than
+the installed one, each process rebuilds it in memory, leaving the file be.
+"""
+import functools
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import pygments
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_PATH = Path(__file__).with_name('pygments_registry.json')
+
+
+def build_extensions():
+    """Map each plain `*.ext` filename pattern to the languages claiming it."""
+    from pygments.lexers import get_all_lexers
+
+    extensions = {}
+    for _, aliases, filenames, _ in get_all_lexers():
+        for pattern in filenames if aliases else ():
+            ext = pattern[2:].lower()
+            if pattern.startswith('*.') and ext and not any(char in ext for char in '*?[') and aliases[0] not in extensions.get(ext, ()):
+                extensions.setdefault(ext, []).append(aliases[0])
+    return extensions
+
+
+def build_registry():
+    from pygments.lexers import get_all_lexers
+    from pygments.styles import get_all_styles
+
+    return {
+        'pygments': pygments.__version__,
+        'languages': sorted([aliases[0], name] for name, aliases, *_ in get_all_lexers() if aliases),
+        'styles': sorted(get_all_styles()),
+        'extensions': build_extensions(),
+    }
+
+
+def write_registry(path=REGISTRY_PATH):
+    """Build the registry for the installed Pygments and replace the file at `path` with it in one step."""
+    registry = build_registry()
+    with tempfile.NamedTemporaryFile('w', dir=path.parent, prefix=f'.{path.name}.', delete=False) as tmp:
+        tmp.write(json.dumps(registry) + '\n')
+    try:
+        os.replace(tmp.name, path)
+    except OSError:
+        os.unlink(tmp.name)
+        raise
+    return registry
+
+
+@functools.cache
+def load_registry():
+    try:
+        registry = json.loads(REGISTRY_PATH.read_text())
+    except (OSError, ValueError):
+        registry = None
+    if registry is None or registry.get('pygments') != pygments.__version__:
+        logger.warning('%s is missing or not for Pygments %s; run `python -m snippets.registry` to update it.', REGISTRY_PATH, pygments.__version__)
+        registry = build_registry()
+    return registry
+
+
+def language_choices():
+    return [tuple(item) for item in load_registry()['languages']]
+
+
+def style_choices():
+    return [(style, style) for style in load_registry()['styles']]
+
+
+@functools.cache
+def languages():
+    return frozenset(alias for alias, _ in load_registry()['languages'])
+
+
+@functools.cache
+def styles():
+    return frozenset(load_registry()['styles'])
+
+
+@functools.cache
+def extensions():
+    # Registries written before extensions were recorded lack the key.
+    return load_registry().get('extensions') or build_extensions()
+
+
+def languages_for_filename(filename):
+    """Languages whose lexers claim `filename`'s extension, in Pygments' lexer order."""
+    _, dot, ext = filename.rpartition('.')
+    return extensions().get(ext.lower(), []) if dot else []
+
+
+def is_language(name):
+    return name in languages()
+
+
+def is_style(name):
+    return name in styles()
+
+
+if __name__ == '__main__':
+    written = write_registry()
+    print(f'Wrote {REGISTRY_PATH}: {len(written["languages"])} languages, {len(written["styles"])} styles for Pygments {written["pygments"]}.')
@@ -0,0 +1,793 @@
+"""
+Background AI reviews.
+
+A Gemini review takes seconds to tens of seconds, nearly all of it spent
+waiting on the network. Making the call inside the request held a Gunicorn
+worker for that whole time, so a few review clicks could stall the API for
+everyone. Instead a review request only records a ReviewJob and answers 202.
+A small thread pool in each process makes the calls, and clients poll (or
+long-poll) the job until it has finished.
+
+Each process limits itself to REVIEW_WORKERS running and REVIEW_QUEUE_SIZE
+waiting jobs. Across all processes, at most REVIEW_CONCURRENCY calls run at
+once: a job must claim a numbered slot before calling the model, and the
+database will not let two running jobs hold the same slot.
+
+Each snippet's last review is kept with the code it was made for
+(SnippetReview), so after a small edit the next job only asks the model to
+update it from a diff (see snippets.diffing), unless the job is `full`.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .ai_review import (
+    ReviewError, ReviewSource, afollow_review, areview_code, astream_review, follow_review, get_review_cache, review_code,
+    review_in_flight, stream_review,
+)
+from .diffing import review_diff
+from .locks import Notifier
+from .models import ReviewJob, ReviewStatus, SnippetContent, SnippetReview
+from .streaming import iter_events, sse_event
+
+logger = logging.getLogger(__name__)
+
+# How often a client long-polling a job looks again.
+POLL_INTERVAL = 0.25
+# Slots freed in this process wake the jobs waiting for one at once; this is
+# how often they look again for slots freed by other processes.
+SLOT_POLL_INTERVAL = 1.0
+
+# Notified whenever a slot may have freed up in this process.
+_slot_freed = Notifier()
+
+
+class ReviewUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many reviews are waiting, try again shortly.'
+    default_code = 'review_unavailable'
+
+
+def reap_stale_jobs():
+    """Fail running jobs older than REVIEW_TIMEOUT, e.g. left behind by a killed worker, freeing their slots."""
+    cutoff = timezone.now() - timedelta(seconds=settings.REVIEW_TIMEOUT)
+    reaped = ReviewJob.objects.filter(status=ReviewStatus.RUNNING, started__lt=cutoff).update(
+        status=ReviewStatus.FAILED, slot=None, error='Review timed out.', finished=timezone.now(),
+    )
+    if reaped:
+        _slot_freed.notify()
+    return reaped
+
+
+def try_claim(job_id, reap=True):
+    """
+    Move a queued job to running in a free slot, after reaping stale jobs
+    unless `reap` is false. Returns the job, or None if every slot is taken;
+    raises ReviewJob.DoesNotExist if the job is gone or no longer queued
+    (claimed elsewhere).
+    """
+    if reap:
+        reap_stale_jobs()
+    taken = set(ReviewJob.objects.filter(status=ReviewStatus.RUNNING).values_list('slot', flat=True))
+    for slot in range(settings.REVIEW_CONCURRENCY):
+        if slot in taken:
+            continue
+        try:
+            with transaction.atomic():
+                claimed = ReviewJob.objects.filter(pk=job_id, status=ReviewStatus.QUEUED).update(
+                    status=ReviewStatus.RUNNING, slot=slot, started=timezone.now(),
+                )
+        except IntegrityError:
+            # Another process took this slot since we looked.
+            continue
+        if not claimed:
+            raise ReviewJob.DoesNotExist(job_id)
+        return ReviewJob.objects.select_related('snippet').get(pk=job_id)
+    return None
+
+
+class SlotClaim:
+    """
+    One queued job's attempts at claiming a slot within `wait` seconds,
+    shared by claim_slot and aclaim_slot. Each `attempt` is one round of
+    queries; between them the job waits for a slot to free up in this
+    process, or `pause` seconds for one freed by another.
+
+    Stale jobs are reaped on the first attempt only: under load many jobs
+    wait at once, and each attempt is a query of its own already.
+    """
+
+    def __init__(self, job_id, wait):
+        self.job_id = job_id
+        self.deadline = time.monotonic() + wait
+        self.reap = True
+        self.generation = None
+        self.job = None
+
+    def attempt(self):
+        """True once the claim is settled, with the running job in `job` if it succeeded."""
+        # Taken first, so a slot freed during the attempt still wakes the wait after it.
+        self.generation = _slot_freed.generation
+        try:
+            self.job = try_claim(self.job_id, self.reap)
+        except ReviewJob.DoesNotExist:
+            return True
+        if self.job is not None:
+            return True
+        if time.monotonic() >= self.deadline:
+            finish_job(self.job_id, ReviewStatus.FAILED, error='The review service is busy, try again later.', running=False)
+            return True
+        self.reap = False
+        return False
+
+    @property
+    def pause(self):
+        return min(SLOT_POLL_INTERVAL, max(0.0, self.deadline - time.monotonic()))
+
+
+def claim_slot(job_id, wait):
+    """
+    Claim a slot for a queued job, waiting up to `wait` seconds for one.
+    Returns the running job, or None if it is gone, was claimed elsewhere or
+    no slot freed up in time (it is then failed).
+    """
+    claim = SlotClaim(job_id, wait)
+    while not claim.attempt():
+        _slot_freed.wait(claim.generation, claim.pause)
+    return claim.job
+
+
+async def aclaim_slot(job_id, wait):
+    """claim_slot for async views: waits on the event loop rather than in a thread."""
+    claim = SlotClaim(job_id, wait)
+    while not await sync_to_async(claim.attempt)():
+        await _slot_freed.await_notice(claim.generation, claim.pause)
+    return claim.job
+
+
+def finish_job(job_id, outcome, result='', error='', running=True, incremental=False, cached=False):
+    current = ReviewStatus.RUNNING if running else ReviewStatus.QUEUED
+    finished = ReviewJob.objects.filter(pk=job_id, status=current).update(
+        status=outcome, slot=None, result=result, error=error, incremental=incremental, cached=cached, finished=timezone.now(),
+    )
+    if finished and running:
+        _slot_freed.notify()
+
+
+def fail_unfinished(job_ids, error):
+    """Fail those of the jobs that have not finished, queued or running, freeing their slots."""
+    if ReviewJob.objects.filter(pk__in=job_ids, status__in=[ReviewStatus.QUEUED, ReviewStatus.RUNNING]).update(
+        status=ReviewStatus.FAILED, slot=None, error=error, finished=timezone.now(),
+    ):
+        _slot_freed.notify()
+
+
+def last_review_diff(job, code):
+    """
+    The diff to update the snippet's last review from, for a review of
+    `code`, and the number of updates the new review will have been
+    through. The diff is None when the code is to be reviewed whole: for
+    `full` jobs, without a last review, after REVIEW_DIFF_MAX_UPDATES
+    updates in a row, or when the edit is too large (see snippets.diffing).
+    """
+    if job.full or not settings.REVIEW_DIFF_MAX_UPDATES:
+        return None, 0
+    last = SnippetReview.objects.select_related('content').filter(snippet_id=job.snippet_id).first()
+    if last is None or last.updates >= settings.REVIEW_DIFF_MAX_UPDATES:
+        return None, 0
+    diff = review_diff(last.content.code, code, last.review, settings.REVIEW_DIFF_CONTEXT, settings.REVIEW_DIFF_MAX_RATIO)
+    return diff, 0 if diff is None else last.updates + 1
+
+
+def remember_review(snippet, review, updates):
+    """Keep `review` as the snippet's last review, of its current content."""
+    try:
+        with transaction.atomic():
+            if not SnippetContent.objects.filter(pk=snippet.content_id).update(ref_count=F('ref_count') + 1):
+                return  # Edited away and collected since the job read it.
+            previous = SnippetReview.objects.filter(snippet_id=snippet.pk).values_list('content_id', flat=True).first()
+            SnippetReview.objects.update_or_create(snippet_id=snippet.pk, defaults={
+                'content_id': snippet.content_id, 'review': review, 'updates': updates, 'created': timezone.now(),
+            })
+    except IntegrityError:
+        # The snippet was deleted, or another job remembered its review first.
+        return
+    if previous is not None:
+        SnippetContent.objects.release(previous)
+
+
+def open_review(snippet, user, full=False, refresh=False):
+    """
+    Record the job for a review of `snippet` asked for by `user`. Unless
+    `refresh` (or `full`) is set, a stored review of its code finishes the
+    job straight away; otherwise it is left queued for the caller to run,
+    or to claim a slot for and stream (see review_events).
+    """
+    refresh = refresh or full
+    context = {'user': user.pk, 'snippet': snippet.pk}
+    review = None if refresh else get_review_cache().get(snippet.content.digest, context=context)
+    if review is None:
+        return ReviewJob.objects.create(snippet=snippet, requested_by=user, refresh=refresh, full=full)
+    now = timezone.now()
+    return ReviewJob.objects.create(
+        snippet=snippet, requested_by=user, status=ReviewStatus.DONE,
+        result=review, cached=True, started=now, finished=now,
+    )
+
+
+def finished_events(job):
+    """The Server-Sent Events streaming a finished job's outcome in one piece."""
+    if job.status == ReviewStatus.FAILED:
+        return [sse_event('error', {'detail': job.error})]
+    return [sse_event('chunk', job.result), sse_event('done', {'id': job.pk, 'status': job.status, 'cached': job.cached})]
+
+
+def review_events(job):
+    """
+    The Server-Sent Events of a job from open_review. Streamed reviews run
+    in the request, but still within the global limit: without a free slot
+    right away this raises ReviewUnavailable. A job whose review is being
+    asked for already needs no slot; it waits for that call (follow_job)
+    and streams the review in one piece.
+    """
+    if job.is_finished:
+        return finished_events(job)
+    if _review_in_flight(job):
+        return JobStream(job.pk, _follow_events(job))
+    claimed = claim_slot(job.pk, wait=0)
+    if claimed is None:
+        raise ReviewUnavailable('The review service is busy, try again shortly.')
+    return stream_job(claimed)
+
+
+async def areview_events(job):
+    """review_events for async views."""
+    if job.is_finished:
+        return iter_events(*finished_events(job))
+    if await sync_to_async(_review_in_flight)(job):
+        return AsyncJobStream(job.pk, _afollow_events(job))
+    claimed = await aclaim_slot(job.pk, wait=0)
+    if claimed is None:
+        raise ReviewUnavailable('The review service is busy, try again shortly.')
+    return astream_job(claimed)
+
+
+def _review_in_flight(job):
+    try:
+        code = job.snippet.code
+        diff, _ = last_review_diff(job, code)
+        return review_in_flight(code, diff)
+    except Exception:
+        fail_unfinished([job.pk], 'The review failed unexpectedly.')
+        raise
+
+
+def _follow_events(job):
+    if follow_job(job):
+        job.refresh_from_db()
+        yield from finished_events(job)
+        return
+    # The call ended without a review; ask for it with a slot of its own.
+    claimed = claim_slot(job.pk, wait=0)
+    if claimed is None:
+        yield sse_event('error', {'detail': 'The review service is busy, try again shortly.'})
+        return
+    yield from _job_events(claimed)
+
+
+async def _afollow_events(job):
+    if await afollow_job(job):
+        await job.arefresh_from_db()
+        for event in finished_events(job):
+            yield event
+        return
+    claimed = await aclaim_slot(job.pk, wait=0)
+    if claimed is None:
+        yield sse_event('error', {'detail': 'The review service is busy, try again shortly.'})
+        return
+    events = _ajob_events(claimed)
+    try:
+        async for event in events:
+            yield event
+    finally:
+        await events.aclose()
+
+
+def job_context(job):
+    """Who and what a job's model calls are made for, as logged by snippets.metrics."""
+    return {'user': job.requested_by_id, 'snippet': job.snippet_id, 'job': job.pk}
+
+
+class JobRun:
+    """
+    One job's review, from when it is claimed (or, with running=False,
+    followed while still queued) until its outcome is recorded. The sync
+    and async paths share it and differ only in how they wait on the model;
+    its methods query the database, so async callers run them through
+    sync_to_async.
+    """
+
+    def __init__(self, job, running=True):
+        self.job = job
+        self.running = running
+        self.source = ReviewSource()
+        self.code = None
+        self.diff = None
+        self.updates = 0
+        # What a stream has relayed so far, and why it stopped short, if it did.
+        self.deadline = time.monotonic() + settings.REVIEW_TIMEOUT
+        self.parts = []
+        self.error = 'The client went away before the review finished.'
+        self.timed_out = False
+
+    def prepare(self):
+        """Read the code, and the diff to update the last review from (see last_review_diff)."""
+        self.code = self.job.snippet.code
+        self.diff, self.updates = last_review_diff(self.job, self.code)
+
+    def options(self):
+        """The keyword arguments to review_code and its siblings."""
+        job = self.job
+        return {'refresh': job.refresh, 'language': job.snippet.language, 'context': job_context(job), 'diff': self.diff, 'source': self.source}
+
+    def succeed(self, review, source=None):
+        source = self.source if source is None else source
+        remember_review(self.job.snippet, review, self.updates if source.incremental else 0)
+        finish_job(self.job.pk, ReviewStatus.DONE, result=review, running=self.running, incremental=source.incremental, cached=source.cached)
+
+    def fail(self, error):
+        finish_job(self.job.pk, ReviewStatus.FAILED, error=error, running=self.running)
+
+    def relay(self, chunk):
+        """The events relaying a chunk of the streamed review, ending with `error` once it outlasts REVIEW_TIMEOUT."""
+        self.parts.append(chunk)
+        events = [sse_event('chunk', chunk)]
+        if time.monotonic() > self.deadline:
+            self.timed_out = True
+            events.append(self.failed('Review timed out.'))
+        return events
+
+    def failed(self, error):
+        self.error = error
+        return sse_event('error', {'detail': error})
+
+    def done(self):
+        return sse_event('done', {'id': self.job.pk, 'status': ReviewStatus.DONE, 'cached': self.source.cached})
+
+    def finish(self):
+        """Record the streamed review, or why the stream stopped short of it."""
+        if self.error is None:
+            self.succeed(''.join(self.parts))
+        else:
+            self.fail(self.error)
+
+
+def queued_job(job_id):
+    return ReviewJob.objects.select_related('snippet').filter(pk=job_id, status=ReviewStatus.QUEUED).first()
+
+
+def follow_job(job):
+    """
+    Finish a queued job with the review another call is asking the model
+    for already, of the same code or the same update, waiting for it
+    without claiming a REVIEW_CONCURRENCY slot. Returns False, leaving the
+    job queued, when there is no such call or it ended without a review.
+    """
+    run = JobRun(job, running=False)
+    run.prepare()
+    try:
+        followed = follow_review(run.code, run.diff, job_context(job))
+    except ReviewError as exc:
+        run.fail(str(exc))
+        return True
+    if followed is None:
+        return False
+    run.succeed(*followed)
+    return True
+
+
+async def afollow_job(job):
+    """follow_job for async views."""
+    run = JobRun(job, running=False)
+    await sync_to_async(run.prepare)()
+    try:
+        followed = await afollow_review(run.code, run.diff, job_context(job))
+    except ReviewError as exc:
+        await sync_to_async(run.fail)(str(exc))
+        return True
+    except asyncio.CancelledError:
+        await asyncio.shield(sync_to_async(run.fail)('The client went away before the review finished.'))
+        raise
+    if followed is None:
+        return False
+    await sync_to_async(run.succeed)(*followed)
+    return True
+
+
+def run_review_job(job_id):
+    """
+    Ask the model for the job's review and store the outcome: by following
+    the same review already in flight (see follow_job), or else after
+    claiming a slot.
+    """
+    job = queued_job(job_id)
+    if job is None or follow_job(job):
+        return
+    job = claim_slot(job_id, wait=settings.REVIEW_TIMEOUT)
+    if job is None:
+        return
+    run = JobRun(job)
+    try:
+        run.prepare()
+        review = review_code(run.code, **run.options())
+    except ReviewError as exc:
+        run.fail(str(exc))
+    except Exception:
+        run.fail('The review failed unexpectedly.')
+        raise
+    else:
+        run.succeed(review)
+
+
+async def arun_review_job(job_id):
+    """run_review_job for async views, calling the model through the async client."""
+    job = await sync_to_async(queued_job)(job_id)
+    if job is None or await afollow_job(job):
+        return
+    job = await aclaim_slot(job_id, wait=settings.REVIEW_TIMEOUT)
+    if job is None:
+        return
+    run = JobRun(job)
+    try:
+        await sync_to_async(run.prepare)()
+        review = await areview_code(run.code, **run.options())
+    except ReviewError as exc:
+        await sync_to_async(run.fail)(str(exc))
+    except asyncio.CancelledError:
+        # The client went away and the server cancelled the view, or the server is shutting down.
+        await asyncio.shield(sync_to_async(run.fail)('The client went away before the review finished.'))
+        raise
+    except Exception:
+        await sync_to_async(run.fail)('The review failed unexpectedly.')
+        raise
+    else:
+        await sync_to_async(run.succeed)(review)
+
+
+def stream_job(job):
+    """
+    Run a claimed job in the calling thread and yield its review as
+    Server-Sent Events while the model writes it: `chunk` events carrying
+    text, then `done`, or `error` with a detail message.
+
+    The job fails if the review outlasts REVIEW_TIMEOUT or the client goes
+    away (the response is closed, even before the stream started), and then
+    nothing is stored.
+    """
+    return JobStream(job.pk, _job_events(job))
+
+
+def _job_events(job):
+    run = JobRun(job)
+    chunks = None
+    try:
+        run.prepare()
+        chunks = stream_review(run.code, **run.options())
+        for chunk in chunks:
+            yield from run.relay(chunk)
+            if run.timed_out:
+                return
+        run.error = None
+    except ReviewError as exc:
+        yield run.failed(str(exc))
+    except Exception:
+        run.error = 'The review failed unexpectedly.'
+        raise
+    finally:
+        if chunks is not None:
+            chunks.close()
+        run.finish()
+    if run.error is None:
+        yield run.done()
+
+
+def astream_job(job):
+    """stream_job for async views."""
+    return AsyncJobStream(job.pk, _ajob_events(job))
+
+
+async def _ajob_events(job):
+    run = JobRun(job)
+    chunks = None
+    try:
+        await sync_to_async(run.prepare)()
+        chunks = astream_review(run.code, **run.options())
+        async for chunk in chunks:
+            for event in run.relay(chunk):
+                yield event
+            if run.timed_out:
+                return
+        run.error = None
+    except ReviewError as exc:
+        yield run.failed(str(exc))
+    except Exception:
+        run.error = 'The review failed unexpectedly.'
+        raise
+    finally:
+        if chunks is not None:
+            await chunks.aclose()
+        await sync_to_async(run.finish)()
+    if run.error is None:
+        yield run.done()
+
+
+class JobStream:
+    """
+    The events of a claimed job, for a StreamingHttpResponse, which closes
+    them once it is done. The job is failed then unless it has finished, so
+    a client that went away before the stream started does not keep its
+    slot until reap_stale_jobs.
+    """
+
+    def __init__(self, job_id, events):
+        self.job_id = job_id
+        self.events = events
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        self.events.close()
+        self.abandon()
+
+    def abandon(self):
+        fail_unfinished([self.job_id], 'The client went away before the review finished.')
+
+
+class AsyncJobStream(JobStream):
+    """JobStream for async views. Django closes the response from a thread."""
+
+    __iter__ = None
+
+    def __aiter__(self):
+        return self.events
+
+    def close(self):
+        # A stream that had started was failed or finished by its own cleanup.
+        self.abandon()
+
+
+def _review_in_batch(job, code, diff):
+    source = ReviewSource()
+    try:
+        review = review_code(code, refresh=job.refresh, language=job.snippet.language, context=job_context(job), diff=diff, source=source)
+        return review, source
+    finally:
+        # Connections are per thread; don't leave this one open between reviews.
+        connections.close_all()
+
+
+def review_batch(jobs):
+    """
+    Review the snippets of the queued `jobs`, yielding each job as it finishes.
+
+    Jobs for identical code share one review: the first claims a slot and
+    asks the model, the others are finished with its outcome, as are jobs
+    whose code already has a stored review. At most REVIEW_BATCH_WORKERS
+    reviews run at once, started at most REVIEW_BATCH_RATE per second, and
+    each also holds one of the REVIEW_CONCURRENCY slots. Jobs are claimed
+    and finished in the calling thread; the workers only make the reviews.
+
+    A failed review fails only the jobs sharing it. If no slot frees up
+    for REVIEW_TIMEOUT, or the caller stops early (the client went away),
+    the jobs not yet finished fail.
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job.snippet.content.digest, []).append(job)
+    unfinished = {job.pk for job in jobs}
+
+    def finish(group, outcome, result='', error='', incremental=False, running=True, cached=False):
+        leader, *duplicates = group
+        # Only a review can come from the cache; failures never do.
+        done = outcome == ReviewStatus.DONE
+        finish_job(leader.pk, outcome, result=result, error=error, incremental=incremental, running=running, cached=done and (cached or not running))
+        for job in duplicates:
+            finish_job(job.pk, outcome, result=result, error=error, incremental=incremental, running=False, cached=done)
+        unfinished.difference_update(job.pk for job in group)
+        yield from ReviewJob.objects.filter(pk__in=[job.pk for job in group]).order_by('pk')
+
+    cache = get_review_cache()
+    pending = deque()
+    for digest, group in groups.items():
+        leader = group[0]
+        review = None if leader.refresh else cache.get(digest, context=job_context(leader))
+        if review is None:
+            pending.append(group)
+        else:
+            yield from finish(group, ReviewStatus.DONE, result=review, running=False)
+
+    interval = 1 / settings.REVIEW_BATCH_RATE if settings.REVIEW_BATCH_RATE > 0 else 0
+    workers = max(1, min(settings.REVIEW_BATCH_WORKERS, len(pending)))
+    pool = ThreadPoolExecutor(workers, thread_name_prefix='review-batch')
+    running = {}
+    if pending:
+        reap_stale_jobs()
+    next_start = waiting_since = time.monotonic()
+    try:
+        while pending or running:
+            now = time.monotonic()
+            blocked = False
+            while pending and len(running) < workers and now >= next_start:
+                group = pending[0]
+                try:
+                    job = try_claim(group[0].pk, reap=False)
+                except ReviewJob.DoesNotExist:
+                    # Deleted, or claimed by someone else meanwhile.
+                    pending.popleft()
+                    yield from finish(group, ReviewStatus.FAILED, error='The review job is gone.', running=False)
+                    continue
+                if job is None:
+                    blocked = True
+                    break
+                pending.popleft()
+                code = job.snippet.code
+                diff, updates = last_review_diff(job, code)
+                running[pool.submit(_review_in_batch, job, code, diff)] = (group, diff, updates)
+                next_start = max(next_start, now) + interval
+                waiting_since = now
+            if pending and not running and now - waiting_since >= settings.REVIEW_TIMEOUT:
+                while pending:
+                    yield from finish(pending.popleft(), ReviewStatus.FAILED, error='The review service is busy, try again later.', running=False)
+                break
+            if pending and not blocked and len(running) < workers:
+                # Held back by REVIEW_BATCH_RATE only.
+                timeout = min(POLL_INTERVAL, max(0.0, next_start - now))
+            else:
+                timeout = POLL_INTERVAL
+            if not running:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                group, diff, updates = running.pop(future)
+                waiting_since = time.monotonic()
+                try:
+                    result, source = future.result()
+                except ReviewError as exc:
+                    yield from finish(group, ReviewStatus.FAILED, error=str(exc))
+                except Exception:
+                    logger.exception('Review job %s failed', group[0].pk)
+                    yield from finish(group, ReviewStatus.FAILED, error='The review failed unexpectedly.')
+                else:
+                    remember_review(group[0].snippet, result, updates if source.incremental else 0)
+                    # An update was made from the leader's last review, not the
+                    # duplicates' own; only a whole review is kept for them.
+                    if not source.incremental:
+                        for job in group[1:]:
+                            remember_review(job.snippet, result, 0)
+                    yield from finish(group, ReviewStatus.DONE, result=result, incremental=source.incremental, cached=source.cached)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        if unfinished:
+            fail_unfinished(unfinished, 'The client went away before the review finished.')
+
+
+def wait_for_job(job, timeout):
+    """Re-read `job` until it has finished or `timeout` seconds have passed, for long-polling clients."""
+    deadline = time.monotonic() + timeout
+    while not job.is_finished and time.monotonic() < deadline:
+        time.sleep(min(POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+        job.refresh_from_db()
+    return job
+
+
+class ReviewQueue:
+    """
+    Runs review jobs in `max_workers` threads with at most `max_queued` more
+    waiting, raising ReviewUnavailable beyond that. Threads suit the work:
+    each job spends almost all its time blocked on I/O. With max_workers=0
+    jobs run inline in the request, which is what tests use.
+
+    Jobs from the async views (`asubmit`) run as tasks on the event loop
+    instead, needing no thread, within the same bound on accepted jobs.
+    """
+
+    def __init__(self, max_workers=0, max_queued=0):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.submitted = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued) if max_workers else None
+        self._pool = None
+        self._lock = threading.Lock()
+        self._tasks = set()
+
+    @property
+    def inline(self):
+        return not self.max_workers
+
+    def submit(self, job_id):
+        if self.inline:
+            run_review_job(job_id)
+            return
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise ReviewUnavailable()
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='review')
+            self._pool.submit(self._run, job_id)
+            self.submitted += 1
+
+    async def asubmit(self, job_id):
+        if self.inline:
+            await arun_review_job(job_id)
+            return
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise ReviewUnavailable()
+        task = asyncio.ensure_future(self._arun(job_id))
+        # The event loop only keeps weak references to its tasks.
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self.submitted += 1
+
+    async def _arun(self, job_id):
+        try:
+            await arun_review_job(job_id)
+        except Exception:
+            logger.exception('Review job %s failed', job_id)
+        finally:
+            self._slots.release()
+
+    def _run(self, job_id):
+        try:
+            run_review_job(job_id)
+        except Exception:
+            logger.exception('Review job %s failed', job_id)
+        finally:
+            # Connections are per thread; don't leave this one open between jobs.
+            connections.close_all()
+            self._slots.release()
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def stats(self):
+        return {'workers': self.max_workers, 'submitted': self.submitted, 'rejected': self.rejected}
+
+
+_queue = None
+
+
+def get_review_queue():
+    global _queue
+    if _queue is None:
+        _queue = ReviewQueue(max_workers=settings.REVIEW_WORKERS, max_queued=settings.REVIEW_QUEUE_SIZE)
+    return _queue
+
+
+@receiver(setting_changed)
+def _reset_review_queue(setting, **kwargs):
+    global _queue
+    if setting in ('REVIEW_WORKERS', 'REVIEW_QUEUE_SIZE') and _queue is not None:
+        _queue.shutdown()
+        _queue = None
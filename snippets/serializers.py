@@ -1,19 +1,169 @@
+import pygments
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.urls import reverse
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
-from .models import Snippet
+from . import registry
+from .detection import AUTO_LANGUAGE
+from .models import PREVIEW_LENGTH, ReviewJob, Snippet
 
 
-class SnippetSerializer(serializers.HyperlinkedModelSerializer):
+class SparseFieldsetsMixin:
+    """
+    Lets clients pick the fields they need with `?fields=a,b` or drop some with
+    `?omit=a,b`, and pushes that selection down to the queryset so unselected
+    columns are never read from the database.
+
+    Fields whose source is not a plain model column list the columns they read
+    in `Meta.field_columns`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        selected = self._param_set(request, 'fields')
+        omitted = self._param_set(request, 'omit')
+        for name, field in list(self.fields.items()):
+            if (selected and name not in selected) or name in omitted:
+                if request.method in SAFE_METHODS or field.read_only:
+                    self.fields.pop(name)
+                else:
+                    # Writes still accept the field; it is only left out of the response.
+                    field.write_only = True
+
+    @staticmethod
+    def _param_set(request, name):
+        value = request.query_params.get(name, '')
+        return {item.strip() for item in value.split(',') if item.strip()}
+
+    def get_columns(self):
+        field_columns = getattr(self.Meta, 'field_columns', {})
+        columns = {'pk'}
+        for name, field in self.fields.items():
+            if name in field_columns:
+                columns.update(field_columns[name])
+            elif field.source != '*':
+                columns.add(field.source.replace('.', '__'))
+        return columns
+
+    def optimize_queryset(self, queryset):
+        columns = self.get_columns()
+        relations = {column.rsplit('__', 1)[0] for column in columns if '__' in column}
+        if relations:
+            queryset = queryset.select_related(*relations)
+        return queryset.only(*columns)
+
+
+class SnippetSerializer(SparseFieldsetsMixin, serializers.HyperlinkedModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
-    highlight = serializers.CharField(source='highlighted', read_only=True)
+    # Stored as a compressed binary column, exchanged as text.
+    code = serializers.CharField(style={'base_template': 'textarea.html'})
+    # Plain CharFields checked against the registry's frozensets, rather than
+    # ChoiceFields that rebuild a ~600 entry mapping for every serializer.
+    language = serializers.CharField(max_length=100, required=False)
+    style = serializers.CharField(max_length=100, required=False)
+    highlight = serializers.CharField(source='rendered_highlight', read_only=True)
+    # 'truncated' or 'skipped' when the code was too costly to highlight in full.
+    highlight_outcome = serializers.CharField(read_only=True)
+    stylesheet = serializers.SerializerMethodField()
     # Make uuid and shared_password read-only for now, but visible
     uuid = serializers.UUIDField(read_only=True)
     shared_password = serializers.CharField(read_only=True)
 
     class Meta:
         model = Snippet
-        fields = ['url', 'id', 'title', 'code', 'linenos', 'language', 'style', 'owner', 'highlight', 'uuid', 'shared_password']
+        fields = ['url', 'id', 'title', 'code', 'linenos', 'language', 'style', 'owner', 'highlight', 'highlight_outcome', 'stylesheet', 'uuid', 'shared_password']
+        field_columns = {
+            'code': ['content__code'],
+            'highlight': ['language', 'style', 'linenos', 'highlight_state', 'rendering__html', 'rendering__render_version'],
+            'highlight_outcome': ['rendering__outcome'],
+            'stylesheet': ['style'],
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # With ?lines= the code and highlight are computed for the range in
+        # to_representation; with ?stream= the view sends highlight separately.
+        self.range_fields = []
+        self.stream_highlight = False
+        if self.context.get('line_range'):
+            self.range_fields = [name for name in ('code', 'highlight') if self.fields.pop(name, None)]
+        elif self.context.get('stream'):
+            self.stream_highlight = self.fields.pop('highlight', None) is not None
+
+    def get_columns(self):
+        columns = super().get_columns()
+        if self.range_fields:
+            columns.update(['language', 'style', 'linenos', 'content__line_count', 'content__line_index'])
+        if self.stream_highlight:
+            columns.update(['highlight_state', 'rendering__render_version'])
+        return columns
+
+    def to_representation(self, snippet):
+        data = super().to_representation(snippet)
+        if self.range_fields:
+            start, end = self.context['line_range']
+            end = min(end or snippet.line_count, snippet.line_count)
+            if 'code' in self.range_fields:
+                data['code'] = snippet.code_lines(start, end)
+            if 'highlight' in self.range_fields:
+                data['highlight'] = snippet.render_lines(start, end)
+            data['lines'] = {'start': start, 'end': end, 'total': snippet.line_count}
+        return data
+
+    def get_stylesheet(self, snippet):
+        """URL of the CSS the highlight markup needs, or None when it is inline-styled."""
+        if not settings.HIGHLIGHT_CSS_CLASSES:
+            return None
+        url = f"{reverse('style-css', args=[snippet.style])}?v={pygments.__version__}"
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def validate_code(self, value):
+        # JSON can escape lone surrogates, which are not text: the text columns
+        # derived from the code (e.g. code_preview) could not store them.
+        try:
+            value.encode('utf-8')
+        except UnicodeEncodeError:
+            raise serializers.ValidationError('Code must be valid Unicode text.')
+        return value
+
+    def validate_language(self, value):
+        # 'auto' is resolved to a detected language when the snippet is saved.
+        if value != AUTO_LANGUAGE and not registry.is_language(value):
+            raise serializers.ValidationError(f'"{value}" is not a valid choice.')
+        return value
+
+    def validate_style(self, value):
+        if not registry.is_style(value):
+            raise serializers.ValidationError(f'"{value}" is not a valid choice.')
+        return value
+
+
+class SnippetListSerializer(SparseFieldsetsMixin, serializers.HyperlinkedModelSerializer):
+    """
+    Compact representation used by the snippet list: metadata plus a short
+    preview instead of the full code and highlighted HTML.
+    """
+    owner = serializers.ReadOnlyField(source='owner.username')
+    preview = serializers.SerializerMethodField()
+    uuid = serializers.UUIDField(read_only=True)
+    shared_password = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Snippet
+        fields = ['url', 'id', 'title', 'preview', 'linenos', 'language', 'style', 'owner', 'created', 'uuid', 'shared_password']
+        field_columns = {'preview': ['code_preview']}
+
+    def get_preview(self, snippet):
+        preview = snippet.code_preview
+        if len(preview) > PREVIEW_LENGTH:
+            return preview[:PREVIEW_LENGTH] + '...'
+        return preview
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -24,6 +174,17 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['url', 'id', 'username', 'snippets', 'email', 'first_name', 'last_name']
 
 
+class ReviewJobSerializer(serializers.HyperlinkedModelSerializer):
+    snippet = serializers.PrimaryKeyRelatedField(read_only=True)
+    review = serializers.CharField(source='result', read_only=True)
+
+    class Meta:
+        model = ReviewJob
+        fields = ['url', 'id', 'snippet', 'status', 'review', 'error', 'cached', 'full', 'incremental', 'created', 'started', 'finished']
+        read_only_fields = fields
+        extra_kwargs = {'url': {'view_name': 'review-detail'}}
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
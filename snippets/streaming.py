@@ -0,0 +1,36 @@
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def stream_json(data, key, chunks):
+    """
+    Yield `data` serialized as a JSON object with one extra string member, `key`,
+    whose value is written piece by piece from `chunks`, so a large value never
+    has to be held in memory in one piece.
+    """
+    head = json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+    yield head[:-1] + (', ' if data else '') + json.dumps(key) + ': "'
+    for chunk in chunks:
+        # JSON string escaping is per character, so chunks can be escaped separately.
+        yield json.dumps(chunk, ensure_ascii=False)[1:-1]
+    yield '"}'
+
+
+def ndjson_line(data):
+    """`data` as one line of newline-delimited JSON."""
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+
+def sse_event(event, data):
+    """
+    One Server-Sent Events message. `data` is sent as JSON, which keeps any
+    newlines in it escaped onto the single `data:` line.
+    """
+    return f'event: {event}\ndata: {json.dumps(data, cls=JSONEncoder, ensure_ascii=False)}\n\n'
+
+
+async def iter_events(*events):
+    """`events` as an async iterator, for StreamingHttpResponses of async views."""
+    for event in events:
+        yield event
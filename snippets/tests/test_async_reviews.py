@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import include, path
+
+from snippets.ai_review import get_client
+from snippets.middleware import WhiteNoiseMiddleware
+from snippets.models import ReviewJob, ReviewResult, ReviewStatus, Snippet
+from snippets.urls import async_review_urls
+
+# What snippets.urls serves with REVIEW_ASYNC on.
+urlpatterns = [*async_review_urls, path('', include('snippets.urls'))]
+
+
+@override_settings(ROOT_URLCONF=__name__, GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=0)
+class AsyncReviewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(owner=self.user, code='print(1)', shared_password='secret')
+        self.url = f'/snippets/{self.snippet.pk}/review/'
+        self.calls_before = get_client().calls
+
+    async def test_review_is_awaited_through_the_async_client(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(self.url)
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual((data['status'], data['cached']), ('done', False))
+        self.assertIn('fake', data['review'])
+        self.assertEqual(response['Location'], data['url'])
+        self.assertEqual(get_client().calls - self.calls_before, 1)
+
+        response = await self.async_client.post(self.url)
+        self.assertTrue(response.json()['cached'])
+        self.assertEqual(get_client().calls - self.calls_before, 1)
+
+    @override_settings(REVIEW_WORKERS=1)
+    async def test_queued_review_runs_on_the_event_loop(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'queued')
+        job = await ReviewJob.objects.aget()
+        for _ in range(100):
+            if job.is_finished:
+                break
+            await asyncio.sleep(0.05)
+            await job.arefresh_from_db()
+        self.assertEqual(job.status, ReviewStatus.DONE)
+        self.assertIn('fake', job.result)
+
+    async def test_stream(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(self.url + '?stream=1')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = [message.split('\n') for message in body.strip().split('\n\n')]
+        chunks = [json.loads(data.removeprefix('data: ')) for event, data in events if event == 'event: chunk']
+        self.assertEqual(events[-1][0], 'event: done')
+        self.assertEqual(await ReviewResult.objects.values_list('review', flat=True).aget(), ''.join(chunks))
+        self.assertEqual((await ReviewJob.objects.aget()).status, ReviewStatus.DONE)
+
+    async def test_a_stream_closed_before_it_started_frees_the_slot(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(self.url + '?stream=1')
+        await sync_to_async(response.close)()
+        job = await ReviewJob.objects.aget()
+        self.assertEqual((job.status, job.slot), (ReviewStatus.FAILED, None))
+
+    async def test_access_rules_match_the_sync_views(self):
+        self.assertEqual((await self.async_client.post(self.url)).status_code, 401)
+        other = await User.objects.acreate_user(username='other', password='password')
+        await self.async_client.aforce_login(other)
+        self.assertEqual((await self.async_client.post(self.url)).status_code, 404)
+        shared = f'/snippets/shared/{self.snippet.uuid}/review/'
+        self.assertEqual((await self.async_client.post(shared)).status_code, 400)
+        self.assertEqual((await self.async_client.post(shared, {'password': 'wrong'})).status_code, 403)
+        response = await self.async_client.post(shared, {'password': 'secret'}, content_type='application/json')
+        self.assertEqual(response.json()['status'], 'done')
+
+    def test_static_files_middleware_keeps_the_chain_async(self):
+        # A sync-only middleware would make Django run async views one at a time.
+        async def get_response(request):
+            pass
+
+        self.assertTrue(iscoroutinefunction(WhiteNoiseMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(WhiteNoiseMiddleware(lambda request: None)))
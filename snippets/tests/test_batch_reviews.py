@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from snippets.ai_review import ReviewError, get_client, get_review_cache
+from snippets.models import ReviewJob, ReviewStatus, Snippet, SnippetReview, content_digest
+from snippets.reviews import remember_review
+
+
+# With the stored cache off the worker threads never touch the test database.
+@override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=0, REVIEW_CACHE_TTL=0, REVIEW_BATCH_RATE=0)
+class BatchReviewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='owner')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('snippet-review-batch')
+        self.calls_before = get_client().calls
+
+    def snippet(self, code, **kwargs):
+        return Snippet.objects.create(owner=self.user, code=code, **kwargs)
+
+    def batch(self, **data):
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('application/x-ndjson'))
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def test_identical_code_is_reviewed_once(self):
+        first, copy, other = self.snippet('x = 1'), self.snippet('x = 1'), self.snippet('y = 2')
+        lines = self.batch(ids=[first.pk, copy.pk, other.pk, first.pk, 999])
+        *items, summary = lines
+        self.assertEqual(summary, {'summary': {'snippets': 4, 'done': 3, 'failed': 1}})
+        self.assertEqual(items[0], {'snippet': 999, 'status': 'failed', 'error': 'Snippet not found.'})
+        reviews = {item['snippet']: item for item in items[1:]}
+        self.assertEqual(set(reviews), {first.pk, copy.pk, other.pk})
+        self.assertEqual(reviews[first.pk]['review'], reviews[copy.pk]['review'])
+        self.assertEqual(get_client().calls - self.calls_before, 2)
+        self.assertEqual(ReviewJob.objects.filter(status=ReviewStatus.DONE).count(), 3)
+
+    def test_a_failed_review_fails_only_its_snippets(self):
+        good, bad, copy = self.snippet('x = 1'), self.snippet('raise'), self.snippet('raise')
+
+        def review(code, **kwargs):
+            if code == 'raise':
+                raise ReviewError('quota exceeded')
+            return 'Fine.'
+
+        with patch('snippets.reviews.review_code', side_effect=review):
+            lines = self.batch(ids=[good.pk, bad.pk, copy.pk])
+        outcomes = {line['snippet']: (line['status'], line['review'], line['error'], line['cached']) for line in lines[:-1]}
+        self.assertEqual(outcomes, {
+            good.pk: ('done', 'Fine.', '', False),
+            bad.pk: ('failed', '', 'quota exceeded', False),
+            copy.pk: ('failed', '', 'quota exceeded', False),
+        })
+        self.assertEqual(lines[-1]['summary'], {'snippets': 3, 'done': 1, 'failed': 2})
+
+    @override_settings(REVIEW_DIFF_MAX_UPDATES=2)
+    def test_an_update_is_kept_only_for_the_snippet_it_was_made_from(self):
+        code = ''.join(f'def f{i}(x):\n    return x + {i}\n\n\n' for i in range(20))
+        first, second = self.snippet(code), self.snippet(code.replace('+ 5', '* 5'))
+        remember_review(first, 'Review of the first.', 0)
+        remember_review(second, 'Review of the second.', 0)
+        for snippet in (first, second):
+            snippet.code = code.replace('+ 10', '- 10')
+            snippet.save()
+
+        def review(code, diff=None, source=None, **kwargs):
+            source.phase = 'diff' if diff else 'review'
+            return 'Updated.'
+
+        with patch('snippets.reviews.review_code', side_effect=review):
+            lines = self.batch(ids=[first.pk, second.pk])
+        self.assertEqual([(line['review'], line['incremental']) for line in lines[:-1]], [('Updated.', True)] * 2)
+        self.assertEqual(SnippetReview.objects.get(snippet=first).review, 'Updated.')
+        self.assertEqual(SnippetReview.objects.get(snippet=second).review, 'Review of the second.')
+
+    @override_settings(REVIEW_BATCH_WORKERS=2, REVIEW_BATCH_RATE=20)
+    def test_reviews_run_in_a_bounded_pool_at_a_bounded_rate(self):
+        snippets = [self.snippet(f'x = {i}') for i in range(5)]
+        running, most = [0], [0]
+        guard = threading.Lock()
+
+        def review(code, **kwargs):
+            with guard:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            time.sleep(0.2)
+            with guard:
+                running[0] -= 1
+            return 'Fine.'
+
+        start = time.monotonic()
+        with patch('snippets.reviews.review_code', side_effect=review):
+            lines = self.batch(ids=[snippet.pk for snippet in snippets])
+        self.assertEqual(lines[-1]['summary']['done'], 5)
+        self.assertEqual(most[0], 2)
+        # Five starts at 20 per second take at least 0.2s.
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_a_bare_list_of_ids_is_accepted(self):
+        first, second = self.snippet('x = 1'), self.snippet('y = 2')
+        response = self.client.post(self.url, [first.pk, second.pk], format='json')
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual({line['snippet'] for line in lines[:-1]}, {first.pk, second.pk})
+        self.assertEqual(self.client.post(self.url, '"all"', content_type='application/json').status_code, 400)
+
+    def test_all_snippets_or_one_language(self):
+        python, _ = self.snippet('x = 1', language='python'), self.snippet('int x;', language='c')
+        Snippet.objects.create(owner=User.objects.create_user('other'), code='z = 3')
+        self.assertEqual(len(self.batch()), 3)
+        lines = self.batch(language='python')
+        self.assertEqual([line['snippet'] for line in lines[:-1]], [python.pk])
+
+    @override_settings(REVIEW_BATCH_MAX_ITEMS=1)
+    def test_batches_are_bounded(self):
+        self.snippet('x = 1')
+        self.snippet('y = 2')
+        self.assertEqual(self.client.post(self.url, {'ids': [1, 2]}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, {}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'ids': 'all'}, format='json').status_code, 400)
+        self.assertFalse(ReviewJob.objects.exists())
+
+    @override_settings(REVIEW_CACHE_TTL=60)
+    def test_stored_reviews_answer_at_once(self):
+        snippet = self.snippet('x = 1')
+        get_review_cache().set(content_digest('x = 1'), 'Stored.')
+        line, summary = self.batch(ids=[snippet.pk])
+        self.assertEqual((line['review'], line['cached']), ('Stored.', True))
+        self.assertEqual(get_client().calls - self.calls_before, 0)
+
+    def test_unfinished_jobs_fail_when_the_client_goes_away(self):
+        snippets = [self.snippet(f'x = {i}') for i in range(3)]
+        response = self.client.post(self.url, {'ids': [snippet.pk for snippet in snippets]}, format='json')
+        next(iter(response.streaming_content))
+        response.close()
+        statuses = list(ReviewJob.objects.values_list('status', flat=True))
+        self.assertEqual(statuses.count(ReviewStatus.DONE), 1)
+        self.assertEqual(statuses.count(ReviewStatus.FAILED), 2)
+        self.assertEqual(set(ReviewJob.objects.filter(status=ReviewStatus.FAILED).values_list('error', flat=True)), {
+            'The client went away before the review finished.',
+        })
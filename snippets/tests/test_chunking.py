@@ -0,0 +1,119 @@
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from snippets.ai_review import ReviewError, areview_code, get_client, get_review_cache, review_code
+from snippets.chunking import estimate_tokens, split_code, split_points
+from snippets.models import content_digest
+
+PYTHON = '''import os
+import sys
+
+
+# Helper
+def add(a, b):
+    return a + b
+
+
+@cached
+def total(values):
+    result = 0
+
+    for value in values:
+        result = add(result, value)
+    return result
+
+
+class Counter:
+    def count(self):
+        pass
+'''
+
+
+class SplitCodeTests(SimpleTestCase):
+    def chunk_starts(self, code, language, max_tokens):
+        chunks = split_code(code, language, max_tokens)
+        self.assertEqual(''.join(chunk.code for chunk in chunks), code)
+        self.assertTrue(all(estimate_tokens(chunk.code) <= max_tokens for chunk in chunks))
+        return [code.splitlines()[chunk.first_line - 1] for chunk in chunks]
+
+    def test_code_within_budget_is_one_chunk(self):
+        self.assertEqual(split_code(PYTHON, 'python', 1000), [(1, PYTHON)])
+        self.assertEqual(split_code(PYTHON, 'python', 0), [(1, PYTHON)])
+
+    def test_cuts_before_top_level_definitions_with_their_comments(self):
+        self.assertEqual(split_points(PYTHON, 'python'), {4: 2, 9: 2, 13: 1, 18: 2})
+        self.assertEqual(self.chunk_starts(PYTHON, 'python', 40), ['import os', '@cached', 'class Counter:'])
+        # A function over the budget is cut at its blank line, then wherever it must be.
+        self.assertEqual(
+            self.chunk_starts(PYTHON, 'python', 20),
+            ['import os', '# Helper', '@cached', '    for value in values:', '    return result', 'class Counter:'],
+        )
+
+    def test_braced_languages(self):
+        code = 'int add(int a, int b) {\n  return a + b;\n}\n/* Twice. */\nint twice(int a) {\n  return add(a, a);\n}\n'
+        self.assertEqual(self.chunk_starts(code, 'c', 16), ['int add(int a, int b) {', '/* Twice. */'])
+
+    def test_falls_back_to_blank_lines_then_any_line(self):
+        code = ''.join(f'value_{i} = {i}\n' for i in range(4)) + '\n' + ''.join(f'other_{i} = {i}\n' for i in range(4))
+        self.assertEqual(self.chunk_starts(code, 'not-a-language', 20), ['value_0 = 0', 'other_0 = 0'])
+        self.assertEqual(len(split_code(code, 'python', 5)), 8)
+
+    def test_long_line_is_cut_into_pieces(self):
+        chunks = split_code('x' * 100, 'python', 10)
+        self.assertEqual([len(chunk.code) for chunk in chunks], [40, 40, 20])
+        self.assertEqual({chunk.first_line for chunk in chunks}, {1})
+
+
+@override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=0, REVIEW_TOKEN_BUDGET=40, REVIEW_CHUNK_WORKERS=2, REVIEW_CACHE_TTL=0)
+class ChunkedReviewTests(TestCase):
+    def setUp(self):
+        self.calls_before = get_client().calls
+
+    def model_calls(self):
+        return get_client().calls - self.calls_before
+
+    def test_large_code_is_reviewed_in_parts_then_merged(self):
+        prompts = []
+        running, most = [0], [0]
+        guard = threading.Lock()
+        generate = get_client().models.generate_content
+
+        def recording(model, contents, config=None):
+            with guard:
+                prompts.append(contents[0])
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            try:
+                time.sleep(0.05)
+                return generate(model, contents, config)
+            finally:
+                with guard:
+                    running[0] -= 1
+
+        with patch.object(get_client().models, 'generate_content', side_effect=recording):
+            self.assertIn('fake', review_code(PYTHON, language='python'))
+        self.assertEqual(self.model_calls(), 4)
+        self.assertEqual(most[0], 2)
+        self.assertIn('lines 1 to 9, one of 3 parts', prompts[0])
+        self.assertIn('Merge them into a single review', prompts[-1])
+        self.assertEqual(prompts[-1].count('Lines '), 3)
+
+    async def test_async_review_matches(self):
+        self.assertIn('fake', await areview_code(PYTHON, language='python'))
+        self.assertEqual(self.model_calls(), 4)
+
+    @override_settings(REVIEW_CACHE_TTL=60)
+    def test_whole_reviews_stored_before_chunking_are_not_reused(self):
+        with patch('snippets.ai_review.PROMPT_VERSION', 1):
+            get_review_cache().set(content_digest(PYTHON), 'One review of everything.')
+        self.assertIn('fake', review_code(PYTHON, language='python'))
+        self.assertEqual(self.model_calls(), 4)
+
+    def test_a_failed_part_fails_the_review(self):
+        get_client().failure_rate = 1
+        self.addCleanup(setattr, get_client(), 'failure_rate', 0)
+        with self.assertRaises(ReviewError):
+            review_code(PYTHON, language='python')
@@ -0,0 +1,76 @@
+import zlib
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from snippets.fields import FORMAT_RAW, FORMAT_ZLIB, compress_text, decompress_text, iter_decompressed
+from snippets.models import Snippet
+
+CODE = ''.join(f'print("héllo {i}")\n' for i in range(500))
+
+
+class CompressTextTests(SimpleTestCase):
+    def test_round_trip(self):
+        packed = compress_text(CODE, codec='zlib', min_bytes=16)
+        self.assertEqual(packed[0], FORMAT_ZLIB)
+        self.assertLess(len(packed), len(CODE) // 4)
+        self.assertEqual(decompress_text(packed), CODE)
+
+    def test_short_and_incompressible_values_are_stored_raw(self):
+        self.assertEqual(compress_text('x = 1', codec='zlib', min_bytes=16), bytes([FORMAT_RAW]) + b'x = 1')
+        self.assertEqual(compress_text('abcdefghijklmnopqrstuvwxyz', codec='zlib', min_bytes=16)[0], FORMAT_RAW)
+        self.assertEqual(decompress_text(compress_text('', codec='zlib', min_bytes=0)), '')
+
+    @override_settings(SNIPPET_COMPRESSION_CODEC='none')
+    def test_codec_can_be_disabled(self):
+        self.assertEqual(compress_text(CODE)[0], FORMAT_RAW)
+
+    def test_unknown_format_is_rejected(self):
+        with self.assertRaises(ValueError):
+            decompress_text(b'\x7fdata')
+
+    def test_chunked_decompression_splits_anywhere(self):
+        packed = compress_text(CODE, codec='zlib', min_bytes=16)
+        chunks = [packed[i:i + 5] for i in range(0, len(packed), 5)]
+        self.assertEqual(''.join(iter_decompressed(chunks)), CODE)
+        raw = compress_text(CODE, codec='none')
+        chunks = [raw[i:i + 3] for i in range(0, len(raw), 3)]  # splits the multi-byte é
+        self.assertEqual(''.join(iter_decompressed(chunks)), CODE)
+
+
+    def test_lone_surrogates_round_trip(self):
+        text = 'x = "\ud800"\n' * 50
+        for codec in ('zlib', 'none'):
+            packed = compress_text(text, codec=codec, min_bytes=16)
+            self.assertEqual(decompress_text(packed), text)
+            self.assertEqual(''.join(iter_decompressed([packed[i:i + 2] for i in range(0, len(packed), 2)])), text)
+
+
+class CompressedSnippetTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(owner=user, code=CODE, language='python')
+
+    def stored(self, table, column, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {column} FROM {table} WHERE id = %s', [pk])
+            return bytes(cursor.fetchone()[0])
+
+    def test_columns_are_stored_compressed(self):
+        stored = self.stored('snippets_snippetcontent', 'code', self.snippet.content_id)
+        self.assertEqual(stored[0], FORMAT_ZLIB)
+        self.assertEqual(zlib.decompress(stored[1:]).decode(), CODE)
+        html = self.stored('snippets_rendering', 'html', self.snippet.rendering_id)
+        self.assertLess(len(html), len(self.snippet.highlighted) // 5)
+
+    def test_model_reads_text(self):
+        snippet = Snippet.objects.get(pk=self.snippet.pk)
+        self.assertEqual(snippet.code, CODE)
+        self.assertEqual(snippet.highlighted, self.snippet.highlighted)
+        self.assertEqual(snippet.code_preview, CODE[:101])
+
+    def test_deferred_reads_decompress_in_chunks(self):
+        snippet = Snippet.objects.select_related('content', 'rendering').defer('content__code', 'rendering__html').get(pk=self.snippet.pk)
+        self.assertEqual(''.join(snippet.rendering.iter_column('html', chunk_size=64)), self.snippet.highlighted)
+        self.assertEqual(snippet.code_lines(2, 3), 'print("héllo 1")\nprint("héllo 2")\n')
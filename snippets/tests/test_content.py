@@ -0,0 +1,122 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from snippets.highlighting import get_highlight_cache
+from snippets.models import HighlightState, Rendering, Snippet, SnippetContent
+from snippets.reviews import remember_review
+
+
+class ContentDedupTests(TestCase):
+    def setUp(self):
+        get_highlight_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+
+    def test_duplicates_share_content_and_rendering(self):
+        first = Snippet.objects.create(owner=self.user, code='print("dup")')
+        with patch('snippets.models.render_highlight_result') as mock_render:
+            second = Snippet.objects.create(owner=self.user, code='print("dup")', title='Copy')
+        mock_render.assert_not_called()
+        self.assertEqual(first.content_id, second.content_id)
+        self.assertEqual(first.rendering_id, second.rendering_id)
+        self.assertEqual(SnippetContent.objects.get().ref_count, 2)
+        self.assertEqual(Snippet.objects.get(pk=second.pk).code, 'print("dup")')
+
+    def test_other_options_get_their_own_rendering(self):
+        first = Snippet.objects.create(owner=self.user, code='x = 1', style='monokai')
+        second = Snippet.objects.create(owner=self.user, code='x = 1', style='colorful')
+        self.assertEqual(first.content_id, second.content_id)
+        self.assertNotEqual(first.rendering_id, second.rendering_id)
+
+    def test_editing_code_moves_the_reference(self):
+        first = Snippet.objects.create(owner=self.user, code='a = 1')
+        Snippet.objects.create(owner=self.user, code='a = 1')
+        first.code = 'b = 2'
+        first.save()
+        self.assertEqual(SnippetContent.objects.get(digest=first.content.digest).ref_count, 1)
+        self.assertEqual(SnippetContent.objects.exclude(pk=first.content_id).get().ref_count, 1)
+        first.code = 'b = 2'
+        first.save()
+        self.assertEqual(SnippetContent.objects.get(pk=first.content_id).ref_count, 1)
+
+    def test_a_failed_save_gives_its_reference_back(self):
+        snippet = Snippet.objects.create(owner=self.user, code='a = 1')
+        snippet.code = 'b = 2'
+        with patch.object(Snippet, 'save_base', side_effect=IntegrityError), self.assertRaises(IntegrityError):
+            snippet.save()
+        self.assertEqual([(content.code, content.ref_count) for content in SnippetContent.objects.all()], [('a = 1', 1)])
+        snippet.save()
+        self.assertEqual(Snippet.objects.get().code, 'b = 2')
+        self.assertEqual([(content.code, content.ref_count) for content in SnippetContent.objects.all()], [('b = 2', 1)])
+
+    def test_deleting_the_last_reference_collects_content(self):
+        first = Snippet.objects.create(owner=self.user, code='gone = True')
+        second = Snippet.objects.create(owner=self.user, code='gone = True')
+        first.delete()
+        self.assertEqual(SnippetContent.objects.get().ref_count, 1)
+        second.delete()
+        self.assertFalse(SnippetContent.objects.exists())
+        self.assertFalse(Rendering.objects.exists())
+
+    def test_deleting_the_owner_releases_content(self):
+        Snippet.objects.create(owner=self.user, code='owned = 1')
+        self.user.delete()
+        self.assertFalse(SnippetContent.objects.exists())
+
+    @override_settings(HIGHLIGHT_DEFERRED=True)
+    def test_deferred_duplicate_reuses_current_render(self):
+        first = Snippet.objects.create(owner=self.user, code='later = 1')
+        self.assertEqual(first.highlight_state, HighlightState.PENDING)
+        first.ensure_highlighted()
+        second = Snippet.objects.create(owner=self.user, code='later = 1')
+        self.assertEqual(second.highlight_state, HighlightState.READY)
+        self.assertEqual(second.rendering_id, first.rendering_id)
+
+    def test_gc_command_repairs_counts(self):
+        snippet = Snippet.objects.create(owner=self.user, code='kept = 1')
+        SnippetContent.objects.filter(pk=snippet.content_id).update(ref_count=5)
+        orphan = SnippetContent.objects.acquire('orphan = 1')
+        SnippetContent.objects.filter(pk=orphan.pk).update(ref_count=0)
+        out = StringIO()
+        call_command('gc_content', recount=True, stdout=out)
+        self.assertEqual(SnippetContent.objects.get().ref_count, 1)
+        self.assertIn('Deleted 1 unreferenced content', out.getvalue())
+        self.assertIn('1 snippet(s) share 1 content(s)', out.getvalue())
+
+    def test_gc_command_keeps_contents_held_by_reviews(self):
+        snippet = Snippet.objects.create(owner=self.user, code='reviewed = 1')
+        remember_review(snippet, 'Fine.', 0)
+        reviewed = snippet.content_id
+        snippet.code = 'edited = 1'
+        snippet.save()
+        SnippetContent.objects.filter(pk=reviewed).update(ref_count=0)
+        out = StringIO()
+        call_command('gc_content', recount=True, stdout=out)
+        self.assertEqual(SnippetContent.objects.get(pk=reviewed).ref_count, 1)
+        self.assertEqual(SnippetContent.objects.get(pk=snippet.content_id).ref_count, 1)
+        self.assertIn('Fixed 1 reference count(s)', out.getvalue())
+        self.assertIn('Deleted 0 unreferenced content', out.getvalue())
+
+
+class ContentApiTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_create_and_update_through_api(self):
+        response = self.client.post(reverse('snippet-list'), {'code': 'same = 1'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.post(reverse('snippet-list'), {'code': 'same = 1'}, format='json')
+        self.assertEqual(SnippetContent.objects.get().ref_count, 2)
+        url = reverse('snippet-detail', args=[response.data['id']])
+        response = self.client.patch(url, {'code': 'other = 2'}, format='json')
+        self.assertEqual(response.data['code'], 'other = 2')
+        self.assertIn('other', response.data['highlight'])
+        self.assertEqual(sorted(SnippetContent.objects.values_list('ref_count', flat=True)), [1, 1])
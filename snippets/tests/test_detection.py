@@ -0,0 +1,106 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from snippets import registry
+from snippets.detection import INTERPRETERS, detect_language, get_detection_cache, sample_of
+from snippets.models import Snippet
+
+JAVASCRIPT = '''const express = require('express');
+const app = express();
+
+app.get('/', (req, res) => {
+  if (req.query.name === undefined) {
+    console.log('anonymous');
+  }
+  res.send('hello');
+});
+
+module.exports = app;
+'''
+
+GO = '''package main
+
+import (
+\t"fmt"
+)
+
+func main() {
+\tvalue, err := compute()
+\tif err != nil {
+\t\tpanic(err)
+\t}
+\tfmt.Println(value)
+}
+'''
+
+
+class DetectLanguageTests(SimpleTestCase):
+    def setUp(self):
+        get_detection_cache().clear()
+
+    def test_shebang(self):
+        self.assertEqual(detect_language('#!/usr/bin/env python3\nprint(1)\n'), 'python')
+        self.assertEqual(detect_language('#!/bin/sh\nls\n'), 'bash')
+        self.assertEqual(detect_language('#!/usr/bin/env node\nx()\n'), 'javascript')
+        self.assertEqual(detect_language('#!/usr/bin/env Rscript\nx <- c(1, 2)\n'), 'splus')
+
+    def test_interpreters_map_to_registry_languages(self):
+        for interpreter, language in INTERPRETERS.items():
+            with self.subTest(interpreter=interpreter):
+                self.assertTrue(registry.is_language(language))
+
+    def test_modelines(self):
+        self.assertEqual(detect_language('x = 1\n\n# vim: set ft=ruby :\n'), 'ruby')
+        self.assertEqual(detect_language('; -*- mode: scheme -*-\n(define x 1)\n'), 'scheme')
+
+    def test_filename_hint(self):
+        self.assertEqual(detect_language('x = 1', filename='config.yaml'), 'yaml')
+        # .h could be C, C++ or Objective-C; the code decides between the shortlisted ones.
+        self.assertEqual(detect_language('namespace app {\nstd::string name;\n}\n', filename='app.h'), 'cpp')
+
+    def test_signatures(self):
+        self.assertEqual(detect_language(JAVASCRIPT), 'javascript')
+        self.assertEqual(detect_language(GO), 'go')
+        self.assertEqual(detect_language('import os\n\ndef main():\n    return os.getcwd()\n'), 'python')
+        self.assertEqual(detect_language('just some words'), 'text')
+
+    @override_settings(LANGUAGE_DETECTION_CANDIDATES=['python', 'ruby'])
+    def test_candidates_are_restricted_to_shortlist(self):
+        self.assertIn(detect_language(JAVASCRIPT), {'python', 'ruby', 'text'})
+
+    def test_only_sample_is_scored(self):
+        code = GO + 'x' * 10000
+        self.assertEqual(sample_of(code, 200), GO[:GO.rfind('\n', 0, 200)])
+        with override_settings(LANGUAGE_DETECTION_SAMPLE=200), patch('snippets.detection.score_languages', return_value={'go': 1}) as mock_score:
+            detect_language(code)
+        self.assertEqual(mock_score.call_args.args[0], sample_of(code, 200))
+
+    def test_results_are_memoized(self):
+        with patch('snippets.detection.score_languages', return_value={'go': 1}) as mock_score:
+            detect_language(GO)
+            detect_language(GO)
+        self.assertEqual(mock_score.call_count, 1)
+        self.assertEqual(get_detection_cache().stats()['hits'], 1)
+
+
+class AutoLanguageTests(APITestCase):
+    def setUp(self):
+        get_detection_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_create_with_auto_stores_detected_language(self):
+        response = self.client.post(reverse('snippet-list'), {'code': GO, 'language': 'auto'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['language'], 'go')
+        self.assertEqual(Snippet.objects.get().language, 'go')
+
+    def test_raw_upload_uses_title_as_filename_hint(self):
+        response = self.client.post(reverse('snippet-create-raw') + '?language=auto&title=deploy.sh', 'make all\n', content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Snippet.objects.get().language, 'bash')
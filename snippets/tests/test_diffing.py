@@ -0,0 +1,129 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from snippets.ai_review import get_client
+from snippets.diffing import diff_hunks, review_diff
+from snippets.models import ReviewJob, ReviewResult, Snippet, SnippetContent, SnippetReview
+from snippets.reviews import run_review_job
+
+CODE = ''.join(f'def f{i}(x):\n    return x + {i}\n\n\n' for i in range(50))
+
+
+class ReviewDiffTests(SimpleTestCase):
+    def test_hunks_keep_context_around_changes(self):
+        edited = CODE.replace('return x + 20', 'return x - 20')
+        hunks = diff_hunks(CODE, edited, context=2)
+        self.assertEqual(hunks.splitlines(), [
+            '@@ -80,5 +80,5 @@',
+            ' ', ' def f20(x):', '-    return x + 20', '+    return x - 20', ' ', ' ',
+        ])
+
+    def test_changed_lines_that_look_like_the_header_are_kept(self):
+        old = 'x = 1\n-- old comment\ny = 2\n'
+        new = 'x = 1\n++x;\ny = 2\n'
+        self.assertEqual(diff_hunks(old, new, context=0).splitlines(), ['@@ -2 +2 @@', '--- old comment', '+++x;'])
+
+    def test_small_edits_update_the_review(self):
+        edited = CODE.replace('return x + 20', 'return x - 20')
+        diff = review_diff(CODE, edited, 'Looks fine.', context=3)
+        self.assertEqual((diff.review, diff.changed_lines), ('Looks fine.', 2))
+
+    def test_no_change_or_a_large_one_needs_a_whole_review(self):
+        self.assertIsNone(review_diff(CODE, CODE, 'Looks fine.'))
+        self.assertIsNone(review_diff(CODE, CODE.replace('x', 'y'), 'Looks fine.'))
+        self.assertIsNone(review_diff(CODE, CODE + 'z = 1\n', 'A long review. ' * 200))
+        self.assertIsNone(review_diff(CODE, CODE + 'z = 1\n', ''))
+
+
+@override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=0, REVIEW_CACHE_TTL=0, REVIEW_DIFF_MAX_UPDATES=2)
+class IncrementalReviewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', password='owner')
+        self.client.force_authenticate(self.user)
+        self.snippet = Snippet.objects.create(owner=self.user, code=CODE, language='python')
+        self.url = reverse('snippet-review', args=[self.snippet.pk])
+        self.prompts = []
+        generate = get_client().models.generate_content
+
+        def recording(model, contents, config=None):
+            self.prompts.append(contents[0])
+            return generate(model, contents, config)
+
+        patcher = patch.object(get_client().models, 'generate_content', side_effect=recording)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def edit(self, old, new):
+        self.snippet.code = self.snippet.code.replace(old, new)
+        self.snippet.save()
+
+    def review(self, **data):
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.data['status'], 'done')
+        return response.data
+
+    def test_edits_update_the_last_review_from_a_diff(self):
+        first = self.review()
+        self.assertFalse(first['incremental'])
+        self.edit('return x + 20', 'return x - 20')
+        second = self.review()
+        self.assertTrue(second['incremental'])
+        self.assertIn(first['review'], self.prompts[-1])
+        self.assertIn('+    return x - 20', self.prompts[-1])
+        self.assertNotIn('def f40', self.prompts[-1])
+        self.assertLess(len(self.prompts[-1]), len(self.prompts[0]) / 2)
+        last = SnippetReview.objects.get(snippet=self.snippet)
+        self.assertEqual((last.content_id, last.review, last.updates), (self.snippet.content_id, second['review'], 1))
+
+    def test_full_reviews_and_the_update_limit(self):
+        self.review()
+        for i in range(3):
+            self.edit(f'return x + {i}\n', f'return x - {i}\n')
+            self.review()
+        self.assertEqual(list(ReviewJob.objects.values_list('incremental', flat=True)), [False, True, True, False])
+        self.edit('return x + 3\n', 'return x - 3\n')
+        self.assertFalse(self.review(full='true')['incremental'])
+        self.assertIn('def f40', self.prompts[-1])
+
+    @override_settings(REVIEW_CACHE_TTL=60)
+    def test_updated_reviews_are_not_shared_as_whole_ones(self):
+        first = self.review()
+        self.edit('return x + 20', 'return x - 20')
+        self.assertTrue(self.review()['incremental'])
+        self.assertEqual(list(ReviewResult.objects.values_list('review', flat=True)), [first['review']])
+        other = Snippet.objects.create(owner=User.objects.create_user('other'), code=self.snippet.code)
+        self.client.force_authenticate(other.owner)
+        response = self.client.post(reverse('snippet-review', args=[other.pk]))
+        self.assertEqual((response.data['incremental'], response.data['cached']), (False, False))
+        self.assertIn('def f40', self.prompts[-1])
+
+    @override_settings(REVIEW_CACHE_TTL=60)
+    def test_a_stored_whole_review_is_not_an_update(self):
+        self.review()
+        edited = self.snippet.code.replace('return x + 20', 'return x - 20')
+        Snippet.objects.create(owner=self.user, code=edited)
+        self.client.post(reverse('snippet-review', args=[Snippet.objects.last().pk]))
+        self.edit('return x + 20', 'return x - 20')
+        # Queued before the other snippet's review of this code was stored.
+        job = ReviewJob.objects.create(snippet=self.snippet, requested_by=self.user)
+        calls = len(self.prompts)
+        run_review_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.cached, job.incremental), ('done', True, False))
+        self.assertEqual(len(self.prompts), calls)
+        self.assertEqual(SnippetReview.objects.get(snippet=self.snippet).updates, 0)
+
+    def test_reviewed_code_is_kept_until_the_review_goes(self):
+        self.review()
+        reviewed = self.snippet.content_id
+        self.edit('return x + 20', 'return x - 20')
+        self.assertTrue(SnippetContent.objects.filter(pk=reviewed).exists())
+        self.review()
+        # The newer review points at the new code; the old one is collected.
+        self.assertFalse(SnippetContent.objects.filter(pk=reviewed).exists())
+        self.snippet.delete()
+        self.assertFalse(SnippetContent.objects.exists())
@@ -0,0 +1,72 @@
+import time
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from snippets.executor import HighlightExecutor, HighlightUnavailable, get_highlight_executor
+from snippets.highlighting import get_highlight_cache, render_highlight
+from snippets.models import HighlightState, Rendering, Snippet
+
+
+class HighlightExecutorTests(TestCase):
+    def setUp(self):
+        self.executor = HighlightExecutor(max_workers=1, max_queued=0)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_inline_mode_runs_in_caller(self):
+        done = []
+        executor = HighlightExecutor()
+        self.assertEqual(executor.run('k', max, 1, 2, on_done=done.append), 2)
+        self.assertEqual(done, [2])
+
+    def test_full_pool_rejects_new_jobs(self):
+        future = self.executor.submit('slow', time.sleep, 1)
+        with self.assertRaises(HighlightUnavailable):
+            self.executor.submit('other', time.sleep, 0)
+        self.assertIs(self.executor.submit('slow', time.sleep, 1), future)
+        self.assertEqual(self.executor.stats()['shared'], 1)
+        self.assertEqual(self.executor.stats()['rejected'], 1)
+        future.result()
+
+    def test_timeout_leaves_job_running_for_later_callers(self):
+        done = []
+        with self.assertRaises(HighlightUnavailable):
+            self.executor.run('slow', sum, range(10 ** 8), timeout=0.01, on_done=done.append)
+        self.assertEqual(self.executor.stats()['timeouts'], 1)
+        self.assertEqual(self.executor.run('slow', sum, range(10 ** 8), timeout=60), sum(range(10 ** 8)))
+        self.assertEqual(self.executor.stats()['submitted'], 1)
+        self.assertEqual(done, [sum(range(10 ** 8))])
+
+
+@override_settings(HIGHLIGHT_WORKERS=1, HIGHLIGHT_QUEUE_SIZE=0)
+class PooledHighlightTests(APITestCase):
+    def setUp(self):
+        get_highlight_cache().clear()
+        self.addCleanup(get_highlight_cache().clear)
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_render_runs_in_worker_and_is_cached(self):
+        submitted = get_highlight_executor().stats()['submitted']
+        html = render_highlight('x = 1', 'python', 'friendly', False)
+        self.assertIn('<span', html)
+        self.assertEqual(render_highlight('x = 1', 'python', 'friendly', False), html)
+        self.assertEqual(get_highlight_executor().stats()['submitted'], submitted + 1)
+
+    def test_busy_pool_defers_render_to_first_read(self):
+        busy = get_highlight_executor().submit('busy', time.sleep, 1)
+        snippet = Snippet.objects.create(owner=self.user, code='print("queued")')
+        self.assertEqual(snippet.highlight_state, HighlightState.PENDING)
+        busy.result()
+        response = self.client.get(reverse('snippet-detail', args=[snippet.id]))
+        self.assertIn('queued', response.data['highlight'])
+
+    def test_unavailable_read_returns_503(self):
+        snippet = Snippet.objects.create(owner=self.user, code='print("busy")')
+        Rendering.objects.update(render_version='0-old')
+        with patch('snippets.models.render_highlight_result', side_effect=HighlightUnavailable()):
+            response = self.client.get(reverse('snippet-highlight', args=[snippet.id]))
+        self.assertEqual(response.status_code, 503)
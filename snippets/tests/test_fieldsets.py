@@ -0,0 +1,52 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from snippets.models import Snippet
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(owner=self.user, title='Big', code='x = 1\n' * 100, language='python')
+
+    def snippet_select(self, queries):
+        return next(q['sql'] for q in queries if 'FROM "snippets_snippet"' in q['sql'] and 'COUNT' not in q['sql'])
+
+    def test_list_is_compact_and_skips_large_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('snippet-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        item = response.data['results'][0]
+        self.assertNotIn('code', item)
+        self.assertNotIn('highlight', item)
+        self.assertEqual(item['owner'], 'testuser')
+        self.assertEqual(item['preview'], ('x = 1\n' * 100)[:100] + '...')
+        sql = self.snippet_select(queries)
+        self.assertNotIn('"snippets_snippetcontent"."code"', sql)
+        self.assertNotIn('"snippets_rendering"."html"', sql)
+
+    def test_fields_parameter_selects_full_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('snippet-list'), {'fields': 'id,title,code'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'code'})
+        sql = self.snippet_select(queries)
+        self.assertIn('"snippets_snippetcontent"."code"', sql)
+        self.assertNotIn('"snippets_rendering"."html"', sql)
+
+    def test_omit_parameter_on_detail(self):
+        response = self.client.get(reverse('snippet-detail', args=[self.snippet.id]), {'omit': 'highlight,code'})
+        self.assertEqual(response.data['title'], 'Big')
+        self.assertNotIn('highlight', response.data)
+        self.assertNotIn('code', response.data)
+
+    def test_fields_parameter_on_create_only_narrows_the_response(self):
+        response = self.client.post(reverse('snippet-list') + '?fields=id', {'code': 'y = 2', 'title': 'New'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(set(response.data), {'id'})
+        snippet = Snippet.objects.get(pk=response.data['id'])
+        self.assertEqual((snippet.title, snippet.code), ('New', 'y = 2'))
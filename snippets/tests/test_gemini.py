@@ -0,0 +1,109 @@
+import threading
+import time
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from google.genai import errors
+
+from snippets.ai_review import ReviewError, get_client, review_code, stream_review
+from snippets.fake_gemini import FakeGeminiServer, FakeResponse
+from snippets.gemini import CircuitBreaker, CircuitOpen, ResilientClient, RetryPolicy
+from snippets.metrics import ai_tokens, registry
+
+
+def resilient(*outcomes, retries=2, threshold=5, call_timeout=60.0):
+    inner = Mock()
+    inner.models.generate_content.side_effect = outcomes
+    client = ResilientClient(inner, CircuitBreaker(threshold=threshold, cooldown=0.2), RetryPolicy(retries, 0.0, call_timeout, 120.0))
+    return client, inner.models.generate_content
+
+
+class ResilientClientTests(SimpleTestCase):
+    def test_retryable_errors_are_retried(self):
+        client, call = resilient(ConnectionError(), errors.ServerError(503, {}), FakeResponse('Fine.'))
+        self.assertEqual(client.models.generate_content(model='m', contents=['x']).text, 'Fine.')
+        self.assertEqual(call.call_count, 3)
+        self.assertEqual(client.stats()['retries'], 2)
+        self.assertEqual(client.breaker.failures, 0)
+
+    def test_gives_up_after_the_last_retry(self):
+        client, call = resilient(*[errors.ServerError(503, {})] * 3, retries=1)
+        with self.assertRaises(errors.ServerError):
+            client.models.generate_content(model='m', contents=['x'])
+        self.assertEqual(call.call_count, 2)
+
+    def test_client_errors_are_not_retried(self):
+        client, call = resilient(errors.ClientError(400, {}))
+        with self.assertRaises(errors.ClientError):
+            client.models.generate_content(model='m', contents=['x'])
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual(client.breaker.state, 'closed')
+
+    def test_each_attempt_gets_a_deadline(self):
+        client, call = resilient(FakeResponse('Fine.'), call_timeout=2.5)
+        client.models.generate_content(model='m', contents=['x'])
+        self.assertEqual(call.call_args.kwargs['config'].http_options.timeout, 2500)
+
+    def test_breaker_fails_fast_then_probes(self):
+        client, call = resilient(*[ConnectionError()] * 2, FakeResponse('Back.'), retries=0, threshold=2)
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                client.models.generate_content(model='m', contents=['x'])
+        with self.assertRaises(CircuitOpen):
+            client.models.generate_content(model='m', contents=['x'])
+        self.assertEqual((call.call_count, client.breaker.state), (2, 'open'))
+        time.sleep(0.25)
+        self.assertEqual(client.models.generate_content(model='m', contents=['x']).text, 'Back.')
+        self.assertEqual(client.breaker.stats(), {'state': 'closed', 'failures': 0, 'trips': 1, 'rejected': 1})
+
+    def test_a_failed_probe_opens_the_breaker_again(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=0.1)
+        breaker.record_failure()
+        time.sleep(0.15)
+        breaker.check()
+        # Only one caller probes at a time.
+        with self.assertRaises(CircuitOpen):
+            breaker.check()
+        breaker.record_failure()
+        self.assertEqual((breaker.state, breaker.trips), ('open', 2))
+
+
+class ClientSetupTests(SimpleTestCase):
+    @override_settings(GEMINI_FAKE=False, GEMINI_API_KEY='test-key')
+    def test_a_failed_setup_is_logged(self):
+        with patch('snippets.ai_review.build_client', side_effect=ValueError('bad base url')), self.assertLogs('snippets.ai_review', 'ERROR') as logs:
+            self.assertIsNone(get_client())
+        self.assertIn('bad base url', logs.output[0])
+
+
+class FakeServerTests(TestCase):
+    def setUp(self):
+        self.server = FakeGeminiServer(latency=0.05, jitter=0)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        overrides = override_settings(
+            GEMINI_FAKE=False, GEMINI_API_KEY='test-key', GEMINI_BASE_URL=self.server.url, GEMINI_MODEL='gemini-test',
+            GEMINI_RETRIES=2, GEMINI_RETRY_DELAY=0.01, GEMINI_BREAKER_THRESHOLD=3, REVIEW_CACHE_TTL=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_reviews_through_the_sdk(self):
+        registry.clear()
+        self.assertIn('fake', review_code('x = 1'))
+        self.assertGreater(len(list(stream_review('x = 1'))), 1)
+        self.assertEqual(self.server.requests, 2)
+        # Token counts come back as usage_metadata, with the last chunk of a stream.
+        self.assertEqual(ai_tokens.count(model='gemini-test', phase='review', kind='response'), 2)
+
+    def test_injected_errors_are_retried_then_trip_the_breaker(self):
+        self.server.failure_rate = 1
+        with self.assertRaisesMessage(ReviewError, '503'):
+            review_code('x = 1')
+        self.assertEqual(self.server.requests, 3)
+        with self.assertRaisesMessage(ReviewError, 'Gemini is unavailable'):
+            review_code('x = 1')
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(get_client().stats()['breaker']['state'], 'open')
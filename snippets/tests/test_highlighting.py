@@ -0,0 +1,217 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from snippets.caching import InstancePool, LRUCache
+from snippets.highlighting import (
+    Highlight, HighlightCache, RenderBudget, RenderOutcome, current_render_version, formatter_pool, get_highlight_cache,
+    highlight_code, lexer_pool, render_highlight, render_highlight_result,
+)
+from snippets.models import HighlightState, Rendering, Snippet
+
+
+class LRUCacheTests(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', '1')
+        cache.set('b', '2')
+        cache.get('a')
+        cache.set('c', '3')
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), '1')
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_evicts_by_weight(self):
+        cache = LRUCache(max_entries=10, max_weight=5)
+        cache.set('a', 'xxx')
+        cache.set('b', 'yyy')
+        self.assertEqual(len(cache), 1)
+        cache.set('c', 'z' * 6)
+        self.assertIsNone(cache.get('c'))
+
+
+class InstancePoolTests(TestCase):
+    def test_instances_are_reused_but_never_shared(self):
+        pool = InstancePool(lambda name: object())
+        with pool.acquire(('a',)) as first:
+            with pool.acquire(('a',)) as second:
+                self.assertIsNot(first, second)
+        with pool.acquire(('a',)) as again:
+            self.assertIn(again, (first, second))
+        self.assertEqual(pool.stats()['hits'], 1)
+
+    def test_idle_keys_are_bounded(self):
+        pool = InstancePool(lambda name: object(), max_keys=2)
+        for name in 'abc':
+            with pool.acquire((name,)):
+                pass
+        self.assertEqual(pool.stats()['keys'], 2)
+
+    @override_settings(HIGHLIGHT_CACHE_SIZE=0)
+    def test_render_reuses_lexer_and_formatter(self):
+        lexer_pool.clear()
+        formatter_pool.clear()
+        render_highlight('a = 1', 'python', 'colorful', False)
+        render_highlight('b = 2', 'python', 'colorful', False)
+        self.assertEqual(lexer_pool.stats()['hits'], 1)
+        self.assertEqual(formatter_pool.stats()['hits'], 1)
+
+
+class HighlightCacheTests(TestCase):
+    def setUp(self):
+        get_highlight_cache().clear()
+
+    def test_key_depends_on_options(self):
+        key = HighlightCache.make_key('x = 1', language='python', style='colorful', linenos=False)
+        self.assertEqual(key, HighlightCache.make_key('x = 1', language='python', style='colorful', linenos=False))
+        self.assertNotEqual(key, HighlightCache.make_key('x = 1', language='python', style='colorful', linenos=True))
+        self.assertNotEqual(key, HighlightCache.make_key('x = 2', language='python', style='colorful', linenos=False))
+
+    @patch('snippets.highlighting.format_tokens', wraps=__import__('pygments').format)
+    def test_duplicate_snippets_render_once(self, mock_highlight):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        first = Snippet.objects.create(owner=user, code='print("dup")', language='python')
+        second = Snippet.objects.create(owner=user, code='print("dup")', language='python')
+        self.assertEqual(first.highlighted, second.highlighted)
+        self.assertEqual(mock_highlight.call_count, 1)
+        # The second paste reuses the stored rendering without reaching the cache.
+        self.assertEqual(first.rendering_id, second.rendering_id)
+        stats = get_highlight_cache().stats()
+        self.assertEqual(stats['hits'], 0)
+        self.assertEqual(stats['misses'], 1)
+
+    @override_settings(
+        HIGHLIGHT_CACHE_ALIAS='default',
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    )
+    def test_shared_tier_is_consulted(self):
+        html = render_highlight('x = 1', 'python', 'colorful', False)
+        get_highlight_cache().local.clear()
+        self.assertEqual(render_highlight('x = 1', 'python', 'colorful', False), html)
+        self.assertEqual(get_highlight_cache().stats()['shared_hits'], 1)
+
+
+class RenderBudgetTests(APITestCase):
+    CODE = 'if a < b:\n    x = "<tag>"\n    y = 2\n'
+
+    def setUp(self):
+        get_highlight_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_size_budget_skips_lexing(self):
+        for budget in (RenderBudget(max_lines=2), RenderBudget(max_bytes=10)):
+            html, outcome = highlight_code(self.CODE, 'python', 'colorful', False, 'inline', budget=budget)
+            self.assertEqual(outcome, RenderOutcome.SKIPPED)
+            self.assertIn('&quot;&lt;tag&gt;&quot;', html)
+            self.assertNotIn('<span style', html)
+
+    def test_time_budget_leaves_rest_plain(self):
+        html, outcome = highlight_code(self.CODE, 'python', 'colorful', False, 'inline', budget=RenderBudget(max_seconds=0))
+        self.assertEqual(outcome, RenderOutcome.TRUNCATED)
+        self.assertIn('y = 2', html)
+        self.assertEqual(highlight_code(self.CODE, 'python', 'colorful', False, 'inline', budget=RenderBudget()).outcome, RenderOutcome.FULL)
+
+    def test_fallback_is_not_cached(self):
+        budget = RenderBudget(max_lines=1)
+        render_highlight_result(self.CODE, 'python', 'colorful', False, budget=budget)
+        self.assertEqual(render_highlight_result(self.CODE, 'python', 'colorful', False).outcome, RenderOutcome.FULL)
+        self.assertEqual(get_highlight_cache().stats()['misses'], 2)
+
+    @override_settings(HIGHLIGHT_MAX_LINES=2)
+    def test_snippet_reports_outcome_and_upgrades(self):
+        snippet = Snippet.objects.create(owner=self.user, code=self.CODE)
+        response = self.client.get(reverse('snippet-detail', args=[snippet.id]))
+        self.assertEqual(response.data['highlight_outcome'], 'skipped')
+        call_command('drain_highlights', upgrade=True, stdout=StringIO())
+        rendering = Rendering.objects.get()
+        self.assertEqual(rendering.outcome, RenderOutcome.FULL)
+        self.assertIn('<span style', rendering.html)
+
+
+@override_settings(HIGHLIGHT_DEFERRED=True)
+class DeferredHighlightTests(APITestCase):
+    def setUp(self):
+        get_highlight_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_save_marks_pending_without_rendering(self):
+        with patch('snippets.models.render_highlight_result') as mock_render:
+            snippet = Snippet.objects.create(owner=self.user, code='print("later")')
+        mock_render.assert_not_called()
+        self.assertEqual(snippet.highlight_state, HighlightState.PENDING)
+        self.assertEqual(snippet.highlighted, '')
+
+    def test_first_read_renders_and_persists(self):
+        snippet = Snippet.objects.create(owner=self.user, code='print("later")')
+        response = self.client.get(reverse('snippet-detail', args=[snippet.id]))
+        self.assertIn('later', response.data['highlight'])
+        snippet.refresh_from_db()
+        self.assertEqual(snippet.highlight_state, HighlightState.READY)
+        self.assertEqual(snippet.render_version, current_render_version())
+
+    def test_concurrent_first_reads_render_once(self):
+        snippet = Snippet.objects.create(owner=self.user, code='print("once")')
+        second_reader = Snippet.objects.get(pk=snippet.pk)
+        with patch('snippets.models.render_highlight_result', return_value=Highlight('<pre>once</pre>')) as mock_render:
+            snippet.ensure_highlighted()
+            self.assertEqual(second_reader.ensure_highlighted(), '<pre>once</pre>')
+        self.assertEqual(mock_render.call_count, 1)
+
+    def test_stale_render_version_is_rebuilt(self):
+        snippet = Snippet.objects.create(owner=self.user, code='print("old")')
+        snippet.ensure_highlighted()
+        Rendering.objects.filter(snippets=snippet).update(html='stale', render_version='0-old')
+        response = self.client.get(reverse('snippet-highlight', args=[snippet.id]))
+        self.assertNotIn('stale', response.content.decode())
+
+    def test_drain_command_renders_queue(self):
+        for i in range(3):
+            Snippet.objects.create(owner=self.user, code=f'x = {i}')
+        call_command('drain_highlights', batch_size=2, stdout=StringIO())
+        self.assertFalse(Snippet.objects.filter(highlight_state=HighlightState.PENDING).exists())
+
+    def test_drain_stale_rebuilds_shared_renderings(self):
+        first = Snippet.objects.create(owner=self.user, code='x = 1')
+        first.ensure_highlighted()
+        Snippet.objects.create(owner=self.user, code='x = 1')
+        Rendering.objects.update(html='stale', render_version='0-old')
+        call_command('drain_highlights', stale=True, stdout=StringIO())
+        rendering = Rendering.objects.get()
+        self.assertEqual(rendering.render_version, current_render_version())
+        self.assertNotIn('stale', rendering.html)
+
+
+class CssClassHighlightTests(APITestCase):
+    def setUp(self):
+        get_highlight_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(owner=self.user, code='def f():\n    return 1\n', style='monokai')
+
+    @override_settings(HIGHLIGHT_CSS_CLASSES=True)
+    def test_toggling_mode_rebuilds_html_with_classes(self):
+        self.assertIn('style="', self.snippet.highlighted)
+        response = self.client.get(reverse('snippet-detail', args=[self.snippet.id]))
+        self.assertIn('class="highlight-monokai"', response.data['highlight'])
+        self.assertNotIn('style="', response.data['highlight'])
+        self.assertIn('/styles/monokai.css?v=', response.data['stylesheet'])
+
+    def test_inline_mode_has_no_stylesheet(self):
+        response = self.client.get(reverse('snippet-detail', args=[self.snippet.id]))
+        self.assertIsNone(response.data['stylesheet'])
+
+    def test_stylesheet_endpoint(self):
+        response = self.client.get(reverse('style-css', args=['monokai']))
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('.highlight-monokai .k', response.content.decode())
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        cached = self.client.get(reverse('style-css', args=['monokai']), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.client.get(reverse('style-css', args=['no-such-style'])).status_code, 404)
@@ -0,0 +1,85 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from snippets.lines import build_line_index, parse_line_range
+from snippets.models import Snippet
+
+CODE = ''.join(f'value_{i} = {i}\n' for i in range(1, 1001))
+
+
+class LineIndexTests(SimpleTestCase):
+    def test_build_line_index(self):
+        self.assertEqual(build_line_index(''), (0, []))
+        self.assertEqual(build_line_index('a\nb'), (2, [0]))
+        self.assertEqual(build_line_index('a\nb\n', stride=1), (2, [0, 2]))
+        count, offsets = build_line_index(CODE, stride=256)
+        self.assertEqual(count, 1000)
+        self.assertEqual(CODE[offsets[1]:].split('\n', 1)[0], 'value_257 = 257')
+
+    def test_parse_line_range(self):
+        self.assertIsNone(parse_line_range(''))
+        self.assertEqual(parse_line_range('3-7'), (3, 7))
+        self.assertEqual(parse_line_range('3-'), (3, None))
+        self.assertEqual(parse_line_range('4'), (4, 4))
+        for bad in ('x', '0-3', '5-2'):
+            with self.assertRaises(Exception):
+                parse_line_range(bad)
+
+
+class LineRangeTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(owner=self.user, code=CODE, linenos=True)
+
+    def test_code_lines_match_full_split(self):
+        lines = CODE.splitlines(keepends=True)
+        deferred = Snippet.objects.select_related('content').defer('content__code').get(pk=self.snippet.pk)
+        for start, end in [(1, 1), (250, 260), (256, 257), (999, 1000), (512, 513)]:
+            self.assertEqual(deferred.code_lines(start, end), ''.join(lines[start - 1:end]))
+            self.assertEqual(self.snippet.code_lines(start, end), ''.join(lines[start - 1:end]))
+
+    def test_highlight_range_reads_only_a_slice(self):
+        url = reverse('snippet-highlight', args=[self.snippet.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'lines': '300-302'})
+        html = response.content.decode()
+        self.assertIn('value_301', html)
+        self.assertNotIn('value_303', html)
+        self.assertIn('300', html)  # line numbers start at the range
+        self.assertTrue(any('SUBSTR' in q['sql'] for q in queries))
+        self.assertFalse(any('"snippets_rendering"."html"' in q['sql'] for q in queries))
+
+    def test_detail_range(self):
+        response = self.client.get(reverse('snippet-detail', args=[self.snippet.id]), {'lines': '999-'})
+        self.assertEqual(response.data['code'], 'value_999 = 999\nvalue_1000 = 1000\n')
+        self.assertEqual(response.data['lines'], {'start': 999, 'end': 1000, 'total': 1000})
+
+    def test_bad_range_is_rejected(self):
+        response = self.client.get(reverse('snippet-detail', args=[self.snippet.id]), {'lines': 'x'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_streamed_detail_and_highlight(self):
+        response = self.client.get(reverse('snippet-detail', args=[self.snippet.id]), {'stream': '1'})
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['highlight'], self.snippet.highlighted)
+        self.assertEqual(data['title'], self.snippet.title)
+
+        response = self.client.get(reverse('snippet-highlight', args=[self.snippet.id]), {'stream': '1'})
+        self.assertEqual(b''.join(response.streaming_content).decode(), self.snippet.highlighted)
+
+    def test_streamed_shared_snippet(self):
+        Snippet.objects.filter(pk=self.snippet.pk).update(shared_password='secret')
+        User.objects.create_user(username='other', password='password')
+        self.client.login(username='other', password='password')
+        url = f'/snippets/shared/{self.snippet.uuid}/?stream=1'
+        response = self.client.post(url, {'password': 'secret'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['highlight'], self.snippet.highlighted)
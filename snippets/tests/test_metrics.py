@@ -0,0 +1,129 @@
+import json
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from snippets.ai_review import ReviewError, astream_review, get_client, review_code, stream_review
+from snippets.metrics import (
+    Counter, Histogram, ModelCall, Registry, ai_call_seconds, ai_calls, ai_errors, ai_first_token_seconds, ai_tokens, registry,
+    review_cache,
+)
+
+CONTEXT = {'user': 7, 'snippet': 3, 'job': 11}
+
+
+class RegistryTests(SimpleTestCase):
+    def test_renders_the_prometheus_text_format(self):
+        metrics = Registry()
+        calls = metrics.add(Counter('calls', 'Calls made.', ('model',)))
+        seconds = metrics.add(Histogram('call_seconds', 'Call time.', ('model',), buckets=(1, 5)))
+        calls.inc(model='a "b"')
+        calls.inc(2, model='a "b"')
+        for value in (0.5, 3, 3, 60):
+            seconds.observe(value, model='m')
+        self.assertEqual(metrics.render(), '\n'.join([
+            '# HELP calls Calls made.',
+            '# TYPE calls counter',
+            'calls_total{model="a \\"b\\""} 3',
+            '# HELP call_seconds Call time.',
+            '# TYPE call_seconds histogram',
+            'call_seconds_bucket{model="m",le="1"} 1',
+            'call_seconds_bucket{model="m",le="5"} 3',
+            'call_seconds_bucket{model="m",le="+Inf"} 4',
+            'call_seconds_sum{model="m"} 66.5',
+            'call_seconds_count{model="m"} 4',
+        ]) + '\n')
+        self.assertEqual((seconds.count(model='m'), seconds.sum(model='m')), (4, 66.5))
+
+    def test_labels_must_match(self):
+        with self.assertRaises(ValueError):
+            Counter('calls', 'Calls made.', ('model',)).inc(user=1)
+
+    def test_errors_count_under_the_class_they_were_raised_from(self):
+        registry.clear()
+        with self.assertRaises(ReviewError):
+            with ModelCall('m', stream=True):
+                try:
+                    raise TimeoutError()
+                except TimeoutError as e:
+                    raise ReviewError('Timed out.') from e
+        self.assertEqual(ai_errors.value(model='m', error='TimeoutError'), 1)
+        self.assertEqual(ai_calls.value(model='m', phase='review', mode='stream', outcome='error'), 1)
+
+
+@override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=0, GEMINI_MODEL='gemini-test', REVIEW_CACHE_TTL=60)
+class ModelCallMetricsTests(TestCase):
+    def setUp(self):
+        registry.clear()
+
+    def test_calls_tokens_and_cache_lookups_are_recorded_and_logged(self):
+        with self.assertLogs('snippets.metrics', 'INFO') as logs:
+            review = review_code('x = 1', context=CONTEXT)
+            self.assertEqual(review_code('x = 1', context=CONTEXT), review)
+        self.assertEqual(ai_calls.value(model='gemini-test', phase='review', mode='generate', outcome='ok'), 1)
+        self.assertEqual(ai_call_seconds.count(model='gemini-test', phase='review', mode='generate'), 1)
+        self.assertEqual(ai_tokens.count(model='gemini-test', phase='review', kind='prompt'), 1)
+        self.assertEqual(ai_tokens.sum(model='gemini-test', phase='review', kind='response'), -(-len(review) // 4))
+        self.assertEqual((review_cache.value(result='miss'), review_cache.value(result='hit')), (1, 1))
+
+        events = [json.loads(line.split(':', 2)[2]) for line in logs.output]
+        self.assertEqual([event['event'] for event in events], ['review_cache', 'ai_call', 'review_cache'])
+        call = events[1]
+        self.assertEqual({key: call[key] for key in ('model', 'phase', 'outcome', 'error', 'response_tokens', 'user', 'job')}, {
+            'model': 'gemini-test', 'phase': 'review', 'outcome': 'ok', 'error': None,
+            'response_tokens': -(-len(review) // 4), 'user': 7, 'job': 11,
+        })
+        self.assertEqual(events[2]['result'], 'hit')
+
+    def test_failures_are_counted_by_error_class(self):
+        get_client().failure_rate = 1
+        self.addCleanup(setattr, get_client(), 'failure_rate', 0)
+        with self.assertRaises(ReviewError):
+            review_code('x = 1')
+        self.assertEqual(ai_errors.value(model='gemini-test', error='ConnectionError'), 1)
+        self.assertEqual(ai_calls.value(model='gemini-test', phase='review', mode='generate', outcome='error'), 1)
+
+    @override_settings(REVIEW_TOKEN_BUDGET=3)
+    def test_chunked_reviews_are_recorded_per_phase(self):
+        review_code('x = 1\n\ny = 2\n', language='python')
+        self.assertEqual(ai_calls.value(model='gemini-test', phase='chunk', mode='generate', outcome='ok'), 2)
+        self.assertEqual(ai_calls.value(model='gemini-test', phase='merge', mode='generate', outcome='ok'), 1)
+
+    def test_streams_record_time_to_first_token(self):
+        self.assertGreater(len(list(stream_review('x = 1'))), 1)
+        self.assertEqual(ai_first_token_seconds.count(model='gemini-test', phase='review'), 1)
+        self.assertEqual(ai_tokens.count(model='gemini-test', phase='review', kind='response'), 1)
+
+    def test_a_stream_closed_part_way_counts_as_cancelled(self):
+        chunks = stream_review('x = 1')
+        next(chunks)
+        chunks.close()
+        self.assertEqual(ai_calls.value(model='gemini-test', phase='review', mode='stream', outcome='cancelled'), 1)
+
+    async def test_async_streams_are_recorded(self):
+        self.assertGreater(len([chunk async for chunk in astream_review('x = 2')]), 1)
+        self.assertEqual(ai_calls.value(model='gemini-test', phase='review', mode='stream', outcome='ok'), 1)
+        self.assertEqual(ai_first_token_seconds.count(model='gemini-test', phase='review'), 1)
+
+
+@override_settings(METRICS_TOKEN='scrape-me')
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        registry.clear()
+        review_cache.inc(result='hit')
+
+    def test_needs_the_token_or_staff(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('snippets_review_cache_total{result="hit"} 1', response.content.decode())
+
+        User.objects.create_user('staff', password='pw', is_staff=True)
+        self.client.login(username='staff', password='pw')
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_no_token_means_staff_only(self):
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
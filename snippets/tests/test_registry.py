@@ -0,0 +1,52 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from snippets import registry
+
+
+class RegistryTests(SimpleTestCase):
+    def setUp(self):
+        registry.load_registry.cache_clear()
+        self.addCleanup(registry.load_registry.cache_clear)
+        self.path = Path(tempfile.mkdtemp()) / 'registry.json'
+
+    def test_stored_registry_is_used_when_version_matches(self):
+        self.path.write_text(json.dumps({'pygments': registry.pygments.__version__, 'languages': [['py', 'Py']], 'styles': ['s']}))
+        with patch.object(registry, 'REGISTRY_PATH', self.path), patch.object(registry, 'build_registry') as mock_build:
+            self.assertEqual(registry.language_choices(), [('py', 'Py')])
+        mock_build.assert_not_called()
+
+    def test_registry_is_rebuilt_in_memory_for_other_pygments_version(self):
+        stale = json.dumps({'pygments': '0.0', 'languages': [], 'styles': []})
+        self.path.write_text(stale)
+        with patch.object(registry, 'REGISTRY_PATH', self.path), self.assertLogs('snippets.registry', 'WARNING'):
+            self.assertIn(('python', 'Python'), registry.language_choices())
+        # Running processes never write the file.
+        self.assertEqual(self.path.read_text(), stale)
+
+    def test_written_registry_replaces_the_file(self):
+        self.path.write_text('{}')
+        registry.write_registry(self.path)
+        self.assertEqual(json.loads(self.path.read_text())['pygments'], registry.pygments.__version__)
+        self.assertEqual([child.name for child in self.path.parent.iterdir()], [self.path.name])
+
+
+class LanguageValidationTests(APITestCase):
+    def setUp(self):
+        User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+
+    def test_unknown_language_and_style_are_rejected(self):
+        data = {'code': 'x', 'language': 'not-a-language', 'style': 'not-a-style'}
+        response = self.client.post(reverse('snippet-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('language', response.data)
+        self.assertIn('style', response.data)
@@ -0,0 +1,55 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from snippets.highlighting import current_render_version, get_highlight_cache
+from snippets.models import Rendering, Snippet
+
+
+class RehighlightCommandTests(TestCase):
+    def setUp(self):
+        get_highlight_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        other = User.objects.create_user(username='other', password='testpassword')
+        for i in range(5):
+            Snippet.objects.create(owner=self.user, code=f'x = {i}', language='python')
+        Snippet.objects.create(owner=other, code='let x = 1;', language='javascript')
+        Rendering.objects.update(html='stale', render_version='0-old')
+        self.checkpoint = Path(tempfile.mkdtemp()) / 'rehighlight.json'
+
+    def rehighlight(self, **options):
+        call_command('rehighlight', workers=0, chunk_size=2, stdout=StringIO(), **options)
+
+    def stale(self):
+        return Rendering.objects.exclude(render_version=current_render_version())
+
+    def test_rerenders_every_rendering(self):
+        self.rehighlight(stale=True)
+        self.assertFalse(self.stale().exists())
+        self.assertFalse(Rendering.objects.filter(html='stale').exists())
+
+    def test_filters(self):
+        self.rehighlight(language='javascript')
+        self.assertEqual(self.stale().count(), 5)
+        self.rehighlight(owner='testuser', style='colorful')
+        self.assertFalse(self.stale().exists())
+
+    def test_resumes_from_checkpoint(self):
+        first_three = list(Rendering.objects.order_by('pk').values_list('pk', flat=True)[:3])
+        filters = {'language': None, 'style': None, 'owner': None, 'stale': False}
+        self.checkpoint.write_text(json.dumps({'filters': filters, 'last_pk': first_three[-1], 'rendered': 3}))
+        self.rehighlight(checkpoint=self.checkpoint)
+        self.assertEqual(set(self.stale().values_list('pk', flat=True)), set(first_three))
+        # A finished run removes its checkpoint so the next one starts over.
+        self.assertFalse(self.checkpoint.exists())
+
+    def test_checkpoint_from_other_filters_is_refused(self):
+        filters = {'language': 'python', 'style': None, 'owner': None, 'stale': False}
+        self.checkpoint.write_text(json.dumps({'filters': filters, 'last_pk': 0, 'rendered': 0}))
+        with self.assertRaises(CommandError):
+            self.rehighlight(checkpoint=self.checkpoint)
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from snippets.ai_review import ReviewError, areview_code, get_client, get_review_cache, review_code, review_in_flight
+from snippets.models import ReviewFlight, ReviewJob, ReviewResult, ReviewStatus, Snippet, content_digest
+from snippets.reviews import aclaim_slot, claim_slot, finish_job, get_review_queue, run_review_job
+
+
+class ReviewJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(owner=self.user, code='print(1)')
+
+    def job(self, **kwargs):
+        return ReviewJob.objects.create(snippet=self.snippet, requested_by=self.user, **kwargs)
+
+    @override_settings(REVIEW_CONCURRENCY=1)
+    def test_job_waits_for_a_free_slot_then_gives_up(self):
+        self.job(status=ReviewStatus.RUNNING, slot=0, started=timezone.now())
+        waiting = self.job()
+        self.assertIsNone(claim_slot(waiting.pk, wait=0))
+        waiting.refresh_from_db()
+        self.assertEqual(waiting.status, ReviewStatus.FAILED)
+        self.assertIn('busy', waiting.error)
+
+    @override_settings(REVIEW_CONCURRENCY=1)
+    def test_waiting_jobs_reap_stale_ones_once(self):
+        self.job(status=ReviewStatus.RUNNING, slot=0, started=timezone.now())
+        with patch('snippets.reviews.SLOT_POLL_INTERVAL', 0.01), patch('snippets.reviews.reap_stale_jobs') as reap:
+            self.assertIsNone(claim_slot(self.job().pk, wait=0.1))
+        self.assertEqual(reap.call_count, 1)
+
+    @override_settings(REVIEW_CONCURRENCY=1)
+    async def test_a_freed_slot_wakes_the_waiting_job(self):
+        running = await sync_to_async(self.job)(status=ReviewStatus.RUNNING, slot=0, started=timezone.now())
+        waiting = await sync_to_async(self.job)()
+        with patch('snippets.reviews.SLOT_POLL_INTERVAL', 60):
+            claim = asyncio.ensure_future(aclaim_slot(waiting.pk, wait=60))
+            await asyncio.sleep(0.1)
+            self.assertFalse(claim.done())
+            await sync_to_async(finish_job)(running.pk, ReviewStatus.DONE)
+            claimed = await asyncio.wait_for(claim, 5)
+        self.assertEqual((claimed.pk, claimed.slot), (waiting.pk, 0))
+
+    @override_settings(REVIEW_CONCURRENCY=1, REVIEW_TIMEOUT=60)
+    def test_stale_running_job_frees_its_slot(self):
+        stale = self.job(status=ReviewStatus.RUNNING, slot=0, started=timezone.now() - timedelta(minutes=5))
+        claimed = claim_slot(self.job().pk, wait=0)
+        self.assertEqual((claimed.status, claimed.slot), (ReviewStatus.RUNNING, 0))
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.error), (ReviewStatus.FAILED, 'Review timed out.'))
+
+    @patch('snippets.reviews.review_code', side_effect=ReviewError('quota exceeded'))
+    def test_model_error_fails_the_job(self, mock_review):
+        job = self.job()
+        run_review_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error, job.slot), (ReviewStatus.FAILED, 'quota exceeded', None))
+        self.assertIsNotNone(job.finished)
+
+    @override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=0)
+    def test_fake_client_reviews_offline(self):
+        job = self.job()
+        run_review_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReviewStatus.DONE)
+        self.assertIn('fake', job.result)
+        self.assertEqual(get_client().calls, 1)
+
+
+class ReviewApiTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(owner=self.user, code='print(1)')
+        self.url = reverse('snippet-review', args=[self.snippet.pk])
+
+    @override_settings(REVIEW_WORKERS=1, REVIEW_QUEUE_SIZE=0)
+    def test_full_queue_answers_503(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with patch('snippets.reviews.run_review_job', side_effect=lambda job_id: release.wait(5)):
+            first = self.client.post(self.url)
+            second = self.client.post(self.url)
+            release.set()
+            get_review_queue().shutdown(wait=True)
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(first.data['status'], 'queued')
+        self.assertEqual(second.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(ReviewJob.objects.count(), 1)
+
+    def test_poll_is_limited_to_own_jobs(self):
+        other = User.objects.create_user(username='other', password='password')
+        job = ReviewJob.objects.create(snippet=self.snippet, requested_by=other)
+        response = self.client.get(reverse('review-detail', args=[job.pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_long_poll_returns_once_job_is_finished(self):
+        job = ReviewJob.objects.create(snippet=self.snippet, requested_by=self.user)
+        url = reverse('review-detail', args=[job.pk])
+        self.assertEqual(self.client.get(url, {'wait': 'soon'}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'wait': '0.3'})
+        self.assertEqual(response.data['status'], 'queued')
+        ReviewJob.objects.filter(pk=job.pk).update(status=ReviewStatus.DONE, result='Fine.')
+        response = self.client.get(url, {'wait': '10'})
+        self.assertEqual((response.data['status'], response.data['review']), ('done', 'Fine.'))
+
+
+@override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=0)
+class ReviewCacheTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(owner=self.user, code='print(1)')
+        self.url = reverse('snippet-review', args=[self.snippet.pk])
+        self.calls_before = get_client().calls
+
+    def model_calls(self):
+        return get_client().calls - self.calls_before
+
+    def test_identical_code_is_reviewed_once(self):
+        hits = get_review_cache().stats()['hits']
+        first = self.client.post(self.url)
+        other = Snippet.objects.create(owner=self.user, code='print(1)', title='copy')
+        second = self.client.post(reverse('snippet-review', args=[other.pk]))
+        self.assertEqual(self.model_calls(), 1)
+        self.assertEqual(second.data['review'], first.data['review'])
+        self.assertEqual((first.data['cached'], second.data['cached']), (False, True))
+        self.assertEqual(get_review_cache().stats()['hits'] - hits, 1)
+
+    def test_refresh_asks_the_model_again(self):
+        self.client.post(self.url)
+        response = self.client.post(self.url, {'refresh': True}, format='json')
+        self.assertEqual(response.data['status'], 'done')
+        self.assertFalse(response.data['cached'])
+        self.assertEqual(self.model_calls(), 2)
+        self.assertEqual(ReviewResult.objects.count(), 1)
+
+    def test_model_and_ttl_are_respected(self):
+        review_code('x = 1')
+        with override_settings(GEMINI_MODEL='another-model'):
+            review_code('x = 1')
+        self.assertEqual(self.model_calls(), 2)
+        ReviewResult.objects.update(created=timezone.now() - timedelta(days=30))
+        review_code('x = 1')
+        self.assertEqual(self.model_calls(), 3)
+
+    @override_settings(REVIEW_CACHE_MAX_ENTRIES=2)
+    def test_oldest_entries_are_evicted(self):
+        for code in ('a = 1', 'b = 2', 'c = 3'):
+            review_code(code)
+        self.assertEqual(ReviewResult.objects.count(), 2)
+        review_code('c = 3')
+        self.assertEqual(self.model_calls(), 3)
+
+
+@override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=0.2)
+class ReviewCoalescingTests(TestCase):
+    def setUp(self):
+        self.calls_before = get_client().calls
+
+    def model_calls(self):
+        return get_client().calls - self.calls_before
+
+    def burst(self, callers=20):
+        outcomes = []
+
+        def review():
+            try:
+                outcomes.append(review_code('x = 1', refresh=True))
+            except ReviewError as exc:
+                outcomes.append(exc)
+
+        threads = [threading.Thread(target=review) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    # With the stored cache off the threads never touch the test database.
+    @override_settings(REVIEW_CACHE_TTL=0)
+    def test_concurrent_identical_reviews_share_one_call(self):
+        outcomes = self.burst()
+        self.assertEqual(self.model_calls(), 1)
+        self.assertEqual(len(outcomes), 20)
+        self.assertEqual(len(set(outcomes)), 1)
+        self.assertIn('fake', outcomes[0])
+
+    @override_settings(REVIEW_CACHE_TTL=0)
+    def test_a_failed_call_fails_everyone_waiting_on_it(self):
+        get_client().failure_rate = 1
+        self.addCleanup(setattr, get_client(), 'failure_rate', 0)
+        outcomes = self.burst()
+        self.assertEqual(self.model_calls(), 1)
+        self.assertTrue(all(isinstance(outcome, ReviewError) for outcome in outcomes))
+        # The failure is not remembered: the next caller asks again.
+        get_client().failure_rate = 0
+        self.assertIn('fake', review_code('x = 1'))
+        self.assertEqual(self.model_calls(), 2)
+
+    @override_settings(REVIEW_CACHE_TTL=0)
+    async def test_concurrent_async_reviews_share_one_call(self):
+        reviews = await asyncio.gather(*(areview_code('x = 1') for _ in range(20)))
+        self.assertEqual(self.model_calls(), 1)
+        self.assertEqual(len(set(reviews)), 1)
+
+    def test_waits_for_another_process_to_store_the_review(self):
+        cache = get_review_cache()
+        digest = content_digest('x = 1')
+        ReviewFlight.objects.create(key=cache.make_key(digest))
+
+        def other_process_finishes(seconds):
+            cache.set(digest, 'Reviewed elsewhere.')
+            cache.release(digest)
+
+        with patch('snippets.ai_review.time.sleep', side_effect=other_process_finishes) as sleep:
+            self.assertEqual(review_code('x = 1'), 'Reviewed elsewhere.')
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(self.model_calls(), 0)
+        self.assertFalse(ReviewFlight.objects.exists())
+
+    @override_settings(REVIEW_TIMEOUT=60)
+    def test_lease_left_by_a_killed_process_expires(self):
+        cache = get_review_cache()
+        ReviewFlight.objects.create(key=cache.make_key(content_digest('x = 1')), started=timezone.now() - timedelta(minutes=5))
+        self.assertIn('fake', review_code('x = 1'))
+        self.assertEqual(self.model_calls(), 1)
+        self.assertFalse(ReviewFlight.objects.exists())
+
+
+@override_settings(GEMINI_FAKE=True, GEMINI_FAKE_LATENCY=0)
+class StreamingReviewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(owner=self.user, code='print(1)')
+        self.url = reverse('snippet-review', args=[self.snippet.pk]) + '?stream=1'
+
+    def events(self, response):
+        messages = b''.join(response.streaming_content).decode().strip().split('\n\n')
+        return [(m.split('\n')[0].removeprefix('event: '), json.loads(m.split('\n')[1].removeprefix('data: '))) for m in messages]
+
+    def test_review_is_relayed_in_chunks_and_stored(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        events = self.events(response)
+        chunks = [data for event, data in events if event == 'chunk']
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(events[-1], ('done', {'id': ReviewJob.objects.get().pk, 'status': 'done', 'cached': False}))
+        self.assertEqual(ReviewJob.objects.get().result, ''.join(chunks))
+        self.assertEqual(ReviewResult.objects.get().review, ''.join(chunks))
+
+        events = self.events(self.client.post(self.url))
+        self.assertEqual([event for event, _ in events], ['chunk', 'done'])
+        self.assertTrue(events[-1][1]['cached'])
+
+    def test_client_disconnect_stops_the_review(self):
+        response = self.client.post(self.url)
+        next(iter(response.streaming_content))
+        response.close()
+        job = ReviewJob.objects.get()
+        self.assertEqual(job.status, ReviewStatus.FAILED)
+        self.assertIn('went away', job.error)
+        self.assertFalse(ReviewResult.objects.exists())
+
+    def test_a_stream_closed_before_it_started_frees_the_slot(self):
+        self.client.post(self.url).close()
+        job = ReviewJob.objects.get()
+        self.assertEqual((job.status, job.slot), (ReviewStatus.FAILED, None))
+        self.assertIn('went away', job.error)
+
+    def test_a_failure_before_the_review_fails_the_job(self):
+        with patch('snippets.reviews.last_review_diff', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.events(self.client.post(self.url))
+        job = ReviewJob.objects.get()
+        self.assertEqual((job.status, job.slot, job.error), (ReviewStatus.FAILED, None, 'The review failed unexpectedly.'))
+
+    # The leading thread never touches the test database with the stored cache off.
+    @override_settings(REVIEW_CONCURRENCY=1, REVIEW_CACHE_TTL=0)
+    def test_a_review_in_flight_is_streamed_without_a_slot(self):
+        calls_before = get_client().calls
+        self.addCleanup(setattr, get_client(), 'latency', get_client().latency)
+        get_client().latency = 0.5
+        leader = threading.Thread(target=review_code, args=('print(1)',))
+        leader.start()
+        self.addCleanup(leader.join)
+        while not review_in_flight('print(1)'):
+            time.sleep(0.01)
+        ReviewJob.objects.create(snippet=self.snippet, requested_by=self.user, status=ReviewStatus.RUNNING, slot=0, started=timezone.now())
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        events = self.events(response)
+        self.assertEqual([event for event, _ in events], ['chunk', 'done'])
+        job = ReviewJob.objects.get(pk=events[-1][1]['id'])
+        self.assertEqual((job.status, job.slot), (ReviewStatus.DONE, None))
+        self.assertEqual(get_client().calls - calls_before, 1)
+
+    def test_timeout_and_model_errors_end_with_an_error_event(self):
+        with override_settings(REVIEW_TIMEOUT=0):
+            events = self.events(self.client.post(self.url))
+        self.assertEqual(events[-1], ('error', {'detail': 'Review timed out.'}))
+        with patch('snippets.ai_review.get_client', return_value=None):
+            events = self.events(self.client.post(self.url))
+        self.assertEqual(events[-1][0], 'error')
+        self.assertEqual(ReviewJob.objects.filter(status=ReviewStatus.FAILED).count(), 2)
+        self.assertFalse(ReviewResult.objects.exists())
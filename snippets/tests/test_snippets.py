@@ -1,4 +1,4 @@
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 
 from django.contrib.auth.models import User
 from django.urls import reverse
@@ -22,6 +22,13 @@ class SnippetTests(APITestCase):
         self.assertEqual(Snippet.objects.count(), 2)
         self.assertIsNotNone(Snippet.objects.last().shared_password) # Check password generated
 
+    def test_code_with_a_lone_surrogate_is_rejected(self):
+        body = '{"code": "s = \\"\\udc80\\""}'
+        response = self.client.post(reverse('snippet-list'), body, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('code', response.data)
+        self.assertEqual(Snippet.objects.count(), 1)
+
     def test_retrieve_snippet(self):
         url = reverse('snippet-detail', args=[self.snippet.id])
         response = self.client.get(url)
@@ -101,7 +108,7 @@ class SnippetTests(APITestCase):
         # Expected content based on code='print("hello")' and language='python'
         self.assertIn('hello', str(response.content))
 
-    @patch('snippets.views.review_code')
+    @patch('snippets.reviews.review_code')
     def test_review_snippet(self, mock_review):
         mock_review.return_value = "Code looks good."
         url = reverse('snippet-review', args=[self.snippet.id])
@@ -110,13 +117,20 @@ class SnippetTests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.data['detail'], 'Send a POST request to review this snippet.')
 
-        # Test POST
+        # Test POST: a job is accepted (and, with inline workers, already done)
         response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(response.data['review'], "Code looks good.")
+        context = {'user': self.user.pk, 'snippet': self.snippet.pk, 'job': response.data['id']}
+        mock_review.assert_called_once_with(self.snippet.code, refresh=False, language=self.snippet.language, context=context, diff=None, source=ANY)
+
+        # The job can be polled at its url
+        response = self.client.get(response['Location'])
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['review'], "Code looks good.")
-        mock_review.assert_called_once_with(self.snippet.code)
 
-    @patch('snippets.views.review_code')
+    @patch('snippets.reviews.review_code')
     def test_review_shared_snippet(self, mock_review):
         mock_review.return_value = "Shared code looks good."
         uuid = self.snippet.uuid
@@ -143,5 +157,5 @@ class SnippetTests(APITestCase):
 
         # Test with correct password
         response = self.client.post(url, {'password': password})
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
         self.assertEqual(response.data['review'], "Shared code looks good.")
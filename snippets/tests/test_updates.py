@@ -0,0 +1,84 @@
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from snippets.highlighting import get_highlight_cache, render_highlight_result
+from snippets.models import Rendering, Snippet
+
+
+def writes(queries):
+    return [query['sql'] for query in queries if not query['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+
+
+class DirtyFieldTests(TestCase):
+    def setUp(self):
+        get_highlight_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        Snippet.objects.create(owner=self.user, code='def f():\n    return 1\n', title='Old')
+        self.snippet = Snippet.objects.get()
+
+    def test_unchanged_save_issues_no_queries(self):
+        with self.assertNumQueries(0):
+            self.snippet.save()
+
+    def test_metadata_change_writes_only_that_column_without_rendering(self):
+        self.snippet.title = 'New'
+        self.snippet.shared_password = 'secret'
+        with patch('snippets.models.render_highlight_result') as mock_render, CaptureQueriesContext(connection) as ctx:
+            self.snippet.save()
+        mock_render.assert_not_called()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]['sql']
+        self.assertTrue(sql.startswith('UPDATE "snippets_snippet" SET "title" = \'New\', "shared_password" = \'secret\' WHERE'), sql)
+        self.assertEqual(Snippet.objects.get().title, 'New')
+
+    def test_style_change_renders_only_when_no_rendering_exists(self):
+        self.snippet.style = 'monokai'
+        with patch('snippets.models.render_highlight_result', wraps=render_highlight_result) as mock_render:
+            self.snippet.save()
+            self.assertEqual(mock_render.call_count, 1)
+            self.snippet.style = 'colorful'
+            self.snippet.save()
+            self.assertEqual(mock_render.call_count, 1)
+        self.assertEqual(Rendering.objects.count(), 2)
+        self.assertEqual(Snippet.objects.get().rendering.style, 'colorful')
+
+    def test_code_change_is_written_with_render_fields(self):
+        self.snippet.code = 'x = 2\n'
+        with CaptureQueriesContext(connection) as ctx:
+            self.snippet.save()
+        # Releasing the old content also nulls references to its renderings, which match no rows here.
+        update = [sql for sql in writes(ctx.captured_queries) if sql.startswith('UPDATE "snippets_snippet" SET "content_id"')]
+        self.assertEqual(len(update), 1)
+        for column in ('"content_id"', '"code_preview"', '"rendering_id"'):
+            self.assertIn(column, update[0])
+        self.assertNotIn('"title"', update[0])
+        self.assertEqual(Snippet.objects.get().code, 'x = 2\n')
+
+    def test_lazily_loaded_columns_are_not_dirty(self):
+        snippet = Snippet.objects.only('pk', 'title').get()
+        snippet.language
+        snippet.title = 'Renamed'
+        self.assertEqual(snippet.dirty_fields(), ['title'])
+
+
+class MetadataPatchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.snippet = Snippet.objects.create(owner=self.user, code='print("big")\n' * 100, title='Old')
+
+    def test_patch_title_does_not_rewrite_content_or_rendering(self):
+        url = reverse('snippet-detail', args=[self.snippet.id]) + '?fields=id,title'
+        with patch('snippets.models.render_highlight_result') as mock_render, CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(url, {'title': 'New'}, format='json')
+        self.assertEqual(response.data, {'id': self.snippet.id, 'title': 'New'})
+        mock_render.assert_not_called()
+        self.assertEqual(writes(ctx.captured_queries), [
+            f'UPDATE "snippets_snippet" SET "title" = \'New\' WHERE "snippets_snippet"."id" = {self.snippet.id}',
+        ])
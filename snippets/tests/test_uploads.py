@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from snippets.models import Snippet
+
+
+class RawUploadTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.login(username='testuser', password='testpassword')
+        self.url = reverse('snippet-create-raw')
+
+    def test_plain_text_upload(self):
+        code = 'def héllo():\n    return 1\n' * 50
+        response = self.client.post(f'{self.url}?title=Raw&linenos=true', code.encode(), content_type='text/plain; charset=utf-8',
+                                    headers={'X-Snippet-Language': 'python', 'X-Snippet-Title': 'ignored'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['title'], 'Raw')
+        self.assertTrue(response.data['preview'].endswith('...'))
+        self.assertNotIn('code', response.data)
+        snippet = Snippet.objects.get(pk=response.data['id'])
+        self.assertEqual(snippet.code, code)
+        self.assertTrue(snippet.linenos)
+        self.assertIn('llo', snippet.highlighted)
+        self.assertTrue(snippet.shared_password)
+
+    def test_octet_stream_and_other_charsets(self):
+        response = self.client.post(self.url, 'x = "é"'.encode('latin-1'), content_type='text/plain; charset=latin-1')
+        self.assertEqual(Snippet.objects.get(pk=response.data['id']).code, 'x = "é"')
+        response = self.client.post(self.url, b'\xff\xfe', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(SNIPPET_MAX_UPLOAD_BYTES=100)
+    def test_size_limit(self):
+        response = self.client.post(self.url, b'x' * 101, content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        response = self.client.post(self.url, b'x' * 100, content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_rejects_other_content_and_bad_metadata(self):
+        response = self.client.post(self.url, {'code': 'x'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        response = self.client.post(f'{self.url}?language=nope', b'x', content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('language', response.data)
+        response = self.client.post(self.url, b'', content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Snippet.objects.exists())
@@ -0,0 +1,58 @@
+"""
+Reading raw (non-JSON) snippet uploads.
+
+The body is read from the request stream in chunks into one buffer and decoded
+once, instead of going through request.body, a parser and the serializer,
+each of which keeps its own copy of a large paste.
+"""
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError, UnsupportedMediaType
+
+RAW_CONTENT_TYPES = ('text/plain', 'application/octet-stream')
+RAW_METADATA = ('title', 'language', 'style', 'linenos')
+CHUNK_SIZE = 64 * 1024
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Upload is too large.'
+    default_code = 'payload_too_large'
+
+
+def read_raw_code(request, max_bytes):
+    """
+    Return the request body decoded as text. Oversized uploads are refused from
+    Content-Length before anything is read, or as soon as the stream passes
+    `max_bytes` when the length is not declared.
+    """
+    media_type = request.content_type.split(';', 1)[0].strip().lower()
+    if media_type not in RAW_CONTENT_TYPES:
+        raise UnsupportedMediaType(media_type)
+    try:
+        declared = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        declared = 0
+    if declared > max_bytes:
+        raise PayloadTooLarge(f'Upload is larger than {max_bytes} bytes.')
+    buffer = bytearray()
+    while chunk := request.read(CHUNK_SIZE):
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise PayloadTooLarge(f'Upload is larger than {max_bytes} bytes.')
+    if not buffer:
+        raise ParseError('Empty upload.')
+    charset = request.content_params.get('charset', 'utf-8')
+    try:
+        return buffer.decode(charset)
+    except (LookupError, UnicodeDecodeError):
+        raise ParseError(f'Upload is not valid {charset} text.')
+
+
+def raw_metadata(request):
+    """Snippet fields given as query parameters or X-Snippet-* headers, query parameters first."""
+    metadata = {}
+    for name in RAW_METADATA:
+        value = request.query_params.get(name, request.headers.get(f'X-Snippet-{name.title()}'))
+        if value is not None:
+            metadata[name] = value
+    return metadata
@@ -1,16 +1,28 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from snippets import views
+from snippets import async_views, views
 
 router = DefaultRouter()
 router.register(r'snippets', views.SnippetViewSet, basename='snippet')
 router.register(r'users', views.UserViewSet)
+router.register(r'reviews', views.ReviewJobViewSet, basename='review')
+
+# Served by an ASGI server (REVIEW_ASYNC), the review endpoints use native
+# async views in place of the SnippetViewSet actions.
+async_review_urls = [
+    path('snippets/<int:pk>/review/', async_views.review),
+    path('snippets/shared/<str:uuid>/review/', async_views.review_shared),
+]
 
 urlpatterns = [
+    *(async_review_urls if settings.REVIEW_ASYNC else []),
     path('', include(router.urls)),
     path('register/', views.RegisterViewSet.as_view({'post': 'create'}), name='register'),
     path('login/', views.login, name='login'),
     path('logout/', views.logout, name='logout'),
     path('current_user/', views.current_user),
+    path('styles/<str:name>.css', views.style_css, name='style-css'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
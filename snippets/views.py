@@ -1,35 +1,120 @@
 import secrets
 import string
 
+import pygments
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import etag, require_GET
+from pygments.util import ClassNotFound
 from rest_framework import permissions, renderers, status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from .ai_review import review_code
-from .models import Snippet
-from .serializers import RegisterSerializer, SnippetSerializer, UserSerializer
+from .highlighting import stylesheet
+from .lines import parse_line_range
+from .metrics import registry
+from .models import ReviewJob, ReviewStatus, Snippet
+from .reviews import ReviewUnavailable, get_review_queue, open_review, review_batch, review_events, wait_for_job
+from .serializers import RegisterSerializer, ReviewJobSerializer, SnippetListSerializer, SnippetSerializer, UserSerializer
+from .streaming import ndjson_line, stream_json
+from .uploads import raw_metadata, read_raw_code
 
 
 class SnippetViewSet(viewsets.ModelViewSet):
     serializer_class = SnippetSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
-        return Snippet.objects.filter(owner=self.request.user)
+    def get_serializer_class(self):
+        # The list is compact by default; asking for explicit fields opts back
+        # into the full representation, narrowed to those fields.
+        if self.action == 'list' and 'fields' not in self.request.query_params:
+            return SnippetListSerializer
+        return super().get_serializer_class()
 
-    @action(detail=True, renderer_classes=[renderers.StaticHTMLRenderer]) 
+    def get_queryset(self):
+        return self.optimize_queryset(Snippet.objects.filter(owner=self.request.user))
+
+    def optimize_queryset(self, queryset):
+        if self.action in ('list', 'retrieve', 'retrieve_shared'):
+            return self.get_serializer().optimize_queryset(queryset)
+        if self.action == 'highlight' and (self.line_range or self.stream):
+            return queryset.select_related('content', 'rendering').defer('content__code', 'rendering__html')
+        if self.action in ('review', 'review_shared'):
+            # Reviews are looked up by the content digest; the job reads the code itself.
+            return queryset.select_related('content').defer('content__code', 'content__line_index')
+        if self.action == 'review_batch':
+            return queryset.select_related('content').defer('content__line_index')
+        return queryset
+
+    @property
+    def line_range(self):
+        return parse_line_range(self.request.query_params.get('lines'))
+
+    @property
+    def stream(self):
+        return self.request.query_params.get('stream') in ('1', 'true')
+
+    def review_flag(self, name):
+        data = self.request.data if isinstance(self.request.data, dict) else {}
+        value = data.get(name, self.request.query_params.get(name))
+        return str(value).lower() in ('1', 'true')
+
+    @property
+    def refresh_review(self):
+        return self.review_flag('refresh')
+
+    @property
+    def full_review(self):
+        return self.review_flag('full')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context.update(line_range=self.line_range, stream=self.stream)
+        return context
+
+    def snippet_response(self, snippet):
+        """
+        Detail payload for `snippet`. With ?stream=1 the highlighted HTML, which
+        dominates the size, is streamed from the database in chunks as the last
+        member of the JSON object.
+        """
+        serializer = self.get_serializer(snippet)
+        if not serializer.stream_highlight:
+            return Response(serializer.data)
+        # Render failures must surface before the response has started.
+        snippet.ensure_highlighted()
+        return StreamingHttpResponse(
+            stream_json(serializer.data, 'highlight', snippet.iter_highlighted()),
+            content_type='application/json',
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.snippet_response(self.get_object())
+
+    @action(detail=True, renderer_classes=[renderers.StaticHTMLRenderer])
     def highlight(self, request, *args, **kwargs):
-        snippet = self.get_object() 
-        return Response(snippet.highlighted)
+        snippet = self.get_object()
+        if self.line_range:
+            return Response(snippet.render_lines(*self.line_range))
+        if self.stream:
+            snippet.ensure_highlighted()
+            return StreamingHttpResponse(snippet.iter_highlighted(), content_type='text/html; charset=utf-8')
+        return Response(snippet.ensure_highlighted())
 
     @action(detail=True, methods=['post', 'get'], url_path='review')
     def review(self, request, *args, **kwargs):
         """
         Review the snippet code using AI.
-        Only the owner can trigger this.
+        Only the owner can trigger this. Answers 202 with a review job to poll
+        at its `url` until its status is done or failed, or with `?stream=1`
+        relays the review as Server-Sent Events while the model writes it.
+        After an edit, the snippet's last review is updated from the changes
+        unless `full=true` asks for a new review of the whole code.
         """
         if request.method == 'GET':
              return Response({'detail': 'Send a POST request to review this snippet.'})
@@ -41,18 +126,106 @@ class SnippetViewSet(viewsets.ModelViewSet):
         if snippet.owner != request.user:
              return Response({'detail': 'You do not have permission to review this snippet.'}, status=status.HTTP_403_FORBIDDEN)
 
-        review_result = review_code(snippet.code)
-        return Response({'review': review_result})
-
-    def perform_create(self, serializer):
+        return self.start_review(snippet)
+
+    def start_review(self, snippet):
+        job = open_review(snippet, self.request.user, full=self.full_review, refresh=self.refresh_review)
+        if self.stream:
+            return self.event_stream(review_events(job))
+        if not job.is_finished:
+            try:
+                get_review_queue().submit(job.pk)
+            except ReviewUnavailable:
+                job.delete()
+                raise
+            # Inline jobs have already finished by now.
+            job.refresh_from_db()
+        data = ReviewJobSerializer(job, context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': data['url']})
+
+    @action(detail=False, methods=['post'], url_path='review')
+    def review_batch(self, request):
+        """
+        Review many of the user's snippets at once: those listed in `ids`
+        (or a body that is just the list), or else all of them, only in
+        `language` if given. Streams one line of JSON per snippet as its
+        review finishes (its review job, or an error for an unknown id),
+        then a summary line. Identical code is reviewed once; `refresh` and
+        `full` apply as for a single review.
+        """
+        data = request.data
+        if isinstance(data, list):
+            data = {'ids': data}
+        elif not isinstance(data, dict):
+            raise ValidationError({'ids': 'Expected a list of snippet ids.'})
+        ids = data.get('ids')
+        limit = settings.REVIEW_BATCH_MAX_ITEMS
+        queryset = self.get_queryset()
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+                raise ValidationError({'ids': 'Expected a list of snippet ids.'})
+            ids = list(dict.fromkeys(ids))
+            if len(ids) > limit:
+                raise ValidationError({'ids': f'At most {limit} snippets can be reviewed at once.'})
+            snippets = queryset.in_bulk(ids)
+            missing = [pk for pk in ids if pk not in snippets]
+            snippets = [snippets[pk] for pk in ids if pk in snippets]
+        else:
+            language = data.get('language', request.query_params.get('language'))
+            if language:
+                queryset = queryset.filter(language=language)
+            snippets = list(queryset.order_by('pk')[:limit + 1])
+            missing = []
+            if len(snippets) > limit:
+                raise ValidationError({'ids': f'At most {limit} snippets can be reviewed at once; list the ones to review.'})
+        full = self.full_review
+        refresh = self.refresh_review or full
+        jobs = ReviewJob.objects.bulk_create(
+            ReviewJob(snippet=snippet, requested_by=request.user, refresh=refresh, full=full) for snippet in snippets
+        )
+        return self.event_stream(self.batch_lines(jobs, missing), content_type='application/x-ndjson; charset=utf-8')
+
+    def batch_lines(self, jobs, missing):
+        done = 0
+        for pk in missing:
+            yield ndjson_line({'snippet': pk, 'status': ReviewStatus.FAILED, 'error': 'Snippet not found.'})
+        context = self.get_serializer_context()
+        for job in review_batch(jobs):
+            done += job.status == ReviewStatus.DONE
+            yield ndjson_line(ReviewJobSerializer(job, context=context).data)
+        total = len(jobs) + len(missing)
+        yield ndjson_line({'summary': {'snippets': total, 'done': done, 'failed': total - done}})
+
+    def event_stream(self, events, content_type='text/event-stream; charset=utf-8'):
+        response = StreamingHttpResponse(events, content_type=content_type)
+        response['Cache-Control'] = 'no-cache'
+        # Keep reverse proxies from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def perform_create(self, serializer, **extra):
         # Generate a random password for sharing if not provided
         shared_password = serializer.validated_data.get('shared_password')
         if not shared_password:
              alphabet = string.ascii_letters + string.digits
              shared_password = ''.join(secrets.choice(alphabet) for i in range(8))
-             serializer.save(owner=self.request.user, shared_password=shared_password)
+             serializer.save(owner=self.request.user, shared_password=shared_password, **extra)
         else:
-             serializer.save(owner=self.request.user)
+             serializer.save(owner=self.request.user, **extra)
+
+    @action(detail=False, methods=['post'], url_path='raw')
+    def create_raw(self, request):
+        """
+        Create a snippet from a text/plain or application/octet-stream body, for
+        CLI tools. Title, language, style and linenos come from query parameters
+        or X-Snippet-* headers. Responds with the compact list representation.
+        """
+        code = read_raw_code(request, settings.SNIPPET_MAX_UPLOAD_BYTES)
+        serializer = SnippetSerializer(data=raw_metadata(request), partial=True, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer, code=code)
+        data = SnippetListSerializer(serializer.instance, context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_201_CREATED)
 
     @action(detail=False, url_path='shared/(?P<uuid>[^/.]+)', methods=['post'])
     def retrieve_shared(self, request, uuid=None):
@@ -60,32 +233,30 @@ class SnippetViewSet(viewsets.ModelViewSet):
         Retrieve a snippet by UUID and password.
         """
         try:
-            snippet = Snippet.objects.get(uuid=uuid)
+            snippet = self.optimize_queryset(Snippet.objects.all()).get(uuid=uuid)
         except Snippet.DoesNotExist:
             return Response({'detail': 'Snippet not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         # If user is owner, return without password check
         if request.user == snippet.owner:
-             serializer = self.get_serializer(snippet)
-             return Response(serializer.data)
+             return self.snippet_response(snippet)
 
         password = request.data.get('password')
         if not password:
             return Response({'detail': 'Password required.'}, status=status.HTTP_400_BAD_REQUEST)
 
         if snippet.shared_password == password:
-             serializer = self.get_serializer(snippet)
-             return Response(serializer.data)
+             return self.snippet_response(snippet)
         else:
              return Response({'detail': 'Incorrect password.'}, status=status.HTTP_403_FORBIDDEN)
 
     @action(detail=False, url_path='shared/(?P<uuid>[^/.]+)/review', methods=['post'])
     def review_shared(self, request, uuid=None):
         """
-        Review a shared snippet by UUID and password using AI.
+        Review a shared snippet by UUID and password using AI, as a job or a stream like `review`.
         """
         try:
-            snippet = Snippet.objects.get(uuid=uuid)
+            snippet = self.optimize_queryset(Snippet.objects.all()).get(uuid=uuid)
         except Snippet.DoesNotExist:
             return Response({'detail': 'Snippet not found.'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -97,8 +268,30 @@ class SnippetViewSet(viewsets.ModelViewSet):
         elif snippet.shared_password != password:
              return Response({'detail': 'Incorrect password.'}, status=status.HTTP_403_FORBIDDEN)
 
-        review_result = review_code(snippet.code)
-        return Response({'review': review_result})
+        return self.start_review(snippet)
+
+
+class ReviewJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Review jobs started by the current user. `?wait=SECONDS` on a job holds
+    the request until the job has finished, for up to REVIEW_MAX_WAIT seconds.
+    """
+    serializer_class = ReviewJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ReviewJob.objects.filter(requested_by=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        job = self.get_object()
+        wait = request.query_params.get('wait')
+        if wait:
+            try:
+                wait = float(wait)
+            except ValueError:
+                raise ValidationError({'wait': 'Expected a number of seconds.'})
+            job = wait_for_job(job, min(max(wait, 0.0), settings.REVIEW_MAX_WAIT))
+        return Response(self.get_serializer(job).data)
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -181,3 +374,33 @@ class RegisterViewSet(viewsets.GenericViewSet, viewsets.mixins.CreateModelMixin)
             'token': token.key,
             'user': UserSerializer(user, context={'request': request}).data
         }, status=status.HTTP_201_CREATED)
+
+
+@require_GET
+@etag(lambda request, name: f'{name}-{pygments.__version__}')
+def style_css(request, name):
+    """
+    Stylesheet for class-based highlight markup. URLs carry the Pygments
+    version, so responses can be cached for a year.
+    """
+    try:
+        css = stylesheet(name)
+    except ClassNotFound:
+        raise Http404('Unknown style.')
+    response = HttpResponse(css, content_type='text/css')
+    patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60, immutable=True)
+    return response
+
+
+@require_GET
+def metrics(request):
+    """
+    The counters and histograms of snippets.metrics in the Prometheus text
+    format, for staff users or scrapers sending `Authorization: Bearer
+    <METRICS_TOKEN>`.
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not (token and secrets.compare_digest(authorization.encode(), f'Bearer {token}'.encode())) and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -9,5 +9,11 @@ python manage.py migrate --noinput
 # Collect static files
 python manage.py collectstatic --noinput
 
-# Start Gunicorn
-gunicorn config.wsgi:application --bind=0.0.0.0:8000 --workers=2 --timeout=600
+# Render highlights in a process pool per Gunicorn worker
+export HIGHLIGHT_WORKERS=${HIGHLIGHT_WORKERS:-2}
+
+# Run AI reviews in background threads per Gunicorn worker
+export REVIEW_WORKERS=${REVIEW_WORKERS:-4}
+
+# Start Gunicorn; threads keep long-polling review clients from tying up a worker
+gunicorn config.wsgi:application --bind=0.0.0.0:8000 --workers=2 --threads=4 --timeout=600